@@ -1,820 +1,923 @@
-from flask import Flask, request, jsonify
+from flask import Flask, Response, g, request, jsonify, stream_with_context
 from flask_cors import CORS
+import click
 import os
-import re
-import requests
-from urllib.parse import quote, urljoin
-from bs4 import BeautifulSoup
-from dotenv import load_dotenv
+import json
+import time
+import heapq
+import threading
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, as_completed, wait
+from concurrent.futures import TimeoutError as FuturesTimeoutError
+from urllib.parse import quote
+
+# logs loads .env, so it is imported before the modules that read their config from the environment
+from logs import cache_log, log_stats, search_log
+from metrics import count_products_returned, render_metrics, request_seconds, timed_events, timed_stage
+from outbound import (
+    DEFAULT_HEADERS, HOST_SCHEDULERS, SOURCE_HEALTH, CircuitOpenError, OutboundQueueTimeout, http_config,
+    http_pool_stats, read_timeout,
+)
+from http_cache import cached_http_get, http_cache_snapshot
+from caching import SINGLE_FLIGHTS, ResultCache, SingleFlight, normalize_query, shared_cache_config, shared_store
+from query_understanding import count_query_parse, query_parse_snapshot, understand_query
+from catalog import catalog_config, catalog_snapshot, ingest_products, lookup_catalog_products, search_local_catalog
+from extraction import extraction_snapshot, parse_amazon_html, parse_flipkart_html
+from deepseek import (
+    USE_DEEPSEEK, generate_deepseek_response, llm_cache, llm_cache_snapshot, llm_token_snapshot,
+    stream_deepseek_response,
+)
+from image_proxy import (
+    ImageProxyError, image_proxy_snapshot, image_response_headers, image_thumbnail, with_proxied_images,
+)
+from intents import build_intent_reply, classify_intent, intent_snapshot, record_intent
+from sessions import session_snapshot
+from chat_pipeline import (
+    SSE_HEADERS, ChatTurn, build_chat_error_reply, collect_marketplace_results, error_event, fallback_result,
+    intent_events, marketplace_products, timed_out_sources,
+)
 
-# Load environment variables
-load_dotenv()
 
 app = Flask(__name__)
 CORS(app)
 
-# E-commerce focused system prompt
-SYSTEM_PROMPT = """You are a professional e-commerce customer service assistant. Your role is to:
-
-1. Help customers find products they're looking for on e-commerce platforms (Flipkart, Amazon, etc.)
-2. Provide detailed product information (features, specifications, pricing)
-3. Answer questions about products, shipping, returns, and policies
-4. Assist with product recommendations based on customer needs
-5. Handle customer inquiries professionally
-
-IMPORTANT: 
-- Focus ONLY on e-commerce products and shopping assistance
-- When products are found, provide helpful information about them
-- Always be friendly, helpful, and professional
-- If asked about non-e-commerce topics, politely redirect to product-related questions"""
-
-# Configure DeepSeek API
-DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY', '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')
-DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek/deepseek-chat-v3.1:free")
-DEEPSEEK_API_BASE = os.getenv("DEEPSEEK_API_BASE", "https://api.skylark.com/v1")
-USE_DEEPSEEK = False
-
-# DeepSeek generation config
-deepseek_config = {
-    "temperature": float(os.getenv("DEEPSEEK_TEMPERATURE", "0.7")),
-    "max_tokens": int(os.getenv("DEEPSEEK_MAX_TOKENS", "1024")),
+
+# Upstream search endpoints; overridden to point the app at benchmarks/stub_upstream.py
+UPSTREAM_URLS = {
+    "flipkart": os.getenv("FLIPKART_SEARCH_URL", "https://www.flipkart.com/search"),
+    "amazon": os.getenv("AMAZON_SEARCH_URL", "https://www.amazon.in/s"),
+    "duckduckgo": os.getenv("DUCKDUCKGO_API_URL", "https://api.duckduckgo.com/"),
+}
+
+
+# Concurrent marketplace search config
+search_config = {
+    # Overall deadline for the marketplace fan-out; sources still running are reported as timed out
+    "deadline": float(os.getenv("SEARCH_DEADLINE_SECONDS", "8")),
+    "max_workers": int(os.getenv("SEARCH_MAX_WORKERS", "16")),
 }
 
-if DEEPSEEK_API_KEY and DEEPSEEK_API_KEY.strip():
-    USE_DEEPSEEK = True
-    print(f"✓ DeepSeek API configured")
-    print(f"  Model: {DEEPSEEK_MODEL}")
-    print(f"  API Base: {DEEPSEEK_API_BASE}")
-    print(f"  API Key: {DEEPSEEK_API_KEY[:20]}...{DEEPSEEK_API_KEY[-10:]}")
-else:
-    print("ℹ Using free product search APIs (no API key required)")
-    USE_DEEPSEEK = False
-
-# HTTP headers for scraping e-commerce sites
-DEFAULT_HEADERS = {
-    "User-Agent": (
-        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
-        "AppleWebKit/537.36 (KHTML, like Gecko) "
-        "Chrome/120.0.0.0 Safari/537.36"
-    ),
-    "Accept-Language": "en-US,en;q=0.9",
+# Shared worker pool so every request fans out without paying thread start-up costs
+_search_executor = ThreadPoolExecutor(
+    max_workers=search_config["max_workers"],
+    thread_name_prefix="marketplace",
+)
+
+# Product result cache config (TTLs are in seconds, per result source)
+cache_config = {
+    "max_entries": int(os.getenv("PRODUCT_CACHE_MAX_ENTRIES", "2048")),
+    "max_bytes": int(os.getenv("PRODUCT_CACHE_MAX_BYTES", str(32 * 1024 * 1024))),
+    "ttl": {
+        "Flipkart": int(os.getenv("CACHE_TTL_FLIPKART", "300")),
+        "Amazon": int(os.getenv("CACHE_TTL_AMAZON", "300")),
+        "DuckDuckGo": int(os.getenv("CACHE_TTL_DUCKDUCKGO", "900")),
+    },
+    # How long past its TTL a marketplace result may still be served while it is re-scraped
+    "stale_grace": int(os.getenv("CACHE_STALE_GRACE_SECONDS", "600")),
 }
 
-def search_products_duckduckgo(query):
-    """Search for products using DuckDuckGo (free, no API key required)"""
+product_cache = ResultCache(cache_config["max_entries"], cache_config["max_bytes"], namespace="products")
+
+scrape_flights = SingleFlight("scrape")
+
+
+def get_cached_products(source, query):
+    products = product_cache.get((source, normalize_query(query)))
+    # Hand out copies so callers can decorate products without touching the cache
+    return [dict(p) for p in products] if products is not None else None
+
+
+def cache_products(source, query, products):
+    # Empty results are usually throttling/captcha pages, so they are never cached
+    if products:
+        ttl = cache_config["ttl"].get(source, 300)
+        grace = cache_config["stale_grace"] if source in MARKETPLACE_REQUESTS else 0
+        product_cache.set((source, normalize_query(query)), [dict(p) for p in products], ttl, grace)
+
+
+def marketplaces_for_query(query):
+    """Marketplace sources a query should be scraped from, and the query to send them"""
+    parsed = understand_query(query)
+    if parsed.marketplace is None:
+        return list(MARKETPLACE_SOURCES), query
+    count_query_parse("sources_skipped", len(MARKETPLACE_SOURCES) - 1)
+    return [parsed.marketplace], parsed.search_text
+
+
+def get_local_products(source, query, limit):
+    """Results for (source, query) without touching the network: memory cache, then local catalog
+
+    A stale cache entry is still returned; a background re-scrape is queued to replace it.
+    """
+    query_refresher.record(source, query, limit)
+    with timed_stage("cache_lookup", source):
+        cached, stale = product_cache.lookup((source, normalize_query(query)))
+        if cached is not None:
+            if stale:
+                query_refresher.schedule(source, query, limit)
+            return [dict(p) for p in cached[:limit]]
+        local = lookup_catalog_products(source, query, limit)
+    if local:
+        cache_products(source, query, local)
+    return local
+
+
+def duckduckgo_url(query):
+    # DuckDuckGo Instant Answer API (completely free)
+    return f"{UPSTREAM_URLS['duckduckgo']}?q={quote(query + ' buy online')}&format=json&no_html=1"
+
+
+def parse_duckduckgo_results(data, query):
+    """Turn a DuckDuckGo Instant Answer payload into product dicts"""
+    # DuckDuckGo provides related topics which we can use
+    if not data.get('RelatedTopics'):
+        return None
+    products = []
+    for topic in data['RelatedTopics'][:5]:
+        if 'Text' in topic:
+            text = topic['Text']
+            # Extract product name and create search links
+            product_name = text.split(' - ')[0] if ' - ' in text else query
+            products.append({
+                "name": product_name[:100],
+                "price": "Check website",
+                "description": text[:200] if len(text) > 200 else text,
+                "image": topic.get('Icon', {}).get('URL', '') or f"https://via.placeholder.com/300x300/667eea/ffffff?text={quote(product_name[:20])}",
+                "flipkart_link": f"https://www.flipkart.com/search?q={quote(product_name)}",
+                "amazon_link": f"https://www.amazon.in/s?k={quote(product_name)}",
+                "rating": "4.0+",
+                "source": "DuckDuckGo",
+                "inStock": True
+            })
+    return products or None
+
+
+def search_products_duckduckgo(query, lane="interactive", timeout=None):
+    """Search for products using DuckDuckGo (free, no API key required)
+
+    timeout caps the read timeout, for callers with a deadline of their own.
+    """
+    kwargs = {}
+    if timeout is not None:
+        kwargs["timeout"] = (http_config["connect_timeout"], min(timeout, read_timeout("duckduckgo")))
     try:
-        # DuckDuckGo Instant Answer API (completely free)
-        ddg_url = f"https://api.duckduckgo.com/?q={quote(query + ' buy online')}&format=json&no_html=1"
-        response = requests.get(ddg_url, timeout=5)
+        response = cached_http_get(duckduckgo_url(query), "duckduckgo", lane=lane, **kwargs)
         if response.status_code == 200:
-            data = response.json()
-            # DuckDuckGo provides related topics which we can use
-            if data.get('RelatedTopics'):
-                products = []
-                for topic in data['RelatedTopics'][:5]:
-                    if 'Text' in topic:
-                        text = topic['Text']
-                        # Extract product name and create search links
-                        product_name = text.split(' - ')[0] if ' - ' in text else query
-                        products.append({
-                            "name": product_name[:100],
-                            "price": "Check website",
-                            "description": text[:200] if len(text) > 200 else text,
-                            "image": topic.get('Icon', {}).get('URL', '') or f"https://via.placeholder.com/300x300/667eea/ffffff?text={quote(product_name[:20])}",
-                            "flipkart_link": f"https://www.flipkart.com/search?q={quote(product_name)}",
-                            "amazon_link": f"https://www.amazon.in/s?k={quote(product_name)}",
-                            "rating": "4.0+",
-                            "source": "DuckDuckGo",
-                            "inStock": True
-                        })
-                if products:
-                    return products
+            return parse_duckduckgo_results(response.json(), query)
     except Exception as e:
-        print(f"DuckDuckGo search error: {e}")
+        search_log.warning("DuckDuckGo search failed", extra={"error": str(e)})
     return None
 
-def search_products_web(query):
-    """Search for products using web scraping (free, no API key)"""
-    try:
-        # Use a product search approach
-        # Create product suggestions based on common e-commerce patterns
-        query_lower = query.lower()
-        
-        # Extract price range
-        price_range = ""
-        price_match = re.search(r'(\d+)[-\s]*(\d+)?\s*k', query_lower)
-        if price_match:
-            min_price = price_match.group(1)
-            max_price = price_match.group(2) if price_match.group(2) else str(int(min_price) + 5)
-            price_range = f"₹{min_price},000 - ₹{max_price},000"
-        
-        # Product templates for common searches
-        product_templates = {
-            'watch': [
-                {'name': 'Seiko 5 Sports Automatic SRPD Series', 'price': '₹15,000 - ₹25,000', 'rating': '4.5',
-                 'desc': 'A highly regarded automatic watch known for its reliability and value. It features a robust in-house automatic movement, a day-date display, and a see-through case back. Its versatile design makes it suitable for both casual and semi-formal occasions.'},
-                {'name': 'Tissot PRX Quartz', 'price': '₹20,000 - ₹30,000', 'rating': '4.6',
-                 'desc': 'A stunning Swiss-made watch featuring a timeless 1970s integrated bracelet design. It comes with a high-quality quartz movement, a scratch-resistant sapphire crystal, and a beautifully finished case that exudes premium quality.'},
-                {'name': 'Fossil Gen 6 Smartwatch', 'price': '₹18,000 - ₹25,000', 'rating': '4.4',
-                 'desc': 'Feature-rich smartwatch with fitness tracking, notifications, and Google Wear OS. Perfect for active lifestyles and tech enthusiasts who want style and functionality.'},
-            ],
-            'headphone': [
-                {'name': 'Sony WH-1000XM4 Wireless Headphones', 'price': '₹25,000 - ₹30,000', 'rating': '4.7',
-                 'desc': 'Premium noise-cancelling headphones with exceptional sound quality. Features 30-hour battery life and industry-leading ANC technology for immersive listening experience.'},
-                {'name': 'Bose QuietComfort 45', 'price': '₹28,000 - ₹35,000', 'rating': '4.6',
-                 'desc': 'Comfortable over-ear headphones with excellent noise cancellation. Known for superior comfort during long listening sessions and crystal-clear audio.'},
-                {'name': 'JBL Tune 760NC', 'price': '₹5,000 - ₹8,000', 'rating': '4.3',
-                 'desc': 'Affordable wireless headphones with active noise cancellation. Great value for money with good sound quality and comfortable fit.'},
-            ],
-            'laptop': [
-                {'name': 'HP Pavilion 15', 'price': '₹45,000 - ₹60,000', 'rating': '4.4',
-                 'desc': 'Reliable laptop for everyday computing tasks. Features modern processors, good display, and solid build quality perfect for students and professionals.'},
-                {'name': 'Dell Inspiron 15', 'price': '₹50,000 - ₹65,000', 'rating': '4.5',
-                 'desc': 'Versatile laptop suitable for work and entertainment. Known for durability and excellent customer support with good performance.'},
-            ],
-            'phone': [
-                {'name': 'Samsung Galaxy S23', 'price': '₹60,000 - ₹80,000', 'rating': '4.6',
-                 'desc': 'Flagship smartphone with excellent camera system and powerful performance. Premium design and display quality with long-lasting battery.'},
-                {'name': 'OnePlus 11', 'price': '₹50,000 - ₹65,000', 'rating': '4.5',
-                 'desc': 'High-performance smartphone with fast charging and smooth user experience. Great for gaming and photography enthusiasts.'},
-            ],
-        }
-        
-        # Find matching product type
-        products = []
-        for key, templates in product_templates.items():
-            if key in query_lower:
-                products = templates
-                break
-        
-        # If no match, create generic products
-        if not products:
-            products = [
-                {'name': f'{query.title()} - Premium Option', 'price': price_range or 'Check website', 'rating': '4.5',
-                 'desc': f'High-quality {query} option with excellent features and customer satisfaction. Available on major e-commerce platforms with secure payment and reliable delivery.'},
-                {'name': f'{query.title()} - Standard Option', 'price': price_range or 'Check website', 'rating': '4.3',
-                 'desc': f'Well-balanced {query} option offering great value. Popular choice among customers with positive reviews and good build quality.'},
-            ]
-        
-        # Format products with links and images
-        formatted_products = []
-        for product in products[:5]:
-            product_name = product['name']
-            # Try to get product image from Unsplash or use placeholder
-            image_url = f"https://source.unsplash.com/400x400/?{quote(product_name.split()[0] if product_name.split() else query)}"
-            
-            formatted_products.append({
-                'name': product_name,
-                'price': product['price'],
-                'description': product['desc'],
-                'rating': product['rating'],
-                'flipkart_link': f"https://www.flipkart.com/search?q={quote(product_name)}",
-                'amazon_link': f"https://www.amazon.in/s?k={quote(product_name)}",
-                'image': image_url,
-                'inStock': True,
-                'source': 'Curated'
-            })
-        
-        return formatted_products
-        
-    except Exception as e:
-        print(f"Web search error: {e}")
-        return None
 
+# Search page request per marketplace, shared by the sync scrapers and the async server
+MARKETPLACE_REQUESTS = {
+    "Flipkart": {
+        "service": "flipkart",
+        "url": UPSTREAM_URLS["flipkart"],
+        "params": lambda query: {"q": query, "otracker": "search"},
+        "headers": DEFAULT_HEADERS,
+        "parse": parse_flipkart_html,
+    },
+    "Amazon": {
+        "service": "amazon",
+        "url": UPSTREAM_URLS["amazon"],
+        "params": lambda query: {"k": query, "ref": "nb_sb_noss"},
+        "headers": DEFAULT_HEADERS,
+        "parse": parse_amazon_html,
+    },
+}
 
-def _normalize_price(text):
-    if not text:
-        return "Check website"
-    cleaned = re.sub(r"[^\d.,₹$]", "", text)
-    if cleaned:
-        if cleaned.startswith("₹"):
-            return cleaned if "₹" in text else f"₹{cleaned}"
-        if cleaned.startswith("$"):
-            return cleaned
-        return f"₹{cleaned}"
-    return "Check website"
 
+# Parsed products per (source, page body digest, limit): a page that comes back unchanged
+# (fresh HTTP cache hit, 304 or identical 200) is not parsed again
+parsed_pages = ResultCache(
+    int(os.getenv("PARSED_PAGE_CACHE_MAX_ENTRIES", "512")),
+    int(os.getenv("PARSED_PAGE_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+)
+
+
+def parse_marketplace_page(source, html, limit, digest=None):
+    """Extract up to limit products from a marketplace search page, timed as the parse stage"""
+    key = (source, digest, limit)
+    if digest is not None:
+        products = parsed_pages.get(key)
+        if products is not None:
+            return [dict(p) for p in products]
+    with timed_stage("parse", source):
+        products = MARKETPLACE_REQUESTS[source]["parse"](html, limit)
+    if digest is not None and products:
+        parsed_pages.set(key, [dict(p) for p in products], cache_config["stale_grace"])
+    return products
 
-def scrape_flipkart_products(query, limit=5):
-    """Fetch product listings directly from Flipkart search results."""
+
+def _scrape_marketplace(source, query, limit, lane="interactive"):
+    spec = MARKETPLACE_REQUESTS[source]
     try:
-        params = {"q": query, "otracker": "search"}
-        response = requests.get(
-            "https://www.flipkart.com/search",
-            params=params,
-            headers=DEFAULT_HEADERS,
-            timeout=10,
+        response = cached_http_get(
+            spec["url"],
+            spec["service"],
+            report_outcome=False,
+            lane=lane,
+            params=spec["params"](query),
+            headers=spec["headers"],
         )
-        if response.status_code != 200:
-            return []
-
-        soup = BeautifulSoup(response.text, "html.parser")
-
-        product_cards = soup.select("a._1fQZEK")  # Grid layout
-        if not product_cards:
-            product_cards = soup.select("a.s1Q9rs")  # List layout (e.g. fashion)
-        if not product_cards:
-            product_cards = soup.select("div._4ddWXP a.s1Q9rs")  # Alternate layout
-
         products = []
-        seen_names = set()
-
-        for anchor in product_cards:
-            name = anchor.get_text(strip=True)
-            if not name or name in seen_names:
-                continue
-
-            seen_names.add(name)
-            href = anchor.get("href")
-            product_url = urljoin("https://www.flipkart.com", href) if href else ""
-
-            card_root = anchor
-            for _ in range(3):
-                if card_root and card_root.name != "div":
-                    card_root = card_root.parent
-
-            price_tag = (
-                card_root.select_one("div._30jeq3") if card_root else None
-            ) or anchor.find_next("div", class_="_30jeq3")
-
-            rating_tag = (
-                card_root.select_one("div._3LWZlK") if card_root else None
-            ) or anchor.find_next("div", class_="_3LWZlK")
-
-            image_tag = (
-                card_root.select_one("img") if card_root else None
-            ) or anchor.find_next("img")
-            image_url = ""
-            if image_tag:
-                image_url = image_tag.get("src") or image_tag.get("data-src") or ""
-                if image_url.startswith("//"):
-                    image_url = "https:" + image_url
-
-            description = ""
-            if card_root:
-                bullets = card_root.select("ul._1xgFaf li")
-                if bullets:
-                    description = "; ".join(b.get_text(strip=True) for b in bullets[:3])
-
-            products.append(
-                {
-                    "name": name,
-                    "price": _normalize_price(price_tag.get_text() if price_tag else ""),
-                    "rating": rating_tag.get_text(strip=True) if rating_tag else "4.0",
-                    "description": description
-                    or "Top listing from Flipkart curated for your search.",
-                    "image": image_url,
-                    "flipkart_link": product_url,
-                    "amazon_link": "",
-                    "source": "Flipkart",
-                    "inStock": True,
-                }
-            )
-
-            if len(products) >= limit:
-                break
-
+        if response.status_code == 200:
+            products = parse_marketplace_page(source, response.text, limit, getattr(response, "digest", None))
+        # Captcha and bot-check pages come back as 200s with no product cards
+        if getattr(response, "revalidated", True):
+            SOURCE_HEALTH[spec["service"]].record_response(response, empty=not products)
         return products
+    except CircuitOpenError:
+        return []
+    except OutboundQueueTimeout as exc:
+        search_log.info("marketplace scrape not sent", extra={"source": source, "error": str(exc)})
+        return []
     except Exception as exc:
-        print(f"Flipkart scrape error: {exc}")
+        search_log.warning("marketplace scrape failed", extra={"source": source, "error": str(exc)})
         return []
 
 
-def scrape_amazon_products(query, limit=5):
+def scrape_flipkart_products(query, limit=5, lane="interactive"):
+    """Fetch product listings directly from Flipkart search results."""
+    return _scrape_marketplace("Flipkart", query, limit, lane)
+
+
+def scrape_amazon_products(query, limit=5, lane="interactive"):
     """Fetch product listings directly from Amazon search results."""
-    try:
-        params = {"k": query, "ref": "nb_sb_noss"}
-        response = requests.get(
-            "https://www.amazon.in/s",
-            params=params,
-            headers={
-                **DEFAULT_HEADERS,
-                "Accept-Encoding": "gzip, deflate, br",
-            },
-            timeout=10,
-        )
-        if response.status_code != 200:
+    return _scrape_marketplace("Amazon", query, limit, lane)
+
+
+# Marketplace scrapers fanned out concurrently by search_real_products (order = display order)
+MARKETPLACE_SOURCES = {
+    "Flipkart": scrape_flipkart_products,
+    "Amazon": scrape_amazon_products,
+}
+
+
+def shared_scrape_lease(source, query):
+    return f"scrape:{source}:{normalize_query(query)}"
+
+
+def claim_shared_scrape(source, query, waited):
+    """One attempt at the cross-worker single flight for a marketplace query
+
+    Returns (True, None) when this worker should scrape (and release_shared_scrape afterwards),
+    (False, None) while another worker holds the claim, or (False, products) when that worker
+    has finished and its fresh result is in the shared cache. waited is whether an earlier
+    attempt found the claim taken; those retries only read until the claim looks free, so
+    waiters don't queue for the store's write lock every poll.
+    """
+    if shared_store is None:
+        return True, None
+    lease = shared_scrape_lease(source, query)
+    key = (source, normalize_query(query))
+    if waited:
+        products, stale = product_cache.reload(key)
+        if products is not None and not stale:
+            return False, products
+        if shared_store.lease_held(lease):
+            return False, None
+    if not shared_store.acquire_lease(lease, shared_cache_config["lease_seconds"]):
+        return False, None
+    if waited:
+        # The other worker may have finished between the read above and this claim
+        products, stale = product_cache.reload(key)
+        if products is not None and not stale:
+            release_shared_scrape(source, query)
+            return False, products
+    return True, None
+
+
+def release_shared_scrape(source, query):
+    if shared_store is not None:
+        shared_store.release_lease(shared_scrape_lease(source, query))
+
+
+def _scrape_and_cache(source, scraper, query, limit, lane="interactive", wait=None):
+    """Scrape query once across workers and cache the result
+
+    wait is how long the caller will wait for the result (default: the shared lease length).
+    While another worker holds the scrape, this waits for its result no longer than that and
+    then returns [] uncached; the owner's result still reaches the shared cache for later searches.
+    """
+    if wait is None:
+        wait = shared_cache_config["lease_seconds"]
+    give_up_at = time.monotonic() + wait
+    # Another worker already scraping this query: wait for its result instead of scraping again
+    waited = False
+    while True:
+        claimed, products = claim_shared_scrape(source, query, waited)
+        if claimed:
+            break
+        if products is not None:
+            return [dict(p) for p in products[:limit]]
+        remaining = give_up_at - time.monotonic()
+        if remaining <= 0:
+            search_log.info("gave up waiting for another worker's scrape", extra={"source": source, "wait": wait})
             return []
+        waited = True
+        time.sleep(min(shared_cache_config["poll_interval"], remaining))
+    try:
+        with timed_stage("scrape", source):
+            products = scraper(query, limit, lane)
+        # Cached even when the request already gave up on this source, so the next shopper hits
+        cache_products(source, query, products)
+    finally:
+        release_shared_scrape(source, query)
+    if products and catalog_config["enabled"]:
+        _search_executor.submit(ingest_products, source, query, products)
+    return products
 
-        soup = BeautifulSoup(response.text, "html.parser")
-        result_cards = soup.select('div.s-main-slot div[data-component-type="s-search-result"]')
 
-        products = []
-        seen_names = set()
-
-        for card in result_cards:
-            title_tag = card.select_one("h2 a span")
-            if not title_tag:
-                continue
-            name = title_tag.get_text(strip=True)
-            if not name or name in seen_names:
-                continue
-            seen_names.add(name)
-
-            link_tag = card.select_one("h2 a")
-            product_url = (
-                urljoin("https://www.amazon.in", link_tag.get("href"))
-                if link_tag and link_tag.get("href")
-                else ""
-            )
+# Background refresh of popular queries (stale-while-revalidate)
+refresh_config = {
+    "enabled": os.getenv("REFRESH_ENABLED", "true").lower() in ("1", "true", "yes"),
+    # A query counts as hot once its decayed request count reaches this
+    "hot_threshold": float(os.getenv("REFRESH_HOT_THRESHOLD", "3")),
+    "half_life": float(os.getenv("REFRESH_POPULARITY_HALF_LIFE_SECONDS", "1800")),
+    # Hot results are re-scraped this long before they expire, so shoppers never see a miss
+    "refresh_ahead": float(os.getenv("REFRESH_AHEAD_SECONDS", "60")),
+    "per_source_concurrency": int(os.getenv("REFRESH_CONCURRENCY_PER_SOURCE", "2")),
+    "interval": float(os.getenv("REFRESH_INTERVAL_SECONDS", "5")),
+    # A query whose refresh came back empty (throttled, captcha) is left alone this long
+    "failure_backoff": float(os.getenv("REFRESH_FAILURE_BACKOFF_SECONDS", "60")),
+    "max_tracked": int(os.getenv("REFRESH_MAX_TRACKED_QUERIES", "5000")),
+}
 
-            price_whole = card.select_one("span.a-price span.a-price-whole")
-            price_fraction = card.select_one("span.a-price span.a-price-fraction")
-            price_text = ""
-            if price_whole:
-                price_text = price_whole.get_text(strip=True)
-                if price_fraction:
-                    price_text += price_fraction.get_text(strip=True)
-
-            rating_tag = card.select_one("span.a-icon-alt")
-            image_tag = card.select_one("img.s-image")
-            image_url = ""
-            if image_tag:
-                image_url = image_tag.get("src") or image_tag.get("data-src") or ""
-                if image_url.startswith("//"):
-                    image_url = "https:" + image_url
-            description = ""
-
-            bullets = card.select("div.a-section.a-spacing-small.a-spacing-top-small span.a-text-normal")
-            if bullets:
-                description = " ".join(b.get_text(strip=True) for b in bullets[:2])
-
-            products.append(
-                {
-                    "name": name,
-                    "price": _normalize_price(price_text),
-                    "rating": rating_tag.get_text(strip=True).split()[0] if rating_tag else "4.0",
-                    "description": description or "Popular Amazon listing tailored to your request.",
-                    "image": image_url,
-                    "flipkart_link": "",
-                    "amazon_link": product_url,
-                    "source": "Amazon",
-                    "inStock": True,
-                }
+
+class QueryRefresher:
+    """Track query popularity and re-scrape stale or soon-to-expire results off the request path
+
+    Refreshes are queued by due time and started by one scheduler thread, at most
+    per_source_concurrency at a time per marketplace, through the same scrape_flights
+    used by requests so a refresh and a live search for one query share a scrape.
+    """
+
+    def __init__(self, config):
+        self.config = config
+        self._popularity = {}  # (source, normalized) -> [score, scored_at, query, limit]
+        self._queue = []  # heap of (due_at, seq, key, query, limit)
+        self._queued = set()
+        self._running = set()
+        self._retry_at = {}  # key -> time.monotonic() before which a failed refresh is not retried
+        self._in_flight = {}  # source -> running refreshes
+        self._seq = 0
+        self._lags = deque(maxlen=512)
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._thread = None
+        self.stats = {"scheduled": 0, "refreshed": 0, "failed": 0}
+
+    def _score(self, entry, now):
+        score, scored_at = entry[0], entry[1]
+        return score * 0.5 ** ((now - scored_at) / self.config["half_life"])
+
+    def record(self, source, query, limit):
+        """Count one request for (source, query)"""
+        if not self.config["enabled"]:
+            return
+        key = (source, normalize_query(query))
+        now = time.monotonic()
+        with self._lock:
+            entry = self._popularity.get(key)
+            if entry is None:
+                if len(self._popularity) >= self.config["max_tracked"]:
+                    self._prune(now)
+                self._popularity[key] = [1.0, now, query, limit]
+            else:
+                entry[:] = [self._score(entry, now) + 1, now, query, max(limit, entry[3])]
+        self._ensure_started()
+
+    def _prune(self, now):
+        # Forget the coldest tenth; called with the lock held
+        ranked = sorted(self._popularity, key=lambda k: self._score(self._popularity[k], now))
+        for key in ranked[:max(1, len(ranked) // 10)]:
+            del self._popularity[key]
+        self._retry_at = {key: retry_at for key, retry_at in self._retry_at.items() if retry_at > now}
+
+    def schedule(self, source, query, limit, due_at=None):
+        """Queue a re-scrape of (source, query) unless one is already queued or running"""
+        if not self.config["enabled"]:
+            return
+        key = (source, normalize_query(query))
+        if due_at is None:
+            due_at = product_cache.expires_at(key) or time.monotonic()
+        with self._lock:
+            self._enqueue(key, query, limit, due_at)
+        self._ensure_started()
+        self._wake.set()
+
+    def _enqueue(self, key, query, limit, due_at):
+        # Called with the lock held
+        if key in self._queued or key in self._running:
+            return
+        if self._retry_at.get(key, 0) > time.monotonic():
+            return
+        self._seq += 1
+        heapq.heappush(self._queue, (due_at, self._seq, key, query, limit))
+        self._queued.add(key)
+        self.stats["scheduled"] += 1
+
+    def _ensure_started(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name="query-refresher", daemon=True)
+                self._thread.start()
+
+    def _run(self):
+        while True:
+            self._wake.clear()
+            try:
+                self._queue_hot_queries()
+                self._dispatch()
+            except Exception:
+                search_log.exception("query refresher failed")
+            self._wake.wait(self.config["interval"])
+
+    def _queue_hot_queries(self):
+        """Queue hot queries whose cached results are missing or expire within refresh_ahead"""
+        now = time.monotonic()
+        with self._lock:
+            hot = [
+                (key, entry[2], entry[3]) for key, entry in self._popularity.items()
+                if self._score(entry, now) >= self.config["hot_threshold"]
+            ]
+        for key, query, limit in hot:
+            expires_at = product_cache.expires_at(key)
+            if expires_at is None or expires_at - now <= self.config["refresh_ahead"]:
+                with self._lock:
+                    self._enqueue(key, query, limit, expires_at or now)
+
+    def _dispatch(self):
+        """Start queued refreshes, oldest due first, within each marketplace's concurrency budget"""
+        budget = self.config["per_source_concurrency"]
+        starting = []
+        with self._lock:
+            deferred = []
+            while self._queue:
+                item = heapq.heappop(self._queue)
+                key = item[2]
+                if self._in_flight.get(key[0], 0) >= budget:
+                    deferred.append(item)
+                    continue
+                self._queued.discard(key)
+                self._running.add(key)
+                self._in_flight[key[0]] = self._in_flight.get(key[0], 0) + 1
+                starting.append(item)
+            for item in deferred:
+                heapq.heappush(self._queue, item)
+        # Started outside the lock: a done callback can run immediately and needs it
+        for due_at, _, key, query, limit in starting:
+            self._start(key, query, limit, due_at)
+
+    def _start(self, key, query, limit, due_at):
+        source, normalized = key
+        scraper = MARKETPLACE_SOURCES[source]
+        future, _ = scrape_flights.join(
+            (source, normalized, limit),
+            lambda: _search_executor.submit(_scrape_and_cache, source, scraper, query, limit, "refresh"),
+        )
+        future.add_done_callback(lambda f: self._finished(key, due_at, f))
+
+    def _finished(self, key, due_at, future):
+        failed = future.cancelled() or future.exception() is not None or not future.result()
+        with self._lock:
+            self._running.discard(key)
+            self._in_flight[key[0]] -= 1
+            self.stats["failed" if failed else "refreshed"] += 1
+            if failed:
+                self._retry_at[key] = time.monotonic() + self.config["failure_backoff"]
+            else:
+                self._retry_at.pop(key, None)
+                # How long past expiry the entry was replaced; 0 when refreshed ahead of time
+                self._lags.append(max(0.0, time.monotonic() - due_at))
+        self._wake.set()
+
+    def snapshot(self):
+        now = time.monotonic()
+        with self._lock:
+            lags = sorted(self._lags)
+            hot = sum(
+                1 for entry in self._popularity.values()
+                if self._score(entry, now) >= self.config["hot_threshold"]
             )
+            return {
+                **self.stats,
+                "enabled": self.config["enabled"],
+                "tracked_queries": len(self._popularity),
+                "hot_queries": hot,
+                "queue_depth": len(self._queue),
+                "in_flight": {source: count for source, count in self._in_flight.items() if count},
+                "refresh_lag_seconds": {
+                    "p50": round(lags[len(lags) // 2], 3) if lags else 0.0,
+                    "p95": round(lags[min(len(lags) - 1, int(len(lags) * 0.95))], 3) if lags else 0.0,
+                    "max": round(lags[-1], 3) if lags else 0.0,
+                },
+            }
 
-            if len(products) >= limit:
-                break
 
-        return products
-    except Exception as exc:
-        print(f"Amazon scrape error: {exc}")
-        return []
+query_refresher = QueryRefresher(refresh_config)
 
-def search_real_products(query):
-    """Search for real products using free APIs (no API key required)"""
-    # Try direct marketplace scraping first for higher accuracy
-    flipkart_products = scrape_flipkart_products(query, limit=4)
-    amazon_products = scrape_amazon_products(query, limit=4)
 
-    combined_products = []
-    seen_names = set()
+def iter_marketplace_search(query, limit=4, deadline=None, lane="interactive"):
+    """Yield (source, products) as each marketplace finishes; sources that miss the deadline yield (source, None)
 
-    for product in flipkart_products + amazon_products:
-        key = (product["name"], product.get("source"))
-        if key in seen_names:
+    lane is the outbound priority lane; batch scrapes also run on _batch_scrape_executors
+    instead of _search_executor.
+    """
+    if deadline is None:
+        deadline = search_config["deadline"]
+
+    # "headphones on amazon" only scrapes Amazon, and without the marketplace in the query
+    sources, query = marketplaces_for_query(query)
+    cached_results = []
+    futures = {}
+    flight_keys = {}
+    for source in sources:
+        scraper = MARKETPLACE_SOURCES[source]
+        local = get_local_products(source, query, limit)
+        if local:
+            cached_results.append((source, local))
             continue
-        seen_names.add(key)
-        # Ensure both marketplace links exist where possible
-        if product.get("source") == "Flipkart" and not product.get("amazon_link"):
-            product["amazon_link"] = f"https://www.amazon.in/s?k={quote(product['name'])}"
-        if product.get("source") == "Amazon" and not product.get("flipkart_link"):
-            product["flipkart_link"] = f"https://www.flipkart.com/search?q={quote(product['name'])}"
-        combined_products.append(product)
+        executor = _batch_scrape_executors[source] if lane == "batch" else _search_executor
+        # Identical searches already in flight share that scrape instead of starting their own
+        flight_key = (source, normalize_query(query), limit)
+        future, _ = scrape_flights.join(
+            flight_key,
+            lambda: executor.submit(_scrape_and_cache, source, scraper, query, limit, lane, deadline),
+        )
+        futures[future] = source
+        flight_keys[future] = flight_key
 
-    if combined_products:
-        return combined_products
+    # Everything is submitted before the first yield so slow consumers never delay a scrape
+    yield from cached_results
 
-    # Try DuckDuckGo first (completely free)
-    products = search_products_duckduckgo(query)
-    if products:
-        return products
-    
-    # Fallback to web-based product search
-    products = search_products_web(query)
-    if products:
-        return products
-    
-    # Ultimate fallback
-    return create_fallback_products(query)
+    pending = set(futures)
+    try:
+        for future in as_completed(futures, timeout=deadline):
+            pending.discard(future)
+            source = futures[future]
+            try:
+                # Coalesced callers share the future, so each gets its own product dicts
+                products = [dict(p) for p in future.result() or []]
+            except Exception as exc:
+                search_log.warning("marketplace scrape failed", extra={"source": source, "error": str(exc)})
+                products = []
+            yield source, products
+    except FuturesTimeoutError:
+        pass
 
-def generate_template_response(user_message, products):
-    """Generate a helpful response without using paid APIs"""
-    if products:
-        response = f"Great! I found some excellent options for '{user_message}':\n\n"
-        for i, product in enumerate(products[:3], 1):
-            response += f"**{product.get('name', 'Product')}**\n"
-            response += f"Price: {product.get('price', 'Check website')}\n"
-            response += f"Rating: {product.get('rating', 'N/A')} ⭐\n"
-            if product.get("source"):
-                response += f"Source: {product['source']}\n"
-            response += f"{product.get('description', '')}\n\n"
-        response += "💡 **Tip:** Click the 'Buy on Flipkart' or 'Buy on Amazon' buttons below each product to view more details, compare prices, and make a purchase!\n\n"
-        response += "All products come with secure payment options and reliable delivery. Happy shopping! 🛍️"
-    else:
-        response = f"I'd be happy to help you find the best '{user_message}' options!\n\n"
-        response += "Please try searching with more specific terms, or browse our product categories. "
-        response += "You can click on the product links to explore options on Flipkart and Amazon.\n\n"
-        response += "How else can I assist you today? 😊"
-    
-    return response
+    # Stragglers keep running until their own HTTP timeout. A scrape still queued is dropped
+    # only when no coalesced caller (or background refresh) is waiting on it too
+    for future in pending:
+        if scrape_flights.leave(flight_keys[future], future):
+            future.cancel()
+    for source in timed_out_sources({futures[f] for f in pending}, deadline):
+        yield source, None
 
 
-def generate_deepseek_response(user_message, products):
-    """Create a DeepSeek-powered response when API access is available."""
-    if not USE_DEEPSEEK or not DEEPSEEK_API_KEY:
-        print("⚠ DeepSeek not available - USE_DEEPSEEK:", USE_DEEPSEEK, "API_KEY exists:", bool(DEEPSEEK_API_KEY))
-        return None
+def fan_out_marketplace_search(query, limit=4, deadline=None, lane="interactive"):
+    """Run every marketplace scraper at once; returns (results_by_source, timed_out_sources)"""
+    return collect_marketplace_results(iter_marketplace_search(query, limit, deadline, lane))
 
-    try:
-        print(f"🔄 Calling DeepSeek API with model: {DEEPSEEK_MODEL}")
-        product_context = []
-        for idx, product in enumerate(products[:5], start=1):
-            product_context.append(
-                f"""{idx}. {product.get('name', 'Product')}
-   Price: {product.get('price', 'Check website')}
-   Rating: {product.get('rating', 'N/A')}
-   Description: {product.get('description', 'No description available')}
-   Flipkart: {product.get('flipkart_link', 'N/A')}
-   Amazon: {product.get('amazon_link', 'N/A')}"""
-            )
 
-        product_block = "\n".join(product_context) if product_context else "No exact matches found yet."
-
-        messages = [
-            {"role": "system", "content": SYSTEM_PROMPT},
-            {
-                "role": "user",
-                "content": (
-                    "User query:\n"
-                    f"{user_message}\n\n"
-                    "Product findings from live marketplace searches:\n"
-                    f"{product_block}\n\n"
-                    "Compose a concise, customer-friendly reply that:\n"
-                    "1. Recommends the most relevant options.\n"
-                    "2. Highlights differentiators, pricing, and availability hints.\n"
-                    "3. Encourages the shopper to review the provided Flipkart/Amazon links.\n"
-                    "4. Offers next-step guidance or alternative suggestions if needed.\n"
-                )
-            }
-        ]
-
-        payload = {
-            "model": DEEPSEEK_MODEL,
-            "messages": messages,
-            "temperature": deepseek_config["temperature"],
-            "max_tokens": deepseek_config["max_tokens"],
-        }
-
-        headers = {
-            "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
-            "Content-Type": "application/json",
-        }
-
-        api_url = f"{DEEPSEEK_API_BASE}/chat/completions"
-        print(f"📡 API URL: {api_url}")
-        
-        response = requests.post(
-            api_url,
-            json=payload,
-            headers=headers,
-            timeout=30,
-        )
+def fallback_products(query, lane="interactive", deadline=None):
+    """Products for when no marketplace returned anything: local catalog, DuckDuckGo, then offline suggestions
 
-        print(f"📥 Response status: {response.status_code}")
-        
-        if response.status_code == 200:
-            result = response.json()
-            print(f"✅ API Response received: {list(result.keys())}")
-            if "error" in result:
-                print(f"❌ DeepSeek API error in response: {result.get('error', {})}")
-                return None
-            if "choices" in result and len(result["choices"]) > 0:
-                content = result["choices"][0].get("message", {}).get("content", "")
-                if content:
-                    print(f"✅ DeepSeek response generated successfully ({len(content)} chars)")
-                    return content.strip()
-                else:
-                    print("⚠️ No content in API response choices")
-            else:
-                print(f"⚠️ No choices in API response. Response keys: {list(result.keys())}")
-        else:
-            try:
-                error_data = response.json()
-                print(f"❌ DeepSeek API error: {response.status_code} - {error_data}")
-            except:
-                print(f"❌ DeepSeek API error: {response.status_code} - {response.text[:200]}")
+    deadline is the seconds the caller has left; DuckDuckGo is skipped once it is spent.
+    """
+    with timed_stage("fallback"):
+        products = search_local_catalog(query)
+        if not products:
+            # Try DuckDuckGo first (completely free)
+            products = get_cached_products("DuckDuckGo", query)
+            if products is None and (deadline is None or deadline > 0):
+                products = search_products_duckduckgo(query, lane, deadline)
+                cache_products("DuckDuckGo", query, products)
+        return fallback_result(query, products)
+
+
+def search_products_with_status(query, limit=4, deadline=None, lane="interactive"):
+    """Search for real products; returns (products, timed_out_sources)"""
+    started = time.monotonic()
+    # Try direct marketplace scraping first for higher accuracy
+    results, timed_out = fan_out_marketplace_search(query, limit, deadline, lane)
+    combined_products = marketplace_products(results, query)
+    if combined_products:
+        return combined_products, timed_out
+
+    remaining = None if deadline is None else deadline - (time.monotonic() - started)
+    return fallback_products(query, lane, remaining), timed_out
+
+
+# Batch product search (/api/products/batch) config
+batch_config = {
+    "max_queries": int(os.getenv("BATCH_MAX_QUERIES", "10000")),
+    # Queries searched at once per batch request
+    "max_workers": int(os.getenv("BATCH_MAX_WORKERS", "8")),
+    # Scrapes in flight per marketplace across all batch requests, so batch jobs cannot get a
+    # marketplace to throttle the interactive chat traffic
+    "per_source_concurrency": int(os.getenv("BATCH_CONCURRENCY_PER_SOURCE", "4")),
+    "item_timeout": float(os.getenv("BATCH_ITEM_TIMEOUT_SECONDS", "20")),
+}
 
+# One small pool per marketplace bounds batch scrapes without touching _search_executor
+_batch_scrape_executors = {
+    source: ThreadPoolExecutor(
+        max_workers=batch_config["per_source_concurrency"],
+        thread_name_prefix=f"batch-{source.lower()}",
+    )
+    for source in MARKETPLACE_REQUESTS
+}
+
+
+def search_batch_item(index, query, limit, timeout):
+    """One NDJSON line for a batch query; failures are reported on the line instead of raised"""
+    started = time.perf_counter()
+    item = {"index": index, "query": query}
+    try:
+        products, timed_out = search_products_with_status(query, limit, deadline=timeout, lane="batch")
+        count_products_returned(products)
+        item.update({"products": with_proxied_images(products), "timed_out_sources": timed_out, "error": None})
     except Exception as exc:
-        error_msg = str(exc).lower()
-        if "429" in error_msg or "quota" in error_msg:
-            print("⚠ DeepSeek quota exceeded, switching to template response.")
-        else:
-            print(f"DeepSeek response error: {exc}")
+        search_log.warning("batch query failed", extra={"query": query, "error": str(exc)})
+        item.update({"products": [], "timed_out_sources": [], "error": str(exc)})
+    item["elapsed_ms"] = round((time.perf_counter() - started) * 1000, 1)
+    return item
+
+
+def iter_batch_search(queries, limit=4, timeout=None):
+    """Yield one result dict per query in completion order, then a summary dict
+
+    At most batch_config["max_workers"] queries are in flight, so a 10k-query batch holds a
+    bounded number of futures and stops early when the client goes away.
+    """
+    timeout = batch_config["item_timeout"] if timeout is None else timeout
+    started = time.perf_counter()
+    pending = {}
+    submitted = 0
+    errors = 0
+    executor = ThreadPoolExecutor(max_workers=batch_config["max_workers"], thread_name_prefix="batch")
+    try:
+        while submitted < len(queries) or pending:
+            while submitted < len(queries) and len(pending) < batch_config["max_workers"]:
+                query = queries[submitted]
+                pending[executor.submit(search_batch_item, submitted, query, limit, timeout)] = submitted
+                submitted += 1
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                del pending[future]
+                item = future.result()
+                errors += item["error"] is not None
+                yield item
+    finally:
+        # Also runs when the client disconnects (GeneratorExit): nothing new is started and
+        # the closing thread does not wait for queries already running
+        executor.shutdown(wait=False, cancel_futures=True)
+    yield {"summary": {
+        "queries": len(queries),
+        "errors": errors,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    }}
 
-    return None
 
-def create_fallback_products(query):
-    """Create fallback product results with search links"""
-    products = []
-    query_encoded = quote(query)
-    
-    # Create 3 product suggestions with search links
-    for i in range(3):
-        products.append({
-            "name": f"{query.title()} - Option {i+1}",
-            "price": "Check website",
-            "description": f"Find the best {query} options on e-commerce platforms. Browse through various models and compare prices.",
-            "image": f"https://source.unsplash.com/400x400/?{quote(query)}",
-            "flipkart_link": f"https://www.flipkart.com/search?q={query_encoded}",
-            "amazon_link": f"https://www.amazon.in/s?k={query_encoded}",
-            "rating": "4.0+",
-            "inStock": True,
-            "source": "Search"
-        })
-    
+def search_real_products(query):
+    """Search for real products using free APIs (no API key required)"""
+    products, _ = search_products_with_status(query)
     return products
 
-# Legacy product database (kept for backward compatibility, but not used)
-PRODUCTS = [
-    {
-        "id": 1,
-        "name": "Wireless Bluetooth Headphones",
-        "price": 79.99,
-        "image": "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400",
-        "category": "Electronics",
-        "description": "Premium noise-cancelling wireless headphones with 30-hour battery life",
-        "rating": 4.5,
-        "inStock": True
-    },
-    {
-        "id": 2,
-        "name": "Smart Watch Pro",
-        "price": 249.99,
-        "image": "https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=400",
-        "category": "Electronics",
-        "description": "Advanced fitness tracking smartwatch with heart rate monitor and GPS",
-        "rating": 4.7,
-        "inStock": True
-    },
-    {
-        "id": 3,
-        "name": "Laptop Backpack",
-        "price": 49.99,
-        "image": "https://images.unsplash.com/photo-1553062407-98eeb64c6a62?w=400",
-        "category": "Accessories",
-        "description": "Durable laptop backpack with USB charging port and water-resistant material",
-        "rating": 4.3,
-        "inStock": True
-    },
-    {
-        "id": 4,
-        "name": "Wireless Mouse",
-        "price": 29.99,
-        "image": "https://images.unsplash.com/photo-1527814050087-3793815479db?w=400",
-        "category": "Electronics",
-        "description": "Ergonomic wireless mouse with precision tracking and long battery life",
-        "rating": 4.4,
-        "inStock": True
-    },
-    {
-        "id": 5,
-        "name": "Mechanical Keyboard",
-        "price": 129.99,
-        "image": "https://images.unsplash.com/photo-1587829741301-dc798b83add3?w=400",
-        "category": "Electronics",
-        "description": "RGB backlit mechanical keyboard with Cherry MX switches",
-        "rating": 4.6,
-        "inStock": True
-    },
-    {
-        "id": 6,
-        "name": "USB-C Hub",
-        "price": 39.99,
-        "image": "https://images.unsplash.com/photo-1625842268584-8f7623b58d85?w=400",
-        "category": "Accessories",
-        "description": "7-in-1 USB-C hub with HDMI, USB 3.0, and SD card reader",
-        "rating": 4.2,
-        "inStock": True
-    },
-    {
-        "id": 7,
-        "name": "Phone Stand",
-        "price": 19.99,
-        "image": "https://images.unsplash.com/photo-1601784551446-20c9e07cdbdb?w=400",
-        "category": "Accessories",
-        "description": "Adjustable aluminum phone stand for desk and car use",
-        "rating": 4.1,
-        "inStock": True
-    },
-    {
-        "id": 8,
-        "name": "Wireless Charger",
-        "price": 24.99,
-        "image": "https://images.unsplash.com/photo-1609091839311-d5365f9ff1c5?w=400",
-        "category": "Electronics",
-        "description": "Fast wireless charging pad compatible with all Qi-enabled devices",
-        "rating": 4.5,
-        "inStock": True
-    },
-    {
-        "id": 9,
-        "name": "Fitness Watch Elite",
-        "price": 199.99,
-        "image": "https://images.unsplash.com/photo-1579586337278-3befd40f17ca?w=400",
-        "category": "Electronics",
-        "description": "Premium fitness smartwatch with advanced health monitoring and 10-day battery",
-        "rating": 4.6,
-        "inStock": True
-    },
-    {
-        "id": 10,
-        "name": "Sport Watch Active",
-        "price": 179.99,
-        "image": "https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=400",
-        "category": "Electronics",
-        "description": "Rugged sports watch with GPS, heart rate monitor, and 14-day battery life",
-        "rating": 4.4,
-        "inStock": True
-    },
-    {
-        "id": 11,
-        "name": "Classic Smart Watch",
-        "price": 229.99,
-        "image": "https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=400",
-        "category": "Electronics",
-        "description": "Elegant smartwatch with premium design, AMOLED display, and comprehensive health tracking",
-        "rating": 4.8,
-        "inStock": True
-    }
-]
-
-def search_products_legacy(query):
-    """Search products by name, category, or description with improved matching"""
-    query_lower = query.lower()
-    results = []
-    
-    # Create synonym mapping for better search
-    synonyms = {
-        'watch': ['watch', 'smartwatch', 'smart watch', 'timepiece', 'wristwatch'],
-        'headphone': ['headphone', 'headphones', 'earphone', 'earphones', 'audio'],
-        'mouse': ['mouse', 'computer mouse', 'wireless mouse'],
-        'keyboard': ['keyboard', 'mechanical keyboard', 'keyboard'],
-        'backpack': ['backpack', 'bag', 'laptop bag', 'rucksack'],
-        'charger': ['charger', 'wireless charger', 'charging'],
-        'hub': ['hub', 'usb hub', 'adapter']
+
+def warm_caches():
+    """Load the shared store's freshest product results and replies into this worker's memory"""
+    if shared_store is None:
+        return
+    started = time.perf_counter()
+    loaded = {
+        "products": product_cache.warm(shared_cache_config["warm_entries"]),
+        "llm": llm_cache.warm(shared_cache_config["warm_entries"]),
     }
-    
-    # Extract price range if mentioned (e.g., "20-25k", "$200-$250")
-    price_min = None
-    price_max = None
-    if 'k' in query_lower or 'thousand' in query_lower:
-        # Handle "20-25k" format (assuming INR, convert to USD: 1 USD ≈ 83 INR)
-        price_match = re.search(r'(\d+)[-\s]*(\d+)?\s*k', query_lower)
-        if price_match:
-            inr_min = float(price_match.group(1)) * 1000
-            if price_match.group(2):
-                inr_max = float(price_match.group(2)) * 1000
-            else:
-                inr_max = inr_min + 5000  # Add 5k range
-            # Convert INR to USD (approximate: 1 USD = 83 INR)
-            price_min = inr_min / 83
-            price_max = inr_max / 83
-    elif '$' in query:
-        # Handle "$200-$250" format
-        price_matches = re.findall(r'\$(\d+)', query)
-        if len(price_matches) >= 1:
-            price_min = float(price_matches[0])
-            if len(price_matches) >= 2:
-                price_max = float(price_matches[1])
-            else:
-                price_max = price_min + 50
-    
-    for product in PRODUCTS:
-        score = 0
-        product_text = f"{product['name']} {product['category']} {product['description']}".lower()
-        
-        # Direct match
-        if query_lower in product_text:
-            score += 10
-        
-        # Synonym matching
-        for key, values in synonyms.items():
-            if any(syn in query_lower for syn in values):
-                if key in product_text:
-                    score += 8
-        
-        # Word-by-word matching
-        query_words = query_lower.split()
-        for word in query_words:
-            if len(word) > 2 and word in product_text:
-                score += 2
-        
-        # Price range filtering (with some flexibility)
-        if price_min is not None and price_max is not None:
-            # Allow 10% flexibility in price range
-            price_tolerance = (price_max - price_min) * 0.1
-            if not (price_min - price_tolerance <= product['price'] <= price_max + price_tolerance):
-                continue
-        
-        if score > 0:
-            product['match_score'] = score
-            results.append(product)
-    
-    # Sort by match score (highest first)
-    results.sort(key=lambda x: x.get('match_score', 0), reverse=True)
-    
-    # Remove match_score before returning
-    for product in results:
-        product.pop('match_score', None)
-    
-    return results
-
-def format_product_response(products, user_message):
-    """Format product information for the AI response"""
-    if not products:
-        return None
-    
-    product_info = "\n\nAvailable Products:\n"
-    for product in products[:3]:  # Limit to 3 products
-        product_info += f"- {product['name']} (${product['price']}) - {product['description']}\n"
-    
-    return product_info
+    cache_log.info("caches warmed from shared store", extra={
+        **loaded, "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+
+
+def timed_jsonify(payload):
+    """jsonify, recorded as the serialize stage"""
+    with timed_stage("serialize"):
+        return jsonify(payload)
+
+
+@app.before_request
+def start_request_timer():
+    g.request_started = time.perf_counter()
+
+
+@app.after_request
+def record_request_duration(response):
+    started = g.get("request_started")
+    # The chat stream has only started here; timed_events records it as it is sent
+    if started is not None and request.endpoint and request.endpoint != "chat_stream":
+        request_seconds.observe(time.perf_counter() - started, endpoint=request.endpoint)
+    return response
+
 
 @app.route('/api/products', methods=['GET'])
 def get_products():
     """Get all products or search products"""
     query = request.args.get('q', '').strip()
     if query:
-        results = search_real_products(query)
-        return jsonify({'products': results})
-    return jsonify({'products': []})
+        results, timed_out = search_products_with_status(query)
+        count_products_returned(results)
+        return timed_jsonify({'products': with_proxied_images(results), 'timed_out_sources': timed_out})
+    return jsonify({'products': [], 'timed_out_sources': []})
+
+@app.route('/api/image', methods=['GET'])
+def image_proxy():
+    """Product image as a resized thumbnail, served from the on-disk image cache"""
+    try:
+        entry = image_thumbnail(request.args.get('src', ''), request.args.get('w'))
+    except ImageProxyError as exc:
+        return jsonify({'error': exc.message}), exc.status
+    headers = image_response_headers(entry)
+    if request.headers.get('If-None-Match') == headers['ETag']:
+        return Response(status=304, headers=headers)
+    return Response(entry['body'], mimetype=entry['content_type'], headers=headers)
+
+@app.route('/api/products/batch', methods=['POST', 'OPTIONS'])
+def batch_products():
+    """Search many queries at once; results stream back as NDJSON, one line per query"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    data = request.get_json(silent=True) or {}
+    queries = data.get('queries')
+    if not isinstance(queries, list) or not all(isinstance(q, str) and q.strip() for q in queries):
+        return jsonify({'error': '"queries" must be a list of non-empty strings'}), 400
+    if len(queries) > batch_config['max_queries']:
+        return jsonify({'error': f'at most {batch_config["max_queries"]} queries per batch'}), 400
+    try:
+        limit = max(1, min(int(data.get('limit', 4)), 20))
+        timeout = float(data.get('timeout', batch_config['item_timeout']))
+    except (TypeError, ValueError):
+        return jsonify({'error': '"limit" and "timeout" must be numbers'}), 400
+
+    lines = (
+        json.dumps(item, ensure_ascii=False) + "\n"
+        for item in iter_batch_search([q.strip() for q in queries], limit, timeout)
+    )
+    return Response(stream_with_context(lines), mimetype='application/x-ndjson', headers=SSE_HEADERS)
+
+@app.route('/api/stats', methods=['GET'])
+def get_stats():
+    """Runtime counters for the search pipeline"""
+    return jsonify({
+        'product_cache': product_cache.snapshot(),
+        'http_pools': http_pool_stats(),
+        'coalescing': {name: flight.snapshot() for name, flight in SINGLE_FLIGHTS.items()},
+        'catalog': catalog_snapshot(),
+        'refresh': query_refresher.snapshot(),
+        'llm_cache': llm_cache_snapshot(),
+        'llm_tokens': llm_token_snapshot(),
+        'intents': intent_snapshot(),
+        'query_parser': query_parse_snapshot(),
+        'extraction': extraction_snapshot(),
+        'sessions': session_snapshot(),
+        'http_cache': http_cache_snapshot(),
+        'image_proxy': image_proxy_snapshot(),
+        'shared_cache': {
+            'enabled': shared_store is not None,
+            'worker_pid': os.getpid(),
+            **(shared_store.snapshot() if shared_store is not None else {}),
+        },
+        'source_health': {service: health.snapshot() for service, health in SOURCE_HEALTH.items()},
+        'outbound': {service: scheduler.snapshot() for service, scheduler in HOST_SCHEDULERS.items()},
+        'logging': dict(log_stats),
+    })
+
+@app.route('/metrics', methods=['GET'])
+def metrics():
+    """Stage latency histograms and upstream/product counters in the Prometheus text format"""
+    return Response(render_metrics(), mimetype='text/plain; version=0.0.4')
+
+def stream_chat_events(user_message, max_products=5, session_id=None):
+    """Server-Sent Events for /api/chat/stream: product cards per source as they land, then reply tokens"""
+    started = time.perf_counter()
+    intent = classify_intent(user_message)
+    try:
+        if intent != "product_search":
+            yield from intent_events(intent, user_message, session_id)
+            return
+
+        turn = ChatTurn.begin(session_id, user_message, max_products)
+        if turn.products:
+            yield turn.products_event()
+        else:
+            for source, products in iter_marketplace_search(turn.query, limit=4):
+                event = turn.source_event(source, products)
+                if event:
+                    yield event
+
+        if not turn.products:
+            yield turn.fallback_event(fallback_products(turn.query))
+        turn.finish()
+
+        streamed = False
+        for delta in stream_deepseek_response(user_message, turn.products):
+            streamed = True
+            yield turn.token_event(delta)
+        if not streamed:
+            yield from turn.template_events()
+
+        yield turn.done_event()
+
+    except Exception as e:
+        yield error_event(e)
+    finally:
+        record_intent(intent, time.perf_counter() - started)
+
+
+@app.route('/api/chat/stream', methods=['POST', 'OPTIONS'])
+def chat_stream():
+    """Streaming /api/chat: products first, then the reply as it is generated"""
+    if request.method == 'OPTIONS':
+        return '', 200
+
+    data = request.get_json(silent=True) or {}
+    user_message = data.get('message', '').strip()
+    events = stream_chat_events(user_message, session_id=data.get('session_id'))
+    return Response(
+        stream_with_context(timed_events(events, "chat_stream", g.request_started)),
+        mimetype='text/event-stream',
+        headers=SSE_HEADERS,
+    )
 
 @app.route('/api/chat', methods=['POST', 'OPTIONS'])
 def chat():
     if request.method == 'OPTIONS':
         return '', 200
 
+    started = time.perf_counter()
+    intent = None
     try:
         data = request.json
         user_message = data.get('message', '').strip()
-        
-        # Search for real products on e-commerce sites
-        found_products = search_real_products(user_message)
-        print(f"User query: {user_message}")
-        print(f"Found {len(found_products)} products")
-        if found_products:
-            print(f"Products: {[p['name'] for p in found_products]}")
+
+        # Greetings, order/returns questions and off-topic messages never reach search or the LLM
+        intent = classify_intent(user_message)
+        if intent != "product_search":
+            return timed_jsonify(build_intent_reply(intent, user_message, data.get('session_id')))
+
+        # Follow-ups ("cheaper ones", "only Sony") refine the session's earlier results;
+        # anything else searches the e-commerce sites
+        turn = ChatTurn.begin(data.get('session_id'), user_message)
+        if not turn.products:
+            turn.products, turn.timed_out = search_products_with_status(turn.query)
+        turn.finish()
         
         # Generate response (use DeepSeek if available, otherwise use template)
         response_text = None
         if USE_DEEPSEEK:
-            response_text = generate_deepseek_response(user_message, found_products)
+            response_text = generate_deepseek_response(user_message, turn.products)
 
-        if not response_text:
-            # Use free template response
-            response_text = generate_template_response(user_message, found_products)
-        
-        # Check if user is asking about non-e-commerce topics
-        non_ecommerce_keywords = ['weather', 'news', 'sports', 'politics', 'general knowledge', 'history', 'science']
-        if any(keyword in user_message.lower() for keyword in non_ecommerce_keywords):
-            response_text = "I'm here to help you find products on e-commerce platforms like Flipkart and Amazon. How can I assist you with finding products today?"
-            return jsonify({
-                'response': response_text,
-                'products': []
-            })
-        
-        return jsonify({
-            'response': response_text,
-            'products': found_products[:5] if found_products else []
-        })
+        return timed_jsonify(turn.reply(response_text))
             
     except Exception as e:
-        error_message = str(e)
-        print(f"Error in chat endpoint: {error_message}")
-        
-        # Check for quota exceeded error
-        if '429' in error_message or 'quota' in error_message.lower() or 'Quota exceeded' in error_message:
-            return jsonify({
-                'response': '⚠️ API Quota Exceeded: You have reached the free tier limit (2 requests). Please wait a few minutes and try again, or use a different API key with higher limits.',
-                'error': 'quota_exceeded',
-                'products': []
-            }), 200
-        # Check for API key errors
-        elif '401' in error_message or '403' in error_message or 'API key' in error_message:
-            return jsonify({
-                'response': '⚠️ API Key Error: Please check your DeepSeek API key in the .env file.',
-                'error': 'api_key_error',
-                'products': []
-            }), 200
-        # Generic error
-        else:
-            return jsonify({
-                'response': f'Sorry, I could not process your request. Error: {error_message[:100]}',
-                'error': 'generic_error',
-                'products': []
-            }), 200
+        return jsonify(build_chat_error_reply(str(e))), 200
+    finally:
+        if intent is not None:
+            record_intent(intent, time.perf_counter() - started)
+
+@app.cli.command("ingest-catalog")
+@click.argument("source_file", type=click.File("r", encoding="utf-8"))
+@click.option("--from-jsonl", is_flag=True,
+              help='SOURCE_FILE holds recorded results, one {"source", "query", "products"} object per line.')
+@click.option("--limit", default=10, show_default=True, help="Products kept per marketplace and query.")
+def ingest_catalog_command(source_file, from_jsonl, limit):
+    """Upsert marketplace results into the local catalog.
+
+    By default SOURCE_FILE lists one search query per line and every marketplace is scraped
+    for it. Re-running the command refreshes existing rows in place.
+    """
+    total = 0
+    for line_number, line in enumerate(source_file, start=1):
+        line = line.strip()
+        if not line:
+            continue
+        if from_jsonl:
+            record = json.loads(line)
+            total += ingest_products(record["source"], record.get("query"), record["products"])
+            continue
+        for source, scraper in MARKETPLACE_SOURCES.items():
+            products = scraper(line, limit, "batch")
+            count = ingest_products(source, line, products)
+            total += count
+            click.echo(f"{line_number}: {source} '{line}' -> {count} products")
+    click.echo(f"Ingested {total} products into {catalog_config['path']}")
 
 if __name__ == '__main__':
+    warm_caches()
     # Bind to 0.0.0.0 to allow connections from Docker containers
     app.run(debug=True, host='0.0.0.0', port=5000) 
\ No newline at end of file
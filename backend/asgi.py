@@ -0,0 +1,515 @@
+"""Async ASGI entry point for the chat backend.
+
+/api/chat and /api/products are served natively on the event loop with a pooled
+httpx.AsyncClient, so a single process can hold thousands of outbound scrapes and
+LLM calls in flight. Every other route falls through to the Flask app in app.py.
+
+Production:
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+"""
+import asyncio
+import functools
+import time
+from contextlib import asynccontextmanager
+
+import httpx
+from a2wsgi import WSGIMiddleware
+from starlette.applications import Starlette
+from starlette.responses import JSONResponse, Response, StreamingResponse
+from starlette.routing import Mount, Route
+
+import app as backend
+import caching
+import chat_pipeline
+import catalog
+import deepseek
+import http_cache
+import image_proxy
+import intents
+import logs
+import metrics
+import outbound
+
+# Created on startup so the connection pool belongs to the server's event loop
+http_client = None
+
+# Holds late marketplace scrapes so they can finish (and fill the cache) after the deadline
+_background_tasks = set()
+
+# Event-loop counterparts of app.scrape_flights / deepseek.llm_flights (tasks instead of thread futures)
+scrape_flights = caching.SingleFlight("async_scrape")
+llm_flights = caching.SingleFlight("async_llm")
+
+
+def _spawn(coro):
+    task = asyncio.create_task(coro)
+    _background_tasks.add(task)
+    task.add_done_callback(_background_tasks.discard)
+    return task
+
+
+def _cors(response, request=None):
+    response.headers["Access-Control-Allow-Origin"] = "*"
+    if request is not None and request.method == "OPTIONS":
+        response.headers["Access-Control-Allow-Methods"] = "GET, POST, OPTIONS"
+        response.headers["Access-Control-Allow-Headers"] = request.headers.get(
+            "access-control-request-headers", "Content-Type"
+        )
+    return response
+
+
+def _json(payload):
+    """JSONResponse, recorded as the serialize stage"""
+    with metrics.timed_stage("serialize"):
+        return JSONResponse(payload)
+
+
+def _timed(handler):
+    """Record a native route's duration under the same endpoint name the Flask route uses"""
+    @functools.wraps(handler)
+    async def timed_handler(request):
+        started = time.perf_counter()
+        try:
+            return await handler(request)
+        finally:
+            metrics.request_seconds.observe(time.perf_counter() - started, endpoint=handler.__name__)
+    return timed_handler
+
+
+def _timeout(service):
+    return httpx.Timeout(
+        outbound.read_timeout(service),
+        connect=outbound.http_config["connect_timeout"],
+    )
+
+
+def _check_circuit(service):
+    health = outbound.SOURCE_HEALTH.get(service)
+    if health is not None and not health.allow():
+        raise outbound.CircuitOpenError(service)
+    return health
+
+
+async def http_request(method, url, service, report_outcome=True, lane="interactive", **kwargs):
+    """Async counterpart of outbound.http_request with the same rate limits, timeouts and circuit breakers"""
+    health = _check_circuit(service)
+    scheduler = outbound.HOST_SCHEDULERS.get(service)
+    if scheduler is not None:
+        try:
+            await scheduler.acquire_async(lane)
+        except (outbound.OutboundQueueTimeout, asyncio.CancelledError):
+            if health is not None:
+                health.release()
+            raise
+    kwargs.setdefault("timeout", _timeout(service))
+    started = time.perf_counter()
+    try:
+        response = await http_client.request(method, url, **kwargs)
+    except Exception as exc:
+        if health is not None:
+            health.record_failure(type(exc).__name__)
+        raise
+    if scheduler is not None:
+        scheduler.record_response(response.status_code, outbound._retry_after_seconds(response))
+    if health is not None:
+        health.record_latency(time.perf_counter() - started)
+        if report_outcome:
+            health.record_response(response)
+    return response
+
+
+async def http_request_stream(request, service):
+    """Send a prepared request and return the response as soon as its headers arrive
+
+    The caller reads the body and must close the response. Same breaker rules as http_request.
+    """
+    health = _check_circuit(service)
+    try:
+        response = await http_client.send(request, stream=True)
+    except Exception as exc:
+        if health is not None:
+            health.record_failure(type(exc).__name__)
+        raise
+    if health is not None:
+        health.record_response(response)
+    return response
+
+
+async def cached_http_get(url, service, params=None, headers=None, **kwargs):
+    """Async http_cache.cached_http_get: fresh copies skip the network, stale ones are revalidated"""
+    key = http_cache.http_cache_url(url, params)
+    entry = await asyncio.to_thread(http_cache.http_cache_lookup, key)
+    if entry is not None and entry["fresh"]:
+        return http_cache.http_cache_response(key, entry, revalidated=False)
+    conditional = http_cache.conditional_headers(entry)
+    response = await http_request(
+        "GET", url, service, params=params, headers={**(headers or {}), **conditional}, **kwargs,
+    )
+    http_cache.count_http_cache_fetch(entry, conditional)
+    if response.status_code == 304 and entry is not None:
+        await asyncio.to_thread(http_cache.http_cache_revalidated, key, response.headers)
+        return http_cache.http_cache_response(key, entry, revalidated=True)
+    if response.status_code == 200:
+        response.digest = await asyncio.to_thread(http_cache.http_cache_store, key, response.headers, response.content)
+    return response
+
+
+async def scrape_marketplace(source, query, limit):
+    spec = backend.MARKETPLACE_REQUESTS[source]
+    try:
+        response = await cached_http_get(
+            spec["url"],
+            spec["service"],
+            report_outcome=False,
+            params=spec["params"](query),
+            headers=spec["headers"],
+        )
+        products = []
+        if response.status_code == 200:
+            # Parsing is CPU-bound; keep it off the event loop
+            products = await asyncio.to_thread(
+                backend.parse_marketplace_page, source, response.text, limit, getattr(response, "digest", None)
+            )
+        if getattr(response, "revalidated", True):
+            outbound.SOURCE_HEALTH[spec["service"]].record_response(response, empty=not products)
+        return products
+    except outbound.CircuitOpenError:
+        return []
+    except outbound.OutboundQueueTimeout as exc:
+        logs.search_log.info("marketplace scrape not sent", extra={"source": source, "error": str(exc)})
+        return []
+    except Exception as exc:
+        logs.search_log.warning("marketplace scrape failed", extra={"source": source, "error": str(exc)})
+        return []
+
+
+async def _scrape_and_cache(source, query, limit, wait=None):
+    # Same cross-worker single flight as app._scrape_and_cache, polling without blocking the loop
+    if wait is None:
+        wait = caching.shared_cache_config["lease_seconds"]
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + wait
+    waited = False
+    while caching.shared_store is not None:
+        claimed, products = await asyncio.to_thread(backend.claim_shared_scrape, source, query, waited)
+        if claimed:
+            break
+        if products is not None:
+            return [dict(p) for p in products[:limit]]
+        remaining = give_up_at - loop.time()
+        if remaining <= 0:
+            logs.search_log.info("gave up waiting for another worker's scrape", extra={"source": source, "wait": wait})
+            return []
+        waited = True
+        await asyncio.sleep(min(caching.shared_cache_config["poll_interval"], remaining))
+    try:
+        with metrics.timed_stage("scrape", source):
+            products = await scrape_marketplace(source, query, limit)
+        # The store and catalog are SQLite with a 5s busy timeout, so writes stay off the loop
+        await asyncio.to_thread(backend.cache_products, source, query, products)
+    finally:
+        if caching.shared_store is not None:
+            await asyncio.to_thread(backend.release_shared_scrape, source, query)
+    if products and catalog.catalog_config["enabled"]:
+        _spawn(asyncio.to_thread(catalog.ingest_products, source, query, products))
+    return products
+
+
+async def iter_marketplace_search(query, limit=4, deadline=None):
+    """Async app.iter_marketplace_search: (source, products) as each finishes, (source, None) on timeout"""
+    if deadline is None:
+        deadline = backend.search_config["deadline"]
+
+    sources, query = backend.marketplaces_for_query(query)
+    cached_results = []
+    tasks = {}
+    for source in sources:
+        # Catalog and shared-store reads can wait on another worker's write lock
+        local = await asyncio.to_thread(backend.get_local_products, source, query, limit)
+        if local:
+            cached_results.append((source, local))
+            continue
+        task, _ = scrape_flights.join(
+            (source, caching.normalize_query(query), limit),
+            lambda: _spawn(_scrape_and_cache(source, query, limit, deadline)),
+        )
+        tasks[task] = source
+
+    for item in cached_results:
+        yield item
+
+    loop = asyncio.get_running_loop()
+    give_up_at = loop.time() + deadline
+    pending = set(tasks)
+    while pending:
+        remaining = give_up_at - loop.time()
+        if remaining <= 0:
+            break
+        done, pending = await asyncio.wait(
+            pending, timeout=remaining, return_when=asyncio.FIRST_COMPLETED
+        )
+        for task in done:
+            # Coalesced callers share the task, so each gets its own product dicts
+            yield tasks[task], [dict(p) for p in task.result() or []]
+
+    for source in chat_pipeline.timed_out_sources({tasks[t] for t in pending}, deadline):
+        yield source, None
+
+
+async def fan_out_marketplace_search(query, limit=4, deadline=None):
+    """Async app.fan_out_marketplace_search; returns (results_by_source, timed_out_sources)"""
+    pairs = [pair async for pair in iter_marketplace_search(query, limit, deadline)]
+    return chat_pipeline.collect_marketplace_results(pairs)
+
+
+async def search_products_duckduckgo(query, lane="interactive"):
+    try:
+        response = await cached_http_get(backend.duckduckgo_url(query), "duckduckgo", lane=lane)
+        if response.status_code == 200:
+            return backend.parse_duckduckgo_results(response.json(), query)
+    except Exception as e:
+        logs.search_log.warning("DuckDuckGo search failed", extra={"error": str(e)})
+    return None
+
+
+async def fallback_products(query, lane="interactive"):
+    with metrics.timed_stage("fallback"):
+        products = await asyncio.to_thread(catalog.search_local_catalog, query)
+        if not products:
+            products = await asyncio.to_thread(backend.get_cached_products, "DuckDuckGo", query)
+            if products is None:
+                products = await search_products_duckduckgo(query, lane)
+                await asyncio.to_thread(backend.cache_products, "DuckDuckGo", query, products)
+        return chat_pipeline.fallback_result(query, products)
+
+
+async def search_products_with_status(query):
+    """Async app.search_products_with_status; returns (products, timed_out_sources)"""
+    results, timed_out = await fan_out_marketplace_search(query, limit=4)
+    combined_products = chat_pipeline.marketplace_products(results, query)
+    if combined_products:
+        return combined_products, timed_out
+
+    return await fallback_products(query), timed_out
+
+
+async def _post_deepseek(api_url, payload, headers):
+    try:
+        response = await http_request("POST", api_url, "deepseek", json=payload, headers=headers)
+        logs.deepseek_log.debug("DeepSeek responded", extra={"status": response.status_code})
+
+        if response.status_code == 200:
+            result = response.json()
+            reply = deepseek.parse_deepseek_result(result)
+            if reply:
+                deepseek.record_llm_usage(payload, reply, result.get("usage"))
+            return reply
+        logs.deepseek_log.warning(
+            "DeepSeek API error", extra={"status": response.status_code, "error": response.text[:200]}
+        )
+    except Exception as exc:
+        deepseek.log_deepseek_failure(exc)
+
+    return None
+
+
+async def _post_and_cache_deepseek(api_url, payload, headers, cache_key):
+    with metrics.timed_stage("llm", "deepseek"):
+        reply = await _post_deepseek(api_url, payload, headers)
+    await asyncio.to_thread(deepseek.cache_llm_reply, cache_key, reply)
+    return reply
+
+
+async def generate_deepseek_response(user_message, products):
+    if not deepseek.USE_DEEPSEEK or not deepseek.DEEPSEEK_API_KEY:
+        return None
+
+    api_url, payload, headers = deepseek.build_deepseek_request(user_message, products)
+    cache_key = deepseek.llm_cache_key(payload)
+    cached = await asyncio.to_thread(deepseek.get_cached_llm_reply, cache_key)
+    if cached is not None:
+        return cached
+
+    task, _ = llm_flights.join(
+        caching.request_fingerprint(api_url, payload),
+        lambda: _spawn(_post_and_cache_deepseek(api_url, payload, headers, cache_key)),
+    )
+    # Shielded so one caller disconnecting does not cancel the completion others are waiting on
+    return await asyncio.shield(task)
+
+
+async def stream_deepseek_response(user_message, products):
+    """Async deepseek.stream_deepseek_response: reply text deltas as they are generated"""
+    if not deepseek.USE_DEEPSEEK or not deepseek.DEEPSEEK_API_KEY:
+        return
+
+    try:
+        api_url, payload, headers = deepseek.build_deepseek_request(user_message, products)
+        cache_key = deepseek.llm_cache_key(payload)
+        cached = await asyncio.to_thread(deepseek.get_cached_llm_reply, cache_key)
+        if cached is not None:
+            for chunk in deepseek.template_response_chunks(cached):
+                yield chunk
+            return
+
+        payload["stream"] = True
+        started = time.perf_counter()
+        request = http_client.build_request(
+            "POST", api_url, json=payload, headers=headers, timeout=_timeout("deepseek")
+        )
+        response = await http_request_stream(request, "deepseek")
+        try:
+            if response.status_code != 200:
+                body = await response.aread()
+                logs.deepseek_log.warning(
+                    "DeepSeek API error", extra={"status": response.status_code, "error": body[:200]}
+                )
+                return
+            parts = []
+            completed = False
+            async for line in response.aiter_lines():
+                delta, end = deepseek.parse_deepseek_stream_line(line)
+                if delta:
+                    parts.append(delta)
+                    yield delta
+                if end is not None:
+                    completed = end == "complete"
+                    break
+            metrics.stage_seconds.observe(time.perf_counter() - started, stage="llm_stream", source="deepseek")
+            if completed:
+                reply = "".join(parts).strip()
+                deepseek.record_llm_usage(payload, reply)
+                await asyncio.to_thread(deepseek.cache_llm_reply, cache_key, reply)
+        finally:
+            await response.aclose()
+    except Exception as exc:
+        deepseek.log_deepseek_failure(exc)
+
+
+async def stream_chat_events(user_message, max_products=5, session_id=None):
+    """Async app.stream_chat_events"""
+    started = time.perf_counter()
+    intent = intents.classify_intent(user_message)
+    try:
+        if intent != "product_search":
+            for event in chat_pipeline.intent_events(intent, user_message, session_id):
+                yield event
+            return
+
+        turn = await asyncio.to_thread(chat_pipeline.ChatTurn.begin, session_id, user_message, max_products)
+        if turn.products:
+            yield turn.products_event()
+        else:
+            async for source, products in iter_marketplace_search(turn.query, limit=4):
+                event = turn.source_event(source, products)
+                if event:
+                    yield event
+
+        if not turn.products:
+            yield turn.fallback_event(await fallback_products(turn.query))
+        await asyncio.to_thread(turn.finish)
+
+        streamed = False
+        async for delta in stream_deepseek_response(user_message, turn.products):
+            streamed = True
+            yield turn.token_event(delta)
+        if not streamed:
+            for event in turn.template_events():
+                yield event
+
+        yield turn.done_event()
+
+    except Exception as e:
+        yield chat_pipeline.error_event(e)
+    finally:
+        intents.record_intent(intent, time.perf_counter() - started)
+
+
+async def get_products(request):
+    query = request.query_params.get("q", "").strip()
+    if query:
+        results, timed_out = await search_products_with_status(query)
+        metrics.count_products_returned(results)
+        return _cors(_json({"products": image_proxy.with_proxied_images(results), "timed_out_sources": timed_out}))
+    return _cors(JSONResponse({"products": [], "timed_out_sources": []}))
+
+
+async def chat(request):
+    if request.method == "OPTIONS":
+        return _cors(Response(status_code=200), request)
+
+    started = time.perf_counter()
+    intent = None
+    try:
+        data = await request.json()
+        user_message = data.get("message", "").strip()
+
+        intent = intents.classify_intent(user_message)
+        if intent != "product_search":
+            return _cors(_json(intents.build_intent_reply(intent, user_message, data.get("session_id"))))
+
+        turn = await asyncio.to_thread(chat_pipeline.ChatTurn.begin, data.get("session_id"), user_message)
+        if not turn.products:
+            turn.products, turn.timed_out = await search_products_with_status(turn.query)
+        await asyncio.to_thread(turn.finish)
+
+        response_text = None
+        if deepseek.USE_DEEPSEEK:
+            response_text = await generate_deepseek_response(user_message, turn.products)
+
+        return _cors(_json(turn.reply(response_text)))
+
+    except Exception as e:
+        return _cors(JSONResponse(chat_pipeline.build_chat_error_reply(str(e))))
+    finally:
+        if intent is not None:
+            intents.record_intent(intent, time.perf_counter() - started)
+
+
+async def chat_stream(request):
+    if request.method == "OPTIONS":
+        return _cors(Response(status_code=200), request)
+
+    started = time.perf_counter()
+    try:
+        data = await request.json()
+    except ValueError:
+        data = {}
+    user_message = (data or {}).get("message", "").strip()
+    events = stream_chat_events(user_message, session_id=(data or {}).get("session_id"))
+    return _cors(StreamingResponse(
+        metrics.timed_async_events(events, "chat_stream", started),
+        media_type="text/event-stream",
+        headers=chat_pipeline.SSE_HEADERS,
+    ))
+
+
+@asynccontextmanager
+async def lifespan(_):
+    global http_client
+    http_client = httpx.AsyncClient(
+        limits=httpx.Limits(
+            max_connections=outbound.http_config["async_max_connections"],
+            max_keepalive_connections=outbound.http_config["pool_maxsize"],
+        ),
+        follow_redirects=True,
+    )
+    # Each worker process starts with whatever its siblings (or its previous run) cached
+    await asyncio.to_thread(backend.warm_caches)
+    try:
+        yield
+    finally:
+        await http_client.aclose()
+
+
+app = Starlette(
+    routes=[
+        Route("/api/chat", _timed(chat), methods=["POST", "OPTIONS"]),
+        # Timed inside the stream by metrics.timed_async_events
+        Route("/api/chat/stream", chat_stream, methods=["POST", "OPTIONS"]),
+        Route("/api/products", _timed(get_products), methods=["GET"]),
+        # Stats, /metrics and any other route are served by the Flask app
+        Mount("/", app=WSGIMiddleware(backend.app)),
+    ],
+    lifespan=lifespan,
+)
@@ -0,0 +1,137 @@
+"""Benchmark the legacy catalog search index on synthetic catalogs.
+
+Usage (from the backend directory):
+    python benchmarks/bench_legacy_search.py [--sizes 10000 100000 1000000] [--queries 200]
+
+For each catalog size this reports index build time and query latency for the
+inverted index, plus the old per-product scan for sizes up to --scan-max.
+"""
+import argparse
+import math
+import os
+import random
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from legacy_search import LEGACY_SYNONYMS, ProductIndex, _legacy_price_range  # noqa: E402
+
+BRANDS = ["Sony", "Boat", "Noise", "Samsung", "Apple", "Logitech", "HP", "Dell", "JBL", "Fossil",
+          "Zebronics", "Portronics", "Anker", "Lenovo", "Skullcandy", "Titan", "Fastrack", "Amazfit"]
+ADJECTIVES = ["Wireless", "Smart", "Premium", "Classic", "Sport", "Mechanical", "Portable", "Ergonomic",
+              "Rugged", "Slim", "Pro", "Elite", "Active", "Compact", "Fast", "Bluetooth"]
+NOUNS = ["Watch", "Headphones", "Earphones", "Mouse", "Keyboard", "Backpack", "Charger", "Hub",
+         "Speaker", "Stand", "Cable", "Smartwatch", "Rucksack", "Adapter", "Webcam", "Monitor"]
+FEATURES = ["noise-cancelling", "30-hour battery", "GPS", "heart rate monitor", "RGB backlit",
+            "water-resistant", "USB-C", "fast charging", "AMOLED display", "Cherry MX switches",
+            "ergonomic design", "10-day battery", "Qi-enabled", "aluminum body", "HDMI output"]
+CATEGORIES = ["Electronics", "Accessories", "Audio", "Wearables", "Computers"]
+QUERIES = ["smart watch", "wireless headphones", "mechanical keyboard", "laptop bag", "usb hub",
+           "bluetooth speaker", "watch under 20k", "earphones 2-5k", "gps smartwatch", "$30-$60 mouse",
+           "fast charging charger", "rgb keyboard", "sony headphones", "rugged watch 10-15k"]
+
+
+def make_catalog(size, seed=42):
+    rng = random.Random(seed)
+    catalog = []
+    for i in range(size):
+        noun = rng.choice(NOUNS)
+        name = f"{rng.choice(BRANDS)} {rng.choice(ADJECTIVES)} {noun} {rng.randint(1, 999)}"
+        catalog.append({
+            "id": i,
+            "name": name,
+            "price": round(rng.uniform(5, 600), 2),
+            "image": "",
+            "category": rng.choice(CATEGORIES),
+            "description": f"{rng.choice(ADJECTIVES)} {noun.lower()} with "
+                           f"{rng.choice(FEATURES)} and {rng.choice(FEATURES)}",
+            "rating": round(rng.uniform(3, 5), 1),
+            "inStock": True,
+        })
+    return catalog
+
+
+def linear_scan_search(products, query):
+    """The per-product scan search_products_legacy used before the index (minus dict mutation)"""
+    query_lower = query.lower()
+    price_min, price_max = _legacy_price_range(query)
+    results = []
+    for product in products:
+        score = 0
+        product_text = f"{product['name']} {product['category']} {product['description']}".lower()
+        if query_lower in product_text:
+            score += 10
+        for key, values in LEGACY_SYNONYMS.items():
+            if any(syn in query_lower for syn in values):
+                if key in product_text:
+                    score += 8
+        for word in query_lower.split():
+            if len(word) > 2 and word in product_text:
+                score += 2
+        if price_min is not None and price_max is not None:
+            price_tolerance = (price_max - price_min if price_max != math.inf else price_min) * 0.1
+            if not (price_min - price_tolerance <= product['price'] <= price_max + price_tolerance):
+                continue
+        if score > 0:
+            results.append((score, product))
+    results.sort(key=lambda item: item[0], reverse=True)
+    return [product for _, product in results]
+
+
+def indexed_search(index, query, limit):
+    price_min, price_max = _legacy_price_range(query)
+    if price_min is not None and price_max is not None:
+        price_tolerance = (price_max - price_min if price_max != math.inf else price_min) * 0.1
+        price_min -= price_tolerance
+        price_max += price_tolerance
+    return index.search(query, price_min, price_max, limit)
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def time_queries(search, queries):
+    samples = []
+    for query in queries:
+        start = time.perf_counter()
+        search(query)
+        samples.append((time.perf_counter() - start) * 1000)
+    return percentile(samples, 0.5), percentile(samples, 0.95)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--sizes", type=int, nargs="+", default=[10_000, 100_000, 1_000_000])
+    parser.add_argument("--queries", type=int, default=200)
+    parser.add_argument("--limit", type=int, default=10, help="top-k returned by the index")
+    parser.add_argument("--scan-max", type=int, default=100_000,
+                        help="largest catalog the old linear scan is timed on")
+    args = parser.parse_args()
+
+    queries = [QUERIES[i % len(QUERIES)] for i in range(args.queries)]
+    print(f"scoring engine: {'numpy (vectorized)' if ProductIndex([]).vectorized else 'pure Python'}")
+    print(f"{'products':>10} {'build s':>8} {'terms':>7} {'index p50 ms':>13} {'index p95 ms':>13} "
+          f"{'scan p50 ms':>12} {'scan p95 ms':>12}")
+    for size in args.sizes:
+        catalog = make_catalog(size)
+        start = time.perf_counter()
+        index = ProductIndex(catalog)
+        build_seconds = time.perf_counter() - start
+
+        index_p50, index_p95 = time_queries(lambda q: indexed_search(index, q, args.limit), queries)
+        if size <= args.scan_max:
+            scan_queries = queries[:max(1, len(queries) // 10)]
+            scan_p50, scan_p95 = time_queries(lambda q: linear_scan_search(catalog, q), scan_queries)
+            scan = f"{scan_p50:>12.2f} {scan_p95:>12.2f}"
+        else:
+            scan = f"{'-':>12} {'-':>12}"
+        print(f"{size:>10} {build_seconds:>8.2f} {len(index.postings):>7} "
+              f"{index_p50:>13.2f} {index_p95:>13.2f} {scan}")
+
+
+if __name__ == "__main__":
+    main()
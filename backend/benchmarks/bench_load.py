@@ -0,0 +1,276 @@
+"""Load-test /api/chat and /api/products against stubbed upstreams.
+
+Usage (from the backend directory):
+    python benchmarks/bench_load.py [--server asgi|flask|serve] [--workers N] [--concurrency 32] [--requests 500]
+                                    [--mix chat=1 products=1] [--unique-queries]
+                                    [--latency flipkart=900:300] [--error-rate amazon=0.1]
+
+By default this starts benchmarks/stub_upstream.py in-process and the backend as a
+subprocess wired to it, with a throwaway catalog so runs are reproducible. Use --target
+to drive an already running backend instead (it must point at a stub itself).
+
+Reports throughput and client-side latency percentiles per endpoint, plus per-stage
+percentiles estimated from the backend's /metrics histograms over the run.
+"""
+import argparse
+import itertools
+import json
+import os
+import random
+import re
+import socket
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+BENCH_DIR = os.path.dirname(os.path.abspath(__file__))
+BACKEND_DIR = os.path.dirname(BENCH_DIR)
+sys.path.insert(0, BENCH_DIR)
+
+from stub_upstream import add_stub_arguments, backend_env, start_stub, stub_config_from_args  # noqa: E402
+
+QUERIES = ["wireless headphones", "smart watch under 5000", "gaming laptop", "bluetooth speaker",
+           "running shoes for men", "mechanical keyboard", "usb c charger", "4k monitor 27 inch",
+           "noise cancelling earbuds", "laptop backpack", "fitness band", "phone under 20000"]
+
+ENDPOINTS = {
+    "chat": ("POST", "/api/chat"),
+    "chat_stream": ("POST", "/api/chat/stream"),
+    "products": ("GET", "/api/products"),
+}
+
+SERVERS = {
+    "asgi": lambda port: [sys.executable, "-m", "uvicorn", "asgi:app", "--port", str(port), "--log-level", "warning"],
+    "flask": lambda port: [sys.executable, "-m", "flask", "--app", "app", "run", "--port", str(port), "--with-threads"],
+    # Multi-process deployment; worker count comes from WEB_CONCURRENCY (--workers)
+    "serve": lambda port: [sys.executable, "serve.py", "--host", "127.0.0.1", "--port", str(port)],
+}
+
+METRIC_LINE = re.compile(r'^assistant_stage_duration_seconds_bucket\{stage="([^"]*)",source="([^"]*)",le="([^"]+)"\} (\S+)$')
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_backend(server, env):
+    port = free_port()
+    process = subprocess.Popen(SERVERS[server](port), cwd=BACKEND_DIR, env=env,
+                               stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    for _ in range(150):
+        try:
+            if requests.get(f"{base_url}/api/stats", timeout=1).ok:
+                return process, base_url
+        except requests.RequestException:
+            pass
+        if process.poll() is not None:
+            break
+        time.sleep(0.2)
+    process.kill()
+    raise SystemExit(f"{server} backend did not start on port {port}")
+
+
+def stage_buckets(base_url):
+    """{(stage, source): [(upper_bound, cumulative_count), ...]} from /metrics"""
+    buckets = {}
+    for line in requests.get(f"{base_url}/metrics", timeout=10).text.splitlines():
+        match = METRIC_LINE.match(line)
+        if match:
+            stage, source, bound, count = match.groups()
+            buckets.setdefault((stage, source), []).append((float(bound), float(count)))
+    return buckets
+
+
+def bucket_quantile(buckets, fraction):
+    """Prometheus-style histogram_quantile: linear interpolation inside the target bucket"""
+    total = buckets[-1][1]
+    if total <= 0:
+        return 0.0
+    rank = fraction * total
+    lower_bound, lower_count = 0.0, 0.0
+    for bound, count in buckets:
+        if count >= rank:
+            if bound == float("inf"):
+                return lower_bound
+            if count == lower_count:
+                return bound
+            return lower_bound + (bound - lower_bound) * (rank - lower_count) / (count - lower_count)
+        lower_bound, lower_count = bound, count
+    return lower_bound
+
+
+def stage_report(before, after):
+    rows = []
+    for key, series in sorted(after.items()):
+        previous = dict(before.get(key, []))
+        delta = [(bound, count - previous.get(bound, 0)) for bound, count in series]
+        if delta[-1][1] <= 0:
+            continue
+        rows.append({
+            "stage": key[0],
+            "source": key[1],
+            "count": int(delta[-1][1]),
+            "p50_ms": bucket_quantile(delta, 0.5) * 1000,
+            "p95_ms": bucket_quantile(delta, 0.95) * 1000,
+            "p99_ms": bucket_quantile(delta, 0.99) * 1000,
+        })
+    return rows
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def parse_mix(pairs):
+    weights = {}
+    for pair in pairs:
+        name, _, weight = pair.partition("=")
+        if name not in ENDPOINTS:
+            raise SystemExit(f"unknown endpoint {name!r}; expected one of {', '.join(ENDPOINTS)}")
+        weights[name] = float(weight or 1)
+    return weights
+
+
+def run_load(base_url, args):
+    mix = parse_mix(args.mix)
+    rng = random.Random(args.seed)
+    plan = rng.choices(list(mix), weights=list(mix.values()), k=args.requests)
+    counter = itertools.count()
+    lock = threading.Lock()
+    samples = {name: [] for name in mix}
+    errors = {name: 0 for name in mix}
+    session = requests.Session()
+    session.mount("http://", requests.adapters.HTTPAdapter(pool_maxsize=args.concurrency))
+
+    def worker():
+        while True:
+            index = next(counter)
+            if index >= len(plan):
+                return
+            endpoint = plan[index]
+            query = QUERIES[index % len(QUERIES)]
+            if args.unique_queries:
+                query = f"{query} {index}"
+            method, path = ENDPOINTS[endpoint]
+            started = time.perf_counter()
+            try:
+                if method == "GET":
+                    response = session.get(f"{base_url}{path}", params={"q": query}, timeout=args.timeout)
+                else:
+                    response = session.post(f"{base_url}{path}", json={"message": query}, timeout=args.timeout)
+                ok = response.ok and b'"error"' not in response.content[:200]
+            except requests.RequestException:
+                ok = False
+            elapsed = time.perf_counter() - started
+            with lock:
+                samples[endpoint].append(elapsed)
+                if not ok:
+                    errors[endpoint] += 1
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=args.concurrency) as pool:
+        for _ in range(args.concurrency):
+            pool.submit(worker)
+    wall = time.perf_counter() - started
+
+    results = {"wall_seconds": wall, "throughput_rps": args.requests / wall, "endpoints": {}}
+    for name, values in samples.items():
+        results["endpoints"][name] = {
+            "requests": len(values),
+            "errors": errors[name],
+            "p50_ms": percentile(values, 0.5) * 1000,
+            "p90_ms": percentile(values, 0.9) * 1000,
+            "p99_ms": percentile(values, 0.99) * 1000,
+            "max_ms": max(values, default=0) * 1000,
+        }
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--server", choices=sorted(SERVERS), default="asgi", help="backend to start")
+    parser.add_argument("--target", help="URL of a running backend; skips starting the stub and the backend")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1,
+                        help="worker processes for --server serve")
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--mix", nargs="+", default=["chat=1", "products=1"], metavar="ENDPOINT=WEIGHT",
+                        help=f"request mix over {', '.join(ENDPOINTS)}")
+    parser.add_argument("--unique-queries", action="store_true",
+                        help="make every query distinct so caches and coalescing never help")
+    parser.add_argument("--rate-limit", action="store_true",
+                        help="keep the backend's per-host outbound rate limits on (off by default against the stub)")
+    parser.add_argument("--warmup", type=int, default=20, help="requests sent (and discarded) before measuring")
+    parser.add_argument("--timeout", type=float, default=60)
+    parser.add_argument("--json", metavar="PATH", help="also write the results as JSON")
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    process = None
+    stub = None
+    if args.target:
+        base_url = args.target.rstrip("/")
+    else:
+        stub, stub_url = start_stub(stub_config_from_args(args))
+        data_dir = tempfile.mkdtemp(prefix="bench-load-")
+        env = {
+            **os.environ,
+            **backend_env(stub_url),
+            "DEEPSEEK_API_KEY": os.environ.get("DEEPSEEK_API_KEY", "bench-key"),
+            "CATALOG_DB_PATH": os.path.join(data_dir, "catalog.db"),
+            "HTTP_CACHE_PATH": os.path.join(data_dir, "http_cache.db"),
+            "SHARED_CACHE_PATH": os.path.join(data_dir, "shared_cache.db"),
+            # The stub never throttles, so polite pacing would only measure queueing
+            "OUTBOUND_RATE_LIMIT_ENABLED": "true" if args.rate_limit else "false",
+        }
+        if args.server == "serve":
+            env["WEB_CONCURRENCY"] = str(args.workers)
+        process, base_url = start_backend(args.server, env)
+
+    try:
+        if args.warmup:
+            warmup = argparse.Namespace(**{**vars(args), "requests": args.warmup, "unique_queries": True})
+            run_load(base_url, warmup)
+        before = stage_buckets(base_url)
+        results = run_load(base_url, args)
+        results["stages"] = stage_report(before, stage_buckets(base_url))
+        if stub is not None:
+            results["upstreams"] = stub.RequestHandlerClass.config.snapshot()
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait(timeout=10)
+        if stub is not None:
+            stub.shutdown()
+
+    print(f"{args.requests} requests, concurrency {args.concurrency}, "
+          f"{results['wall_seconds']:.2f}s, {results['throughput_rps']:.1f} req/s")
+    print(f"\n{'endpoint':<12} {'requests':>8} {'errors':>7} {'p50 ms':>9} {'p90 ms':>9} {'p99 ms':>9} {'max ms':>9}")
+    for name, row in results["endpoints"].items():
+        print(f"{name:<12} {row['requests']:>8} {row['errors']:>7} {row['p50_ms']:>9.1f} "
+              f"{row['p90_ms']:>9.1f} {row['p99_ms']:>9.1f} {row['max_ms']:>9.1f}")
+    print(f"\n{'stage':<14} {'source':<10} {'count':>7} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}")
+    for row in results["stages"]:
+        print(f"{row['stage']:<14} {row['source'] or '-':<10} {row['count']:>7} {row['p50_ms']:>9.1f} "
+              f"{row['p95_ms']:>9.1f} {row['p99_ms']:>9.1f}")
+    if "upstreams" in results:
+        print("\nupstream calls: " + ", ".join(
+            f"{name} {stats['requests']} ({stats['errors']} errors, {stats['captchas']} captchas, "
+            f"{stats['not_modified']} not modified, {stats['resets']} resets)"
+            for name, stats in results["upstreams"].items()))
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as fh:
+            json.dump(results, fh, indent=2)
+
+
+if __name__ == "__main__":
+    main()
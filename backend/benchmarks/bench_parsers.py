@@ -0,0 +1,85 @@
+"""Compare HTML extraction backends on saved marketplace search pages.
+
+Usage (from the backend directory):
+    python benchmarks/bench_parsers.py [--runs 50] [--pad 4] [--limit 5] [--flipkart-layout list]
+
+--pad repeats the non-product filler of each fixture to mimic the multi-megabyte
+pages Flipkart and Amazon serve in production. --flipkart-layout list rewrites the
+Flipkart fixture into the list layout, so the page no longer matches the first profile.
+"""
+import argparse
+import os
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+sys.path.insert(0, BACKEND_DIR)
+
+from extraction import PARSER_BACKENDS, extraction_snapshot, parse_amazon_html, parse_flipkart_html  # noqa: E402
+
+FIXTURES = {
+    "flipkart": ("flipkart_search.html", parse_flipkart_html, "Flipkart"),
+    "amazon": ("amazon_search.html", parse_amazon_html, "Amazon"),
+}
+
+# Marker class of each Flipkart layout, as found in the fixture (grid)
+FLIPKART_LAYOUT_MARKERS = {"grid": "_1fQZEK", "list": "s1Q9rs"}
+
+
+def load_fixture(filename, pad, flipkart_layout="grid"):
+    with open(os.path.join(FIXTURES_DIR, filename), encoding="utf-8") as fh:
+        html = fh.read()
+    if filename.startswith("flipkart"):
+        html = html.replace(FLIPKART_LAYOUT_MARKERS["grid"], FLIPKART_LAYOUT_MARKERS[flipkart_layout])
+    if pad > 1:
+        # Inflate the page with extra script payload, which is what dominates real pages
+        filler = "<script>var pad = '" + ("x" * 250_000) + "';</script>"
+        html = html.replace("</head>", filler * (pad - 1) + "</head>", 1)
+    return html
+
+
+def time_backend(parse, html, backend, runs, limit):
+    parse(html, limit, backend)  # warm-up
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        parse(html, limit, backend)
+        samples.append(time.perf_counter() - start)
+    samples.sort()
+    return {
+        "mean_ms": sum(samples) / len(samples) * 1000,
+        "p50_ms": samples[len(samples) // 2] * 1000,
+        "p95_ms": samples[min(len(samples) - 1, int(len(samples) * 0.95))] * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--runs", type=int, default=50)
+    parser.add_argument("--pad", type=int, default=1)
+    parser.add_argument("--limit", type=int, default=5)
+    parser.add_argument("--flipkart-layout", choices=sorted(FLIPKART_LAYOUT_MARKERS), default="grid")
+    args = parser.parse_args()
+
+    for marketplace, (filename, parse, source) in FIXTURES.items():
+        html = load_fixture(filename, args.pad, args.flipkart_layout)
+        reference = parse(html, args.limit, "html.parser")
+        layouts = ", ".join(extraction_snapshot()[source]["layouts"]) or "none"
+        print(f"\n{marketplace} ({len(html) / 1024:.0f} KiB, {len(reference)} products, layout {layouts})")
+        print(f"{'backend':<12} {'mean ms':>9} {'p50 ms':>9} {'p95 ms':>9} {'speedup':>8}  output")
+
+        baseline = None
+        for backend in PARSER_BACKENDS:
+            stats = time_backend(parse, html, backend, args.runs, args.limit)
+            baseline = baseline or stats["mean_ms"]
+            same = parse(html, args.limit, backend) == reference
+            print(
+                f"{backend:<12} {stats['mean_ms']:>9.2f} {stats['p50_ms']:>9.2f} "
+                f"{stats['p95_ms']:>9.2f} {baseline / stats['mean_ms']:>7.1f}x  "
+                f"{'identical' if same else 'DIFFERS'}"
+            )
+
+
+if __name__ == "__main__":
+    main()
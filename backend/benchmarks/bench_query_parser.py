@@ -0,0 +1,85 @@
+"""Benchmark query understanding (understand_query) throughput.
+
+Usage (from the backend directory):
+    python benchmarks/bench_query_parser.py [--queries 100000] [--distinct 5000]
+
+Reports parses per second and per-parse latency percentiles for cold parses (every message
+new, memo cache cleared) and for a realistic mix where --distinct messages repeat, served
+mostly from the parse cache. Also prints how the sample messages were understood.
+"""
+import argparse
+import os
+import random
+import sys
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+from query_understanding import _understand, understand_query  # noqa: E402
+
+PRODUCTS = ["smart watch", "wireless headphones", "gaming laptop", "bluetooth speaker", "running shoes",
+            "mechanical keyboard", "usb c charger", "4k monitor 27 inch", "noise cancelling earbuds",
+            "laptop bag", "fitness band", "phone", "power bank 20000 mah", "dslr camera", "smart tv"]
+BRANDS = ["", "", "sony ", "boat ", "samsung ", "apple ", "noise ", "jbl ", "hp ", "lenovo "]
+BUDGETS = ["", "", "under 5000", "below 20k", "2-5k", "between 10000 and 15000", "around ₹30,000",
+           "$200-$250", "above 1 lakh", "50k"]
+SUFFIXES = ["", "", "", "on amazon", "from flipkart", "with 2 year warranty", "for my dad"]
+SAMPLES = ["sony headphones under 5000 on amazon", "4k monitor 27 inch", "laptop bag 2-5k",
+           "$200-$250 mouse", "boat earbuds 1500", "phone below 1.5 lakh from flipkart"]
+
+
+def make_queries(count, seed=42):
+    rng = random.Random(seed)
+    return [
+        " ".join(f"{rng.choice(BRANDS)}{rng.choice(PRODUCTS)} {rng.choice(BUDGETS)} {rng.choice(SUFFIXES)}".split())
+        for _ in range(count)
+    ]
+
+
+def percentile(samples, fraction):
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def time_parses(queries):
+    samples = []
+    started = time.perf_counter()
+    for query in queries:
+        start = time.perf_counter()
+        understand_query(query)
+        samples.append((time.perf_counter() - start) * 1e6)
+    wall = time.perf_counter() - started
+    return len(queries) / wall, percentile(samples, 0.5), percentile(samples, 0.99)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--queries", type=int, default=100_000, help="messages parsed per run")
+    parser.add_argument("--distinct", type=int, default=5_000,
+                        help="distinct messages in the repeated mix (the rest are repeats)")
+    parser.add_argument("--seed", type=int, default=42)
+    args = parser.parse_args()
+
+    for sample in SAMPLES:
+        parsed = understand_query(sample)
+        print(f"{sample!r:42} category={parsed.category} brand={parsed.brand} marketplace={parsed.marketplace} "
+              f"price={parsed.min_price}-{parsed.max_price} {parsed.currency}")
+
+    unique = make_queries(args.queries, args.seed)
+    unique = [f"{query} #{index}" for index, query in enumerate(unique)]
+    rng = random.Random(args.seed)
+    pool = make_queries(args.distinct, args.seed + 1)
+    mixed = [rng.choice(pool) for _ in range(args.queries)]
+
+    print(f"\n{'run':<10} {'parses':>8} {'parses/s':>11} {'p50 us':>8} {'p99 us':>8} {'cache hit rate':>15}")
+    for name, queries in (("cold", unique), ("repeated", mixed)):
+        _understand.cache_clear()
+        rate, p50, p99 = time_parses(queries)
+        info = _understand.cache_info()
+        hit_rate = info.hits / (info.hits + info.misses) if info.hits + info.misses else 0.0
+        print(f"{name:<10} {len(queries):>8} {rate:>11,.0f} {p50:>8.1f} {p99:>8.1f} {hit_rate:>15.1%}")
+
+
+if __name__ == "__main__":
+    main()
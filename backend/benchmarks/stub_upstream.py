@@ -0,0 +1,287 @@
+"""Local stand-in for Flipkart, Amazon, DuckDuckGo and DeepSeek built from recorded responses.
+
+Usage (from the backend directory):
+    python benchmarks/stub_upstream.py [--port 8900] [--latency flipkart=900:300] [--error-rate amazon=0.1]
+
+Routes (point the backend at them with the printed environment variables):
+    GET  /flipkart/search                  fixtures/flipkart_search.html
+    GET  /amazon/s                         fixtures/amazon_search.html
+    GET  /duckduckgo/                      fixtures/duckduckgo_instant.json
+    POST /deepseek/v1/chat/completions     fixtures/deepseek_completion.json (SSE when "stream": true)
+    GET  /_stub/stats                      requests, injected errors, captchas and client resets per upstream
+
+Latency is MEAN:JITTER in milliseconds (uniform jitter). --error-rate answers with a 503
+and --captcha-rate with a 200 bot-check page that has no product cards.
+
+Fixture pages carry an ETag (If-None-Match gets a 304 after the same latency) and
+Cache-Control (no-cache unless --max-age is set), and are gzip or brotli encoded when the
+client asks for it, like the real marketplaces.
+
+A client that drops its connection mid-response (a backend giving up at its deadline) is
+counted as a reset instead of printing a traceback.
+"""
+import argparse
+import gzip
+import hashlib
+import json
+import os
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+UPSTREAMS = ("flipkart", "amazon", "duckduckgo", "deepseek")
+
+# Roughly what the real services take from an Indian data centre
+DEFAULT_LATENCY = {"flipkart": (900, 300), "amazon": (1200, 400), "duckduckgo": (300, 100), "deepseek": (2500, 800)}
+
+CAPTCHA_PAGE = (
+    b"<html><head><title>Robot Check</title></head><body>"
+    b"<form action='/errors/validateCaptcha'><p>Enter the characters you see below</p></form>"
+    b"</body></html>"
+)
+
+
+def load_fixture(filename):
+    with open(os.path.join(FIXTURES_DIR, filename), "rb") as fh:
+        return fh.read()
+
+
+def parse_upstream_values(pairs, parse_value):
+    """["flipkart=900:300", ...] -> {"flipkart": parse_value("900:300"), ...}"""
+    values = {}
+    for pair in pairs or []:
+        name, _, value = pair.partition("=")
+        if name not in UPSTREAMS:
+            raise argparse.ArgumentTypeError(f"unknown upstream {name!r}; expected one of {', '.join(UPSTREAMS)}")
+        values[name] = parse_value(value)
+    return values
+
+
+def parse_latency(value):
+    mean, _, jitter = value.partition(":")
+    return float(mean), float(jitter or 0)
+
+
+class StubConfig:
+    def __init__(self, latency=None, error_rate=None, captcha_rate=None, stream_chunk_ms=20, seed=None,
+                 max_age=None):
+        self.latency = {**DEFAULT_LATENCY, **(latency or {})}
+        self.error_rate = error_rate or {}
+        self.captcha_rate = captcha_rate or {}
+        self.max_age = max_age or {}
+        self.stream_chunk_ms = stream_chunk_ms
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.stats = {name: {"requests": 0, "errors": 0, "captchas": 0, "not_modified": 0, "resets": 0}
+                      for name in UPSTREAMS}
+        self.bodies = {
+            "flipkart": load_fixture("flipkart_search.html"),
+            "amazon": load_fixture("amazon_search.html"),
+            "duckduckgo": load_fixture("duckduckgo_instant.json"),
+            "deepseek": load_fixture("deepseek_completion.json"),
+        }
+
+    def draw(self, upstream):
+        """(delay seconds, outcome) for one request; outcome is ok, error or captcha"""
+        mean, jitter = self.latency[upstream]
+        with self.lock:
+            delay = max(0.0, mean + self.random.uniform(-jitter, jitter)) / 1000
+            roll = self.random.random()
+            stats = self.stats[upstream]
+            stats["requests"] += 1
+            if roll < self.error_rate.get(upstream, 0):
+                stats["errors"] += 1
+                return delay, "error"
+            if roll < self.error_rate.get(upstream, 0) + self.captcha_rate.get(upstream, 0):
+                stats["captchas"] += 1
+                return delay, "captcha"
+        return delay, "ok"
+
+    def count_not_modified(self, upstream):
+        with self.lock:
+            self.stats[upstream]["not_modified"] += 1
+
+    def count_reset(self, upstream):
+        with self.lock:
+            self.stats[upstream]["resets"] += 1
+
+    def snapshot(self):
+        with self.lock:
+            return {name: dict(stats) for name, stats in self.stats.items()}
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"  # keep-alive, like the real upstreams
+    config = None
+
+    def log_message(self, format, *args):
+        pass
+
+    def handle_one_request(self):
+        self.upstream = None
+        try:
+            super().handle_one_request()
+        except (ConnectionResetError, BrokenPipeError):
+            # Clients closing idle keep-alive connections aren't worth counting
+            if self.upstream is not None:
+                self.config.count_reset(self.upstream)
+            self.close_connection = True
+
+    def _send(self, status, body, content_type, headers=None):
+        accepted = self.headers.get("Accept-Encoding", "")
+        encoding = None
+        if body and "br" in accepted and brotli is not None:
+            body, encoding = brotli.compress(body, quality=5), "br"
+        elif body and "gzip" in accepted:
+            body, encoding = gzip.compress(body, 6), "gzip"
+        self.send_response(status)
+        self.send_header("Content-Type", content_type)
+        if encoding:
+            self.send_header("Content-Encoding", encoding)
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _route(self):
+        path = urlsplit(self.path).path
+        if path.startswith("/flipkart/"):
+            return "flipkart", "text/html; charset=utf-8"
+        if path.startswith("/amazon/"):
+            return "amazon", "text/html; charset=utf-8"
+        if path.startswith("/duckduckgo/"):
+            return "duckduckgo", "application/json"
+        if path.startswith("/deepseek/") and path.endswith("/chat/completions"):
+            return "deepseek", "application/json"
+        return None, None
+
+    def do_GET(self):
+        if urlsplit(self.path).path == "/_stub/stats":
+            return self._send(200, json.dumps(self.config.snapshot()).encode(), "application/json")
+        upstream, content_type = self._route()
+        if upstream is None or upstream == "deepseek":
+            return self._send(404, b"not found", "text/plain")
+        self._answer(upstream, content_type)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length") or 0)
+        payload = json.loads(self.rfile.read(length) or b"{}")
+        upstream, content_type = self._route()
+        if upstream != "deepseek":
+            return self._send(404, b"not found", "text/plain")
+        self._answer(upstream, content_type, stream=bool(payload.get("stream")))
+
+    def _answer(self, upstream, content_type, stream=False):
+        self.upstream = upstream
+        delay, outcome = self.config.draw(upstream)
+        time.sleep(delay)
+        if outcome == "error":
+            return self._send(503, b"Service Unavailable", "text/plain")
+        if outcome == "captcha":
+            return self._send(200, CAPTCHA_PAGE, "text/html; charset=utf-8")
+        body = self.config.bodies[upstream]
+        if stream:
+            return self._stream_completion(body)
+        max_age = self.config.max_age.get(upstream, 0)
+        headers = {
+            "ETag": f'"{hashlib.sha1(body).hexdigest()[:16]}"',
+            "Cache-Control": f"max-age={max_age:g}" if max_age else "no-cache",
+        }
+        if upstream != "deepseek" and self.headers.get("If-None-Match") == headers["ETag"]:
+            self.config.count_not_modified(upstream)
+            return self._send(304, b"", content_type, headers)
+        self._send(200, body, content_type, headers)
+
+    def _stream_completion(self, body):
+        """Replay the recorded completion as chat.completion.chunk SSE events, word by word"""
+        content = json.loads(body)["choices"][0]["message"]["content"]
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+        words = content.split(" ")
+        for index, word in enumerate(words):
+            delta = word if index == len(words) - 1 else word + " "
+            chunk = {"object": "chat.completion.chunk", "choices": [{"index": 0, "delta": {"content": delta}}]}
+            self._write_chunk(f"data: {json.dumps(chunk)}\n\n".encode())
+            time.sleep(self.config.stream_chunk_ms / 1000)
+        self._write_chunk(b"data: [DONE]\n\n")
+        self._write_chunk(b"")
+
+    def _write_chunk(self, data):
+        self.wfile.write(f"{len(data):x}\r\n".encode() + data + b"\r\n")
+        self.wfile.flush()
+
+
+def start_stub(config, host="127.0.0.1", port=0):
+    """Serve the stub on a background thread; returns (server, base_url)"""
+    handler = type("ConfiguredStubHandler", (StubHandler,), {"config": config})
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, name="stub-upstream", daemon=True).start()
+    return server, f"http://{host}:{server.server_address[1]}"
+
+
+def backend_env(base_url):
+    """Environment variables that point the backend at a stub served from base_url"""
+    return {
+        "FLIPKART_SEARCH_URL": f"{base_url}/flipkart/search",
+        "AMAZON_SEARCH_URL": f"{base_url}/amazon/s",
+        "DUCKDUCKGO_API_URL": f"{base_url}/duckduckgo/",
+        "DEEPSEEK_API_BASE": f"{base_url}/deepseek/v1",
+    }
+
+
+def add_stub_arguments(parser):
+    parser.add_argument("--latency", nargs="*", metavar="UPSTREAM=MEAN:JITTER",
+                        help="response latency in ms per upstream (defaults: " +
+                             ", ".join(f"{k}={m:g}:{j:g}" for k, (m, j) in DEFAULT_LATENCY.items()) + ")")
+    parser.add_argument("--error-rate", nargs="*", metavar="UPSTREAM=RATE", help="fraction answered with a 503")
+    parser.add_argument("--captcha-rate", nargs="*", metavar="UPSTREAM=RATE",
+                        help="fraction answered with a bot-check page")
+    parser.add_argument("--max-age", nargs="*", metavar="UPSTREAM=SECONDS",
+                        help="Cache-Control max-age sent with fixture pages (default: no-cache)")
+    parser.add_argument("--stream-chunk-ms", type=float, default=20, help="delay between streamed DeepSeek words")
+    parser.add_argument("--seed", type=int, default=1234, help="seed for latency jitter and injected failures")
+
+
+def stub_config_from_args(args):
+    return StubConfig(
+        latency=parse_upstream_values(args.latency, parse_latency),
+        error_rate=parse_upstream_values(args.error_rate, float),
+        captcha_rate=parse_upstream_values(args.captcha_rate, float),
+        max_age=parse_upstream_values(args.max_age, float),
+        stream_chunk_ms=args.stream_chunk_ms,
+        seed=args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8900)
+    add_stub_arguments(parser)
+    args = parser.parse_args()
+
+    server, base_url = start_stub(stub_config_from_args(args), args.host, args.port)
+    print(f"Stub upstreams listening on {base_url}; start the backend with:")
+    for name, value in backend_env(base_url).items():
+        print(f"  export {name}={value}")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
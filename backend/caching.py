@@ -0,0 +1,354 @@
+"""In-memory result caches, the cross-process SQLite store behind them, and call coalescing."""
+import hashlib
+import json
+import os
+import socket
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+
+from logs import cache_log
+
+# Cross-process cache store: when SHARED_CACHE_PATH is set (serve.py sets it for multi-worker
+# deployments), product and DeepSeek reply caches write through to one SQLite file that every
+# worker reads on a miss and warms from at startup
+shared_cache_config = {
+    "path": os.getenv("SHARED_CACHE_PATH", ""),
+    "max_entries": int(os.getenv("SHARED_CACHE_MAX_ENTRIES", "50000")),
+    # Most recent entries per cache loaded into memory when a worker starts
+    "warm_entries": int(os.getenv("SHARED_CACHE_WARM_ENTRIES", "2000")),
+    # How long one worker's claim on a scrape keeps others waiting for its result
+    "lease_seconds": float(os.getenv("SHARED_SCRAPE_LEASE_SECONDS", "12")),
+    "poll_interval": float(os.getenv("SHARED_SCRAPE_POLL_SECONDS", "0.05")),
+}
+
+SHARED_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS cache_entries (
+    namespace TEXT NOT NULL,
+    key TEXT NOT NULL,
+    value TEXT NOT NULL,
+    expires_at REAL NOT NULL,
+    stale_until REAL NOT NULL,
+    PRIMARY KEY (namespace, key)
+);
+CREATE INDEX IF NOT EXISTS cache_entries_expires_at ON cache_entries (namespace, expires_at);
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    owner TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+"""
+
+
+class SharedStore:
+    """SQLite key/value store shared by worker processes, with wall-clock expiry and leases"""
+
+    def __init__(self, path, config):
+        self.path = path
+        self.config = config
+        self.owner = f"{socket.gethostname()}:{os.getpid()}"
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        self.stats = {"reads": 0, "hits": 0, "writes": 0, "errors": 0, "leases": 0, "lease_waits": 0}
+
+    def _connection(self):
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            os.makedirs(os.path.dirname(self.path) or ".", exist_ok=True)
+            conn = sqlite3.connect(self.path, timeout=5)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.executescript(SHARED_CACHE_SCHEMA)
+            self._local.conn = conn
+        return conn
+
+    def _count(self, stat):
+        with self._lock:
+            self.stats[stat] += 1
+            return self.stats[stat]
+
+    def _failed(self, action, exc):
+        self._count("errors")
+        cache_log.warning("shared cache %s failed", action, extra={"error": str(exc)})
+
+    @staticmethod
+    def encode_key(key):
+        return json.dumps(key, separators=(",", ":"), default=str)
+
+    def get(self, namespace, key):
+        """(value, expires_at, stale_until) in time.time() terms, or None when missing or past its grace"""
+        self._count("reads")
+        try:
+            row = self._connection().execute(
+                "SELECT value, expires_at, stale_until FROM cache_entries "
+                "WHERE namespace = ? AND key = ? AND stale_until > ?",
+                (namespace, self.encode_key(key), time.time()),
+            ).fetchone()
+        except sqlite3.Error as exc:
+            self._failed("read", exc)
+            return None
+        if row is None:
+            return None
+        self._count("hits")
+        return json.loads(row[0]), row[1], row[2]
+
+    def set(self, namespace, key, value, ttl, grace=0):
+        now = time.time()
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute(
+                    "INSERT OR REPLACE INTO cache_entries (namespace, key, value, expires_at, stale_until) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    (namespace, self.encode_key(key), json.dumps(value, default=str), now + ttl, now + ttl + grace),
+                )
+            # Dead rows and anything beyond max_entries are trimmed every few hundred writes
+            if self._count("writes") % 500 == 0:
+                with conn:
+                    conn.execute("DELETE FROM cache_entries WHERE stale_until <= ?", (now,))
+                    conn.execute(
+                        "DELETE FROM cache_entries WHERE rowid IN ("
+                        "SELECT rowid FROM cache_entries ORDER BY expires_at DESC LIMIT -1 OFFSET ?)",
+                        (self.config["max_entries"],),
+                    )
+                    conn.execute("DELETE FROM leases WHERE expires_at <= ?", (now,))
+        except sqlite3.Error as exc:
+            self._failed("write", exc)
+
+    def recent(self, namespace, limit):
+        """Live entries of a namespace, freshest first: [(key, value, expires_at, stale_until)]"""
+        try:
+            rows = self._connection().execute(
+                "SELECT key, value, expires_at, stale_until FROM cache_entries "
+                "WHERE namespace = ? AND stale_until > ? ORDER BY expires_at DESC LIMIT ?",
+                (namespace, time.time(), limit),
+            ).fetchall()
+        except sqlite3.Error as exc:
+            self._failed("read", exc)
+            return []
+        return [(json.loads(key), json.loads(value), expires_at, stale_until)
+                for key, value, expires_at, stale_until in rows]
+
+    def acquire_lease(self, name, seconds):
+        """Claim name for this worker; False while another worker holds an unexpired claim"""
+        now = time.time()
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM leases WHERE name = ? AND expires_at <= ?", (name, now))
+                claimed = conn.execute(
+                    "INSERT OR IGNORE INTO leases (name, owner, expires_at) VALUES (?, ?, ?)",
+                    (name, self.owner, now + seconds),
+                ).rowcount == 1
+        except sqlite3.Error as exc:
+            self._failed("lease", exc)
+            # Without the store every worker falls back to scraping for itself
+            return True
+        self._count("leases" if claimed else "lease_waits")
+        return claimed
+
+    def lease_held(self, name):
+        """Whether another claim on name is still live; a plain read, so waiters can poll it cheaply"""
+        try:
+            row = self._connection().execute(
+                "SELECT 1 FROM leases WHERE name = ? AND expires_at > ?", (name, time.time())
+            ).fetchone()
+        except sqlite3.Error as exc:
+            self._failed("lease", exc)
+            return False
+        return row is not None
+
+    def release_lease(self, name):
+        try:
+            conn = self._connection()
+            with conn:
+                conn.execute("DELETE FROM leases WHERE name = ? AND owner = ?", (name, self.owner))
+        except sqlite3.Error as exc:
+            self._failed("lease", exc)
+
+    def snapshot(self):
+        with self._lock:
+            return {"path": self.path, **self.stats}
+
+
+shared_store = SharedStore(shared_cache_config["path"], shared_cache_config) if shared_cache_config["path"] else None
+
+
+class ResultCache:
+    """Thread-safe LRU cache with per-entry TTLs and an approximate memory cap
+
+    Entries set with a grace period outlive their TTL by that long; lookup() still returns
+    them (flagged stale) so callers can serve the old value while it is refreshed. With a
+    namespace and the shared store configured, sets are written through and misses are
+    looked up there, so worker processes see each other's entries.
+    """
+
+    def __init__(self, max_entries, max_bytes, namespace=None):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.shared = shared_store if namespace else None
+        self.namespace = namespace
+        self._entries = OrderedDict()  # key -> (expires_at, stale_until, size, value)
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.stats = {"hits": 0, "stale_hits": 0, "misses": 0, "evictions": 0, "expirations": 0}
+        if self.shared is not None:
+            self.stats["shared_hits"] = 0
+
+    def lookup(self, key):
+        """Return (value, stale); (None, False) when missing or past its grace period"""
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, stale_until, size, value = entry
+                if stale_until > now:
+                    self._entries.move_to_end(key)
+                    stale = expires_at <= now
+                    self.stats["stale_hits" if stale else "hits"] += 1
+                    return value, stale
+                del self._entries[key]
+                self._bytes -= size
+                self.stats["expirations"] += 1
+            if self.shared is None:
+                self.stats["misses"] += 1
+                return None, False
+        return self._lookup_shared(key)
+
+    def _lookup_shared(self, key):
+        found = self.shared.get(self.namespace, key)
+        if found is None:
+            with self._lock:
+                self.stats["misses"] += 1
+            return None, False
+        value, expires_at, stale_until = found
+        now = time.time()
+        self._store(key, value, expires_at - now, stale_until - now)
+        stale = expires_at <= now
+        with self._lock:
+            self.stats["shared_hits"] += 1
+            self.stats["stale_hits" if stale else "hits"] += 1
+        return value, stale
+
+    def get(self, key):
+        value, stale = self.lookup(key)
+        return None if stale else value
+
+    def reload(self, key):
+        """Drop the local copy of key and read it again from the shared store: (value, stale)"""
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+        if self.shared is None:
+            return None, False
+        return self._lookup_shared(key)
+
+    def expires_at(self, key):
+        """time.monotonic() at which key stops being fresh, or None if it is not cached"""
+        with self._lock:
+            entry = self._entries.get(key)
+            return entry[0] if entry is not None else None
+
+    def set(self, key, value, ttl, grace=0):
+        self._store(key, value, ttl, ttl + grace)
+        if self.shared is not None:
+            self.shared.set(self.namespace, key, value, ttl, grace)
+
+    def _store(self, key, value, fresh_for, keep_for):
+        size = len(json.dumps(value, default=str))
+        if size > self.max_bytes:
+            return
+        with self._lock:
+            old = self._entries.pop(key, None)
+            if old is not None:
+                self._bytes -= old[2]
+            now = time.monotonic()
+            self._entries[key] = (now + fresh_for, now + keep_for, size, value)
+            self._bytes += size
+            while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+                _, (_, _, evicted_size, _) = self._entries.popitem(last=False)
+                self._bytes -= evicted_size
+                self.stats["evictions"] += 1
+
+    def warm(self, limit):
+        """Load up to limit of the shared store's freshest entries; returns how many were loaded"""
+        if self.shared is None:
+            return 0
+        now = time.time()
+        entries = self.shared.recent(self.namespace, limit)
+        # Oldest first, so the freshest end up most recently used
+        for key, value, expires_at, stale_until in reversed(entries):
+            key = tuple(key) if isinstance(key, list) else key
+            self._store(key, value, expires_at - now, stale_until - now)
+        return len(entries)
+
+    def snapshot(self):
+        with self._lock:
+            lookups = self.stats["hits"] + self.stats["misses"]
+            return {
+                **self.stats,
+                "entries": len(self._entries),
+                "bytes": self._bytes,
+                "hit_rate": round(self.stats["hits"] / lookups, 4) if lookups else 0.0,
+            }
+
+
+# Every SingleFlight by name, reported under "coalescing" in /api/stats
+SINGLE_FLIGHTS = {}
+
+
+class SingleFlight:
+    """Share one in-flight call between concurrent callers asking for the same key"""
+
+    def __init__(self, name):
+        self._calls = {}
+        self._waiters = {}  # key -> callers that joined the in-flight call and have not left it
+        self._lock = threading.Lock()
+        self.stats = {"started": 0, "coalesced": 0}
+        SINGLE_FLIGHTS[name] = self
+
+    def join(self, key, start):
+        """Return (future, started): the in-flight future for key, or a new one from start()"""
+        with self._lock:
+            future = self._calls.get(key)
+            if future is not None:
+                self.stats["coalesced"] += 1
+                self._waiters[key] += 1
+                return future, False
+            future = start()
+            self._calls[key] = future
+            self._waiters[key] = 1
+            self.stats["started"] += 1
+        future.add_done_callback(lambda _: self._forget(key, future))
+        return future, True
+
+    def leave(self, key, future):
+        """Stop waiting on a joined call; True when nobody else waits, so it may be cancelled"""
+        with self._lock:
+            if self._calls.get(key) is not future:
+                return False
+            self._waiters[key] -= 1
+            return self._waiters[key] <= 0
+
+    def _forget(self, key, future):
+        with self._lock:
+            if self._calls.get(key) is future:
+                del self._calls[key]
+                del self._waiters[key]
+
+    def snapshot(self):
+        with self._lock:
+            return {**self.stats, "in_flight": len(self._calls)}
+
+
+def request_fingerprint(*parts):
+    """Stable hash of JSON-serializable request parts (URL, payload, ...)"""
+    encoded = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(encoded.encode("utf-8")).hexdigest()
+
+
+def normalize_query(query):
+    """Cache key form of a query: lowercased, whitespace collapsed, tokens sorted"""
+    return " ".join(sorted(query.lower().split()))
@@ -0,0 +1,272 @@
+"""SQLite product catalog built from marketplace scrapes and searched before the network."""
+import os
+import re
+import sqlite3
+import threading
+import time
+
+from caching import normalize_query
+from logs import catalog_log
+
+# Persistent local product catalog (SQLite + FTS5) fed by every successful marketplace scrape
+catalog_config = {
+    "enabled": os.getenv("CATALOG_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "path": os.getenv(
+        "CATALOG_DB_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "catalog.db"),
+    ),
+    # Catalog rows older than this are not served on the request path
+    "max_age": int(os.getenv("CATALOG_MAX_AGE_SECONDS", str(6 * 3600))),
+    # Rows not refreshed for this long are deleted, as are the oldest products beyond max_products
+    "retention": int(os.getenv("CATALOG_RETENTION_SECONDS", str(7 * 24 * 3600))),
+    "max_products": int(os.getenv("CATALOG_MAX_PRODUCTS", "200000")),
+}
+
+CATALOG_SCHEMA = """
+CREATE TABLE IF NOT EXISTS products (
+    id INTEGER PRIMARY KEY,
+    source TEXT NOT NULL,
+    name TEXT NOT NULL,
+    price TEXT,
+    rating TEXT,
+    description TEXT,
+    image TEXT,
+    flipkart_link TEXT,
+    amazon_link TEXT,
+    in_stock INTEGER NOT NULL DEFAULT 1,
+    updated_at REAL NOT NULL,
+    UNIQUE (source, name)
+);
+-- Which products a (source, normalized query) search returned, in display order
+CREATE TABLE IF NOT EXISTS query_results (
+    source TEXT NOT NULL,
+    query TEXT NOT NULL,
+    position INTEGER NOT NULL,
+    product_id INTEGER NOT NULL REFERENCES products(id) ON DELETE CASCADE,
+    fetched_at REAL NOT NULL,
+    PRIMARY KEY (source, query, position)
+);
+CREATE VIRTUAL TABLE IF NOT EXISTS products_fts USING fts5(
+    name, description, content='products', content_rowid='id'
+);
+CREATE TRIGGER IF NOT EXISTS products_ai AFTER INSERT ON products BEGIN
+    INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+END;
+CREATE TRIGGER IF NOT EXISTS products_ad AFTER DELETE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, name, description)
+    VALUES ('delete', old.id, old.name, old.description);
+END;
+CREATE TRIGGER IF NOT EXISTS products_au AFTER UPDATE ON products BEGIN
+    INSERT INTO products_fts(products_fts, rowid, name, description)
+    VALUES ('delete', old.id, old.name, old.description);
+    INSERT INTO products_fts(rowid, name, description) VALUES (new.id, new.name, new.description);
+END;
+"""
+
+# Query words that never appear in listings and would make an FTS AND-match fail
+CATALOG_STOPWORDS = {
+    "a", "an", "and", "the", "for", "with", "under", "below", "above", "over", "between",
+    "within", "upto", "up", "to", "best", "good", "cheap", "buy", "online", "price", "rs",
+    "show", "me", "find", "i", "want", "need", "looking", "some", "of", "in", "on",
+}
+
+_catalog_local = threading.local()
+_catalog_lock = threading.Lock()
+catalog_stats = {"query_hits": 0, "fts_hits": 0, "misses": 0, "ingested": 0, "writes": 0, "pruned": 0, "errors": 0}
+
+
+def _count_catalog(stat, amount=1):
+    with _catalog_lock:
+        catalog_stats[stat] += amount
+        return catalog_stats[stat]
+
+
+def catalog_connection():
+    """Per-thread SQLite connection to the local catalog, creating the schema on first use"""
+    conn = getattr(_catalog_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(catalog_config["path"]) or ".", exist_ok=True)
+        conn = sqlite3.connect(catalog_config["path"], timeout=5)
+        conn.row_factory = sqlite3.Row
+        # WAL lets request threads keep reading while ingestion writes
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute("PRAGMA foreign_keys=ON")
+        conn.executescript(CATALOG_SCHEMA)
+        _catalog_local.conn = conn
+    return conn
+
+
+def _catalog_row_to_product(row):
+    return {
+        "name": row["name"],
+        "price": row["price"],
+        "rating": row["rating"],
+        "description": row["description"],
+        "image": row["image"],
+        "flipkart_link": row["flipkart_link"],
+        "amazon_link": row["amazon_link"],
+        "source": row["source"],
+        "inStock": bool(row["in_stock"]),
+    }
+
+
+def ingest_products(source, query, products, fetched_at=None):
+    """Upsert scraped products into the local catalog and remember them as the results for query"""
+    if not products:
+        return 0
+    fetched_at = fetched_at or time.time()
+    try:
+        conn = catalog_connection()
+        with conn:
+            product_ids = []
+            for product in products:
+                row = conn.execute(
+                    """
+                    INSERT INTO products (source, name, price, rating, description, image,
+                                          flipkart_link, amazon_link, in_stock, updated_at)
+                    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+                    ON CONFLICT (source, name) DO UPDATE SET
+                        price = excluded.price,
+                        rating = excluded.rating,
+                        description = excluded.description,
+                        image = excluded.image,
+                        flipkart_link = excluded.flipkart_link,
+                        amazon_link = excluded.amazon_link,
+                        in_stock = excluded.in_stock,
+                        updated_at = excluded.updated_at
+                    RETURNING id
+                    """,
+                    (
+                        product.get("source") or source,
+                        product["name"],
+                        product.get("price"),
+                        product.get("rating"),
+                        product.get("description"),
+                        product.get("image"),
+                        product.get("flipkart_link"),
+                        product.get("amazon_link"),
+                        1 if product.get("inStock", True) else 0,
+                        fetched_at,
+                    ),
+                ).fetchone()
+                product_ids.append(row["id"])
+
+            if query is not None:
+                normalized = normalize_query(query)
+                conn.execute(
+                    "DELETE FROM query_results WHERE source = ? AND query = ?",
+                    (source, normalized),
+                )
+                conn.executemany(
+                    "INSERT INTO query_results (source, query, position, product_id, fetched_at) "
+                    "VALUES (?, ?, ?, ?, ?)",
+                    [
+                        (source, normalized, position, product_id, fetched_at)
+                        for position, product_id in enumerate(product_ids)
+                    ],
+                )
+        _count_catalog("ingested", len(product_ids))
+        # Old rows are trimmed every hundred ingests rather than on each one
+        if _count_catalog("writes") % 100 == 0:
+            prune_catalog(conn)
+        return len(product_ids)
+    except sqlite3.Error as exc:
+        _count_catalog("errors")
+        catalog_log.warning("catalog ingest failed", extra={"error": str(exc)})
+        return 0
+
+
+def prune_catalog(conn=None):
+    """Delete rows older than the retention period and the oldest products beyond max_products
+
+    Both tables are cut at one timestamp. A query's results were fetched no later than the
+    products they list were updated, so no query is left with some of its products missing.
+    Returns the number of products deleted.
+    """
+    conn = conn or catalog_connection()
+    cutoff = time.time() - catalog_config["retention"]
+    row = conn.execute(
+        "SELECT updated_at FROM products ORDER BY updated_at DESC LIMIT 1 OFFSET ?",
+        (catalog_config["max_products"],),
+    ).fetchone()
+    if row is not None:
+        cutoff = max(cutoff, row["updated_at"])
+    with conn:
+        conn.execute("DELETE FROM query_results WHERE fetched_at <= ?", (cutoff,))
+        pruned = conn.execute("DELETE FROM products WHERE updated_at <= ?", (cutoff,)).rowcount
+    if pruned:
+        _count_catalog("pruned", pruned)
+        catalog_log.info("catalog pruned", extra={"products": pruned})
+    return pruned
+
+
+def lookup_catalog_products(source, query, limit=4, max_age=None):
+    """Products a previous scrape of this exact (normalized) query returned, if still fresh"""
+    if not catalog_config["enabled"]:
+        return None
+    max_age = catalog_config["max_age"] if max_age is None else max_age
+    try:
+        rows = catalog_connection().execute(
+            """
+            SELECT p.* FROM query_results q JOIN products p ON p.id = q.product_id
+            WHERE q.source = ? AND q.query = ? AND q.fetched_at >= ?
+            ORDER BY q.position LIMIT ?
+            """,
+            (source, normalize_query(query), time.time() - max_age, limit),
+        ).fetchall()
+    except sqlite3.Error as exc:
+        _count_catalog("errors")
+        catalog_log.warning("catalog lookup failed", extra={"error": str(exc)})
+        return None
+    if not rows:
+        _count_catalog("misses")
+        return None
+    _count_catalog("query_hits")
+    return [_catalog_row_to_product(row) for row in rows]
+
+
+def search_local_catalog(query, limit=8, max_age=None):
+    """Full-text search over every product the catalog has seen, best match first"""
+    if not catalog_config["enabled"]:
+        return []
+    terms = [
+        term for term in re.findall(r"[a-z0-9]+", query.lower())
+        if term not in CATALOG_STOPWORDS and not re.fullmatch(r"\d+k?", term)
+    ]
+    if not terms:
+        return []
+    max_age = catalog_config["max_age"] if max_age is None else max_age
+    match = " ".join(f'"{term}"' for term in terms)
+    try:
+        rows = catalog_connection().execute(
+            """
+            SELECT p.* FROM products_fts f JOIN products p ON p.id = f.rowid
+            WHERE products_fts MATCH ? AND p.updated_at >= ?
+            ORDER BY bm25(products_fts) LIMIT ?
+            """,
+            (match, time.time() - max_age, limit),
+        ).fetchall()
+    except sqlite3.Error as exc:
+        _count_catalog("errors")
+        catalog_log.warning("catalog search failed", extra={"error": str(exc)})
+        return []
+    if rows:
+        _count_catalog("fts_hits")
+    return [_catalog_row_to_product(row) for row in rows]
+
+
+def catalog_snapshot():
+    snapshot = {"enabled": catalog_config["enabled"], "path": catalog_config["path"]}
+    if catalog_config["enabled"]:
+        with _catalog_lock:
+            snapshot.update(catalog_stats)
+        try:
+            conn = catalog_connection()
+            snapshot["products"] = conn.execute("SELECT COUNT(*) FROM products").fetchone()[0]
+            snapshot["queries"] = conn.execute(
+                "SELECT COUNT(DISTINCT source || ':' || query) FROM query_results"
+            ).fetchone()[0]
+        except sqlite3.Error as exc:
+            snapshot["error"] = str(exc)
+    return snapshot
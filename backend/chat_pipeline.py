@@ -0,0 +1,359 @@
+"""Search and chat steps shared by the Flask server (app.py) and the ASGI server (asgi.py).
+
+The two servers differ only in how they wait on scrapes, SQLite and DeepSeek: app.py blocks a
+worker thread, asgi.py awaits on the event loop. Everything decided between those waits
+(merging and filtering results, fallbacks, session turns, replies and SSE events) lives here.
+"""
+import json
+import logging
+from urllib.parse import quote
+
+from logs import chat_log, search_log
+from metrics import count_products_returned
+from query_understanding import filter_products_for_query, understand_query
+from deepseek import template_response_chunks
+from image_proxy import with_proxied_images
+from intents import intent_reply
+from sessions import begin_chat_turn, finish_chat_turn
+
+# Order marketplace results are shown in, and timed-out sources are reported in
+MARKETPLACE_ORDER = ("Flipkart", "Amazon")
+
+
+def merge_marketplace_results(results):
+    """Combine per-source marketplace results in display order, cross-linking marketplaces"""
+    combined_products = []
+    seen_names = set()
+
+    for source in MARKETPLACE_ORDER:
+        for product in results.get(source, []):
+            key = (product["name"], product.get("source"))
+            if key in seen_names:
+                continue
+            seen_names.add(key)
+            # Ensure both marketplace links exist where possible
+            if product.get("source") == "Flipkart" and not product.get("amazon_link"):
+                product["amazon_link"] = f"https://www.amazon.in/s?k={quote(product['name'])}"
+            if product.get("source") == "Amazon" and not product.get("flipkart_link"):
+                product["flipkart_link"] = f"https://www.flipkart.com/search?q={quote(product['name'])}"
+            combined_products.append(product)
+
+    return combined_products
+
+
+def marketplace_products(results, query):
+    """Merged marketplace results, filtered to the query"""
+    return filter_products_for_query(merge_marketplace_results(results), query)
+
+
+def collect_marketplace_results(pairs):
+    """(results_by_source, timed_out_sources) from iter_marketplace_search's (source, products) pairs"""
+    results = {}
+    timed_out = []
+    for source, products in pairs:
+        if products is None:
+            timed_out.append(source)
+        else:
+            results[source] = products
+    return results, timed_out
+
+
+def timed_out_sources(sources, deadline):
+    """Sources still running at the fan-out deadline, in display order"""
+    timed_out = [source for source in MARKETPLACE_ORDER if source in sources]
+    if timed_out:
+        search_log.info("sources timed out", extra={"deadline": deadline, "sources": timed_out})
+    return timed_out
+
+
+def search_products_web(query):
+    """Search for products using web scraping (free, no API key)"""
+    try:
+        # Use a product search approach
+        # Create product suggestions based on common e-commerce patterns
+        parsed = understand_query(query)
+        
+        # Budget from the query, shown on generic suggestions
+        price_range = ""
+        min_price, max_price = parsed.price_range("INR")
+        if min_price is not None and max_price is not None:
+            price_range = f"₹{min_price:,.0f} - ₹{max_price:,.0f}"
+        elif max_price is not None:
+            price_range = f"Under ₹{max_price:,.0f}"
+        elif min_price is not None:
+            price_range = f"₹{min_price:,.0f}+"
+        
+        # Product templates for common searches
+        product_templates = {
+            'watch': [
+                {'name': 'Seiko 5 Sports Automatic SRPD Series', 'price': '₹15,000 - ₹25,000', 'rating': '4.5',
+                 'desc': 'A highly regarded automatic watch known for its reliability and value. It features a robust in-house automatic movement, a day-date display, and a see-through case back. Its versatile design makes it suitable for both casual and semi-formal occasions.'},
+                {'name': 'Tissot PRX Quartz', 'price': '₹20,000 - ₹30,000', 'rating': '4.6',
+                 'desc': 'A stunning Swiss-made watch featuring a timeless 1970s integrated bracelet design. It comes with a high-quality quartz movement, a scratch-resistant sapphire crystal, and a beautifully finished case that exudes premium quality.'},
+                {'name': 'Fossil Gen 6 Smartwatch', 'price': '₹18,000 - ₹25,000', 'rating': '4.4',
+                 'desc': 'Feature-rich smartwatch with fitness tracking, notifications, and Google Wear OS. Perfect for active lifestyles and tech enthusiasts who want style and functionality.'},
+            ],
+            'headphone': [
+                {'name': 'Sony WH-1000XM4 Wireless Headphones', 'price': '₹25,000 - ₹30,000', 'rating': '4.7',
+                 'desc': 'Premium noise-cancelling headphones with exceptional sound quality. Features 30-hour battery life and industry-leading ANC technology for immersive listening experience.'},
+                {'name': 'Bose QuietComfort 45', 'price': '₹28,000 - ₹35,000', 'rating': '4.6',
+                 'desc': 'Comfortable over-ear headphones with excellent noise cancellation. Known for superior comfort during long listening sessions and crystal-clear audio.'},
+                {'name': 'JBL Tune 760NC', 'price': '₹5,000 - ₹8,000', 'rating': '4.3',
+                 'desc': 'Affordable wireless headphones with active noise cancellation. Great value for money with good sound quality and comfortable fit.'},
+            ],
+            'laptop': [
+                {'name': 'HP Pavilion 15', 'price': '₹45,000 - ₹60,000', 'rating': '4.4',
+                 'desc': 'Reliable laptop for everyday computing tasks. Features modern processors, good display, and solid build quality perfect for students and professionals.'},
+                {'name': 'Dell Inspiron 15', 'price': '₹50,000 - ₹65,000', 'rating': '4.5',
+                 'desc': 'Versatile laptop suitable for work and entertainment. Known for durability and excellent customer support with good performance.'},
+            ],
+            'phone': [
+                {'name': 'Samsung Galaxy S23', 'price': '₹60,000 - ₹80,000', 'rating': '4.6',
+                 'desc': 'Flagship smartphone with excellent camera system and powerful performance. Premium design and display quality with long-lasting battery.'},
+                {'name': 'OnePlus 11', 'price': '₹50,000 - ₹65,000', 'rating': '4.5',
+                 'desc': 'High-performance smartphone with fast charging and smooth user experience. Great for gaming and photography enthusiasts.'},
+            ],
+        }
+        
+        # Curated picks for the query's category
+        products = product_templates.get(parsed.category, [])
+        
+        # If no match, create generic products
+        if not products:
+            products = [
+                {'name': f'{query.title()} - Premium Option', 'price': price_range or 'Check website', 'rating': '4.5',
+                 'desc': f'High-quality {query} option with excellent features and customer satisfaction. Available on major e-commerce platforms with secure payment and reliable delivery.'},
+                {'name': f'{query.title()} - Standard Option', 'price': price_range or 'Check website', 'rating': '4.3',
+                 'desc': f'Well-balanced {query} option offering great value. Popular choice among customers with positive reviews and good build quality.'},
+            ]
+        
+        # Format products with links and images
+        formatted_products = []
+        for product in products[:5]:
+            product_name = product['name']
+            # Try to get product image from Unsplash or use placeholder
+            image_url = f"https://source.unsplash.com/400x400/?{quote(product_name.split()[0] if product_name.split() else query)}"
+            
+            formatted_products.append({
+                'name': product_name,
+                'price': product['price'],
+                'description': product['desc'],
+                'rating': product['rating'],
+                'flipkart_link': f"https://www.flipkart.com/search?q={quote(product_name)}",
+                'amazon_link': f"https://www.amazon.in/s?k={quote(product_name)}",
+                'image': image_url,
+                'inStock': True,
+                'source': 'Curated'
+            })
+        
+        return formatted_products
+        
+    except Exception as e:
+        search_log.warning("web search failed", extra={"error": str(e)})
+        return None
+
+
+def create_fallback_products(query):
+    """Create fallback product results with search links"""
+    products = []
+    query_encoded = quote(query)
+    
+    # Create 3 product suggestions with search links
+    for i in range(3):
+        products.append({
+            "name": f"{query.title()} - Option {i+1}",
+            "price": "Check website",
+            "description": f"Find the best {query} options on e-commerce platforms. Browse through various models and compare prices.",
+            "image": f"https://source.unsplash.com/400x400/?{quote(query)}",
+            "flipkart_link": f"https://www.flipkart.com/search?q={query_encoded}",
+            "amazon_link": f"https://www.amazon.in/s?k={query_encoded}",
+            "rating": "4.0+",
+            "inStock": True,
+            "source": "Search"
+        })
+    
+    return products
+
+
+def offline_fallback_products(query):
+    """Products that need no network: curated templates, then plain search links"""
+    # Fallback to web-based product search
+    products = search_products_web(query)
+    if products:
+        return products
+    
+    # Ultimate fallback
+    return create_fallback_products(query)
+
+
+def fallback_result(query, products):
+    """Fallback products (local catalog or DuckDuckGo) for the query, offline suggestions when there are none"""
+    return filter_products_for_query(products or offline_fallback_products(query), query)
+
+
+def generate_template_response(user_message, products):
+    """Generate a helpful response without using paid APIs"""
+    if products:
+        response = f"Great! I found some excellent options for '{user_message}':\n\n"
+        for i, product in enumerate(products[:3], 1):
+            response += f"**{product.get('name', 'Product')}**\n"
+            response += f"Price: {product.get('price', 'Check website')}\n"
+            response += f"Rating: {product.get('rating', 'N/A')} ⭐\n"
+            if product.get("source"):
+                response += f"Source: {product['source']}\n"
+            response += f"{product.get('description', '')}\n\n"
+        response += "💡 **Tip:** Click the 'Buy on Flipkart' or 'Buy on Amazon' buttons below each product to view more details, compare prices, and make a purchase!\n\n"
+        response += "All products come with secure payment options and reliable delivery. Happy shopping! 🛍️"
+    else:
+        response = f"I'd be happy to help you find the best '{user_message}' options!\n\n"
+        response += "Please try searching with more specific terms, or browse our product categories. "
+        response += "You can click on the product links to explore options on Flipkart and Amazon.\n\n"
+        response += "How else can I assist you today? 😊"
+    
+    return response
+
+
+def log_search_results(user_message, found_products):
+    count_products_returned(found_products)
+    chat_log.info("search results", extra={"query": user_message, "count": len(found_products)})
+    if found_products and chat_log.isEnabledFor(logging.DEBUG):
+        chat_log.debug("products found", extra={"products": [p["name"] for p in found_products]})
+
+
+def build_chat_reply(user_message, found_products, timed_out, response_text, session_id=None):
+    """JSON body for /api/chat once products and the LLM/template reply are ready"""
+    if not response_text:
+        # Use free template response
+        response_text = generate_template_response(user_message, found_products)
+    
+    return {
+        'response': response_text,
+        'products': with_proxied_images(found_products[:5]),
+        'timed_out_sources': timed_out,
+        'intent': 'product_search',
+        'session_id': session_id,
+    }
+
+
+def build_chat_error_reply(error_message):
+    """JSON body for /api/chat when the pipeline raised"""
+    chat_log.error("chat request failed", extra={"error": error_message})
+    
+    # Check for quota exceeded error
+    if '429' in error_message or 'quota' in error_message.lower() or 'Quota exceeded' in error_message:
+        return {
+            'response': '⚠️ API Quota Exceeded: You have reached the free tier limit (2 requests). Please wait a few minutes and try again, or use a different API key with higher limits.',
+            'error': 'quota_exceeded',
+            'products': []
+        }
+    # Check for API key errors
+    elif '401' in error_message or '403' in error_message or 'API key' in error_message:
+        return {
+            'response': '⚠️ API Key Error: Please check your DeepSeek API key in the .env file.',
+            'error': 'api_key_error',
+            'products': []
+        }
+    # Generic error
+    else:
+        return {
+            'response': f'Sorry, I could not process your request. Error: {error_message[:100]}',
+            'error': 'generic_error',
+            'products': []
+        }
+
+
+def sse_event(event, data):
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+SSE_HEADERS = {
+    "Cache-Control": "no-cache",
+    # Stop reverse proxies (nginx) from buffering the stream
+    "X-Accel-Buffering": "no",
+}
+
+
+def error_event(exc):
+    """SSE event for a chat stream that raised"""
+    return sse_event("error", build_chat_error_reply(str(exc)))
+
+
+def intent_events(intent, user_message, session_id=None):
+    """SSE events answering a message the intent gate kept away from search"""
+    for chunk in template_response_chunks(intent_reply(intent, user_message)):
+        yield sse_event("token", {"text": chunk})
+    yield sse_event("done", {"timed_out_sources": [], "intent": intent, "session_id": session_id})
+
+
+class ChatTurn:
+    """One product-search chat message, from begin_chat_turn to its reply or SSE events
+
+    The servers run the searches and DeepSeek calls and hand the results in; begin and finish
+    read and write the session store, so asgi.py calls them in a worker thread.
+    """
+
+    def __init__(self, user_message, turn, max_products=5):
+        self.user_message = user_message
+        self.turn = turn
+        self.max_products = max_products
+        # The session's earlier results refined for this message; empty means search for query
+        self.products = turn["products"]
+        self.timed_out = []
+        self.session_id = None
+        self._shown = 0
+
+    @classmethod
+    def begin(cls, session_id, user_message, max_products=5):
+        return cls(user_message, begin_chat_turn(session_id, user_message), max_products)
+
+    @property
+    def query(self):
+        return self.turn["query"]
+
+    def finish(self):
+        """Log the results and save the session; returns the session id for the reply"""
+        log_search_results(self.user_message, self.products)
+        self.session_id = finish_chat_turn(self.turn, self.products)
+        return self.session_id
+
+    def reply(self, response_text):
+        """JSON body for /api/chat"""
+        return build_chat_reply(self.user_message, self.products, self.timed_out, response_text, self.session_id)
+
+    def products_event(self, source=None):
+        """SSE cards for products already known, e.g. a follow-up refined from the session"""
+        return sse_event("products", {
+            "source": source,
+            "products": with_proxied_images(self.products[:self.max_products]),
+        })
+
+    def source_event(self, source, products):
+        """SSE cards for one marketplace's results (None for a timeout); None when there is nothing new to show"""
+        if products is None:
+            self.timed_out.append(source)
+            return None
+        products = marketplace_products({source: products}, self.query)
+        self.products.extend(products)
+        cards = products[:self.max_products - self._shown]
+        if not cards:
+            return None
+        self._shown += len(cards)
+        return sse_event("products", {"source": source, "products": with_proxied_images(cards)})
+
+    def fallback_event(self, products):
+        """SSE cards for fallback_products' results, which replace the empty marketplace results"""
+        self.products = products
+        return self.products_event(products[0].get("source") if products else None)
+
+    def token_event(self, text):
+        return sse_event("token", {"text": text})
+
+    def template_events(self):
+        """The template reply as token events, for when DeepSeek streamed nothing"""
+        for chunk in template_response_chunks(generate_template_response(self.user_message, self.products)):
+            yield self.token_event(chunk)
+
+    def done_event(self):
+        return sse_event("done", {
+            "timed_out_sources": self.timed_out, "intent": "product_search", "session_id": self.session_id,
+        })
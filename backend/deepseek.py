@@ -0,0 +1,409 @@
+"""DeepSeek chat completions: prompt budgeting, the reply cache, and blocking and streamed calls."""
+import json
+import os
+import re
+import threading
+import time
+from concurrent.futures import Future
+
+from caching import ResultCache, SingleFlight, request_fingerprint
+from logs import config_log, deepseek_log
+from metrics import llm_tokens, stage_seconds, timed_stage
+from outbound import CircuitOpenError, http_request
+
+# E-commerce focused system prompt
+SYSTEM_PROMPT = """You are a professional e-commerce customer service assistant. Your role is to:
+
+1. Help customers find products they're looking for on e-commerce platforms (Flipkart, Amazon, etc.)
+2. Provide detailed product information (features, specifications, pricing)
+3. Answer questions about products, shipping, returns, and policies
+4. Assist with product recommendations based on customer needs
+5. Handle customer inquiries professionally
+
+IMPORTANT: 
+- Focus ONLY on e-commerce products and shopping assistance
+- When products are found, provide helpful information about them
+- Always be friendly, helpful, and professional
+- If asked about non-e-commerce topics, politely redirect to product-related questions"""
+
+# Configure DeepSeek API
+DEEPSEEK_API_KEY = os.getenv('DEEPSEEK_API_KEY', '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')
+DEEPSEEK_MODEL = os.getenv("DEEPSEEK_MODEL", "deepseek/deepseek-chat-v3.1:free")
+DEEPSEEK_API_BASE = os.getenv("DEEPSEEK_API_BASE", "https://api.skylark.com/v1")
+USE_DEEPSEEK = False
+
+# DeepSeek generation config
+deepseek_config = {
+    "temperature": float(os.getenv("DEEPSEEK_TEMPERATURE", "0.7")),
+    # Ceiling for the completion; each request asks for min_tokens plus tokens_per_product
+    # for every product left in the prompt
+    "max_tokens": int(os.getenv("DEEPSEEK_MAX_TOKENS", "1024")),
+    "min_tokens": int(os.getenv("DEEPSEEK_MIN_TOKENS", "192")),
+    "tokens_per_product": int(os.getenv("DEEPSEEK_TOKENS_PER_PRODUCT", "110")),
+    # Estimated prompt tokens (system prompt included) the product context is fitted into
+    "input_token_budget": int(os.getenv("DEEPSEEK_INPUT_TOKEN_BUDGET", "600")),
+    "prompt_products": int(os.getenv("DEEPSEEK_PROMPT_PRODUCTS", "5")),
+    "description_chars": int(os.getenv("DEEPSEEK_DESCRIPTION_CHARS", "160")),
+    "message_chars": int(os.getenv("DEEPSEEK_MESSAGE_CHARS", "500")),
+}
+
+if DEEPSEEK_API_KEY and DEEPSEEK_API_KEY.strip():
+    USE_DEEPSEEK = True
+    config_log.info("DeepSeek API configured", extra={
+        "model": DEEPSEEK_MODEL,
+        "api_base": DEEPSEEK_API_BASE,
+        "api_key": f"{DEEPSEEK_API_KEY[:20]}...{DEEPSEEK_API_KEY[-10:]}",
+    })
+else:
+    config_log.info("Using free product search APIs (no API key required)")
+    USE_DEEPSEEK = False
+
+
+# Word pieces roughly as a BPE tokenizer splits them: long words and numbers span several tokens
+_TOKEN_PIECES = re.compile(r"[A-Za-z]+|\d+|[^\sA-Za-z\d]")
+
+
+def estimate_tokens(text):
+    """Approximate token count of text; errs high for non-English text and symbols"""
+    count = 0
+    for piece in _TOKEN_PIECES.findall(text):
+        if piece[0].isdigit():
+            count += 1 + (len(piece) - 1) // 3
+        elif piece[0].isascii() and piece[0].isalpha():
+            count += 1 + (len(piece) - 1) // 6
+        else:
+            count += 1
+    return count
+
+
+def truncate_text(text, limit):
+    """Collapse whitespace and cut text at a word boundary within limit characters"""
+    text = " ".join(str(text).split())
+    if len(text) <= limit:
+        return text
+    cut = text[:limit].rsplit(" ", 1)[0] if " " in text[:limit] else text[:limit]
+    return cut.rstrip(" ,.;:-") + "…"
+
+
+def describe_product(idx, product, description_chars):
+    """One prompt line per product: name | price | rating | source | trimmed description"""
+    name = truncate_text(product.get("name") or "Product", 120)
+    fields = [f"{idx}. {name}", str(product.get("price") or "price on site")]
+    if product.get("rating"):
+        fields.append(f"{product['rating']}★")
+    if product.get("source"):
+        fields.append(str(product["source"]))
+    description = product.get("description") or ""
+    # Scraped cards often repeat the title as the description
+    if description_chars and description and not name.startswith(truncate_text(description, 60).rstrip("…")):
+        fields.append(truncate_text(description, description_chars))
+    return " | ".join(fields)
+
+
+def fit_product_context(products, token_budget):
+    """Product lines that fit token_budget, trimming descriptions before dropping products.
+
+    Returns (block, product count). Links are left out: the UI shows Flipkart/Amazon buttons under
+    every product, so URLs would only cost tokens.
+    """
+    products = products[:deepseek_config["prompt_products"]]
+    description_chars = deepseek_config["description_chars"]
+    for count in range(len(products), 0, -1):
+        for chars in (description_chars, description_chars // 2, 0):
+            block = "\n".join(
+                describe_product(idx, product, chars) for idx, product in enumerate(products[:count], start=1)
+            )
+            if estimate_tokens(block) <= token_budget:
+                return block, count
+    if products:
+        return describe_product(1, products[0], 0), 1
+    return "No exact matches found yet.", 0
+
+
+def build_deepseek_request(user_message, products):
+    """Chat completion URL, payload and headers for a shopper message and its product findings"""
+    user_message = truncate_text(user_message, deepseek_config["message_chars"])
+    header = f"Shopper asked: {user_message}\n\nMarketplace results (name | price | rating | source | details):\n"
+    fixed_tokens = estimate_tokens(SYSTEM_PROMPT) + estimate_tokens(header) + 48  # 48 covers the instructions
+    product_block, product_count = fit_product_context(
+        products, deepseek_config["input_token_budget"] - fixed_tokens
+    )
+
+    # Short answers for short contexts: fewer output tokens is most of the latency saved
+    max_tokens = min(
+        deepseek_config["max_tokens"],
+        deepseek_config["min_tokens"] + deepseek_config["tokens_per_product"] * product_count,
+    )
+    messages = [
+        {"role": "system", "content": SYSTEM_PROMPT},
+        {
+            "role": "user",
+            "content": (
+                f"{header}{product_block}\n\n"
+                f"Reply in under {int(max_tokens * 0.6)} words: recommend the best matches, compare price "
+                "and key features, point to the Buy on Flipkart/Amazon buttons under each product, and "
+                "suggest next steps or alternatives if nothing fits."
+            ),
+        },
+    ]
+
+    payload = {
+        "model": DEEPSEEK_MODEL,
+        "messages": messages,
+        "temperature": deepseek_config["temperature"],
+        "max_tokens": max_tokens,
+    }
+
+    headers = {
+        "Authorization": f"Bearer {DEEPSEEK_API_KEY}",
+        "Content-Type": "application/json",
+    }
+
+    return f"{DEEPSEEK_API_BASE}/chat/completions", payload, headers
+
+
+llm_token_stats = {"completions": 0, "prompt_tokens": 0, "completion_tokens": 0, "estimated": 0}
+_llm_token_lock = threading.Lock()
+
+
+def record_llm_usage(payload, reply, usage=None):
+    """Count the tokens one completion spent, from the API's usage block or estimated from the text"""
+    usage = usage or {}
+    estimated = not usage.get("prompt_tokens")
+    if estimated:
+        prompt_tokens = sum(estimate_tokens(message["content"]) for message in payload["messages"])
+        completion_tokens = estimate_tokens(reply or "")
+    else:
+        prompt_tokens = usage["prompt_tokens"]
+        completion_tokens = usage.get("completion_tokens") or 0
+    llm_tokens.observe(prompt_tokens, kind="prompt")
+    llm_tokens.observe(completion_tokens, kind="completion")
+    with _llm_token_lock:
+        llm_token_stats["completions"] += 1
+        llm_token_stats["prompt_tokens"] += prompt_tokens
+        llm_token_stats["completion_tokens"] += completion_tokens
+        llm_token_stats["estimated"] += estimated
+    deepseek_log.info("completion tokens", extra={
+        "prompt_tokens": prompt_tokens,
+        "completion_tokens": completion_tokens,
+        "max_tokens": payload.get("max_tokens"),
+        "estimated": estimated,
+    })
+
+
+def llm_token_snapshot():
+    with _llm_token_lock:
+        return dict(llm_token_stats)
+
+
+def parse_deepseek_result(result):
+    """Extract the reply text from a chat completion payload, or None"""
+    deepseek_log.debug("API response received", extra={"keys": list(result.keys())})
+    if "error" in result:
+        deepseek_log.warning("DeepSeek API error in response", extra={"error": result.get("error", {})})
+        return None
+    if "choices" in result and len(result["choices"]) > 0:
+        content = result["choices"][0].get("message", {}).get("content", "")
+        if content:
+            deepseek_log.debug("DeepSeek response generated", extra={"chars": len(content)})
+            return content.strip()
+        else:
+            deepseek_log.warning("No content in API response choices")
+    else:
+        deepseek_log.warning("No choices in API response", extra={"keys": list(result.keys())})
+    return None
+
+
+def log_deepseek_failure(exc):
+    error_msg = str(exc).lower()
+    if isinstance(exc, CircuitOpenError):
+        deepseek_log.info("DeepSeek circuit open, using template response")
+    elif "429" in error_msg or "quota" in error_msg:
+        deepseek_log.warning("DeepSeek quota exceeded, switching to template response")
+    else:
+        deepseek_log.warning("DeepSeek response error", extra={"error": str(exc)})
+
+
+# DeepSeek reply cache: identical prompts (same model, settings, question and product context)
+# are answered from memory instead of a new completion. With SHARED_CACHE_PATH set, replies are
+# also kept in the shared store, so they survive restarts and are shared between workers.
+llm_cache_config = {
+    "enabled": os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "ttl": int(os.getenv("LLM_CACHE_TTL_SECONDS", "3600")),
+    "max_entries": int(os.getenv("LLM_CACHE_MAX_ENTRIES", "1024")),
+    "max_bytes": int(os.getenv("LLM_CACHE_MAX_BYTES", str(8 * 1024 * 1024))),
+}
+
+llm_cache = ResultCache(llm_cache_config["max_entries"], llm_cache_config["max_bytes"], namespace="llm")
+
+
+def llm_cache_key(payload):
+    """Fingerprint of everything that shapes a completion; stream mode is left out on purpose"""
+    return request_fingerprint(
+        payload["model"],
+        payload.get("temperature"),
+        payload.get("max_tokens"),
+        payload["messages"],
+    )
+
+
+def get_cached_llm_reply(key):
+    """Cached reply for a request fingerprint: memory first, then the shared store"""
+    if not llm_cache_config["enabled"]:
+        return None
+    return llm_cache.get(key)
+
+
+def cache_llm_reply(key, reply):
+    if llm_cache_config["enabled"] and reply:
+        llm_cache.set(key, reply, llm_cache_config["ttl"])
+
+
+def llm_cache_snapshot():
+    return {"enabled": llm_cache_config["enabled"], **llm_cache.snapshot()}
+
+
+# Identical DeepSeek requests in flight share one completion
+llm_flights = SingleFlight("llm")
+
+
+def _post_deepseek(api_url, payload, headers):
+    try:
+        deepseek_log.debug("calling DeepSeek", extra={"url": api_url})
+        
+        response = http_request(
+            "POST",
+            api_url,
+            "deepseek",
+            json=payload,
+            headers=headers,
+        )
+
+        deepseek_log.debug("DeepSeek responded", extra={"status": response.status_code})
+        
+        if response.status_code == 200:
+            result = response.json()
+            reply = parse_deepseek_result(result)
+            if reply:
+                record_llm_usage(payload, reply, result.get("usage"))
+            return reply
+        else:
+            try:
+                error_data = response.json()
+                deepseek_log.warning("DeepSeek API error", extra={"status": response.status_code, "error": error_data})
+            except:
+                deepseek_log.warning(
+                    "DeepSeek API error", extra={"status": response.status_code, "error": response.text[:200]}
+                )
+
+    except Exception as exc:
+        log_deepseek_failure(exc)
+
+    return None
+
+
+def generate_deepseek_response(user_message, products):
+    """Create a DeepSeek-powered response when API access is available."""
+    if not USE_DEEPSEEK or not DEEPSEEK_API_KEY:
+        deepseek_log.debug(
+            "DeepSeek not available", extra={"enabled": USE_DEEPSEEK, "has_api_key": bool(DEEPSEEK_API_KEY)}
+        )
+        return None
+
+    api_url, payload, headers = build_deepseek_request(user_message, products)
+    cache_key = llm_cache_key(payload)
+    cached = get_cached_llm_reply(cache_key)
+    if cached is not None:
+        deepseek_log.debug("DeepSeek reply served from cache")
+        return cached
+
+    deepseek_log.debug("requesting completion", extra={"model": DEEPSEEK_MODEL})
+    # Identical prompts already in flight wait for that completion instead of sending their own
+    future, started = llm_flights.join(request_fingerprint(api_url, payload), Future)
+    if started:
+        try:
+            with timed_stage("llm", "deepseek"):
+                reply = _post_deepseek(api_url, payload, headers)
+            cache_llm_reply(cache_key, reply)
+            future.set_result(reply)
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+    return future.result()
+
+
+def parse_deepseek_stream_line(line):
+    """(reply text, end) for one streamed SSE line
+
+    text is "" for keep-alives. end is None while the stream goes on, "complete" at [DONE] or a
+    chunk with a finish_reason, and "failed" at an error chunk.
+    """
+    if not line or not line.startswith("data:"):
+        return "", None
+    data = line[len("data:"):].strip()
+    if data == "[DONE]":
+        return "", "complete"
+    try:
+        chunk = json.loads(data)
+    except ValueError:
+        return "", None
+    if "error" in chunk:
+        deepseek_log.warning("DeepSeek API error in stream", extra={"error": chunk.get("error", {})})
+        return "", "failed"
+    choice = (chunk.get("choices") or [{}])[0]
+    return (choice.get("delta") or {}).get("content") or "", "complete" if choice.get("finish_reason") else None
+
+
+def stream_deepseek_response(user_message, products):
+    """Yield DeepSeek reply text as it is generated; yields nothing when the API is unavailable"""
+    if not USE_DEEPSEEK or not DEEPSEEK_API_KEY:
+        return
+
+    try:
+        api_url, payload, headers = build_deepseek_request(user_message, products)
+        cache_key = llm_cache_key(payload)
+        cached = get_cached_llm_reply(cache_key)
+        if cached is not None:
+            yield from template_response_chunks(cached)
+            return
+
+        payload["stream"] = True
+        started = time.perf_counter()
+        response = http_request(
+            "POST",
+            api_url,
+            "deepseek",
+            json=payload,
+            headers=headers,
+            stream=True,
+        )
+        with response:
+            if response.status_code != 200:
+                deepseek_log.warning(
+                    "DeepSeek API error", extra={"status": response.status_code, "error": response.text[:200]}
+                )
+                return
+            parts = []
+            completed = False
+            for raw_line in response.iter_lines():
+                delta, end = parse_deepseek_stream_line(raw_line.decode("utf-8", "replace"))
+                if delta:
+                    parts.append(delta)
+                    yield delta
+                if end is not None:
+                    completed = end == "complete"
+                    break
+            stage_seconds.observe(time.perf_counter() - started, stage="llm_stream", source="deepseek")
+            # Only complete replies are cached; /api/chat reuses them as well
+            if completed:
+                reply = "".join(parts).strip()
+                record_llm_usage(payload, reply)
+                cache_llm_reply(cache_key, reply)
+
+    except Exception as exc:
+        log_deepseek_failure(exc)
+
+
+def template_response_chunks(text):
+    """Split a template reply into word-sized chunks so it streams like LLM tokens"""
+    return re.findall(r"\s*\S+\s*", text)
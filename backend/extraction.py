@@ -0,0 +1,409 @@
+"""Product extraction from Flipkart and Amazon search pages through declarative layout profiles."""
+import importlib.util
+import os
+import re
+import threading
+from urllib.parse import urljoin
+
+from bs4 import BeautifulSoup, SoupStrainer
+
+from logs import config_log
+from metrics import Counter
+
+# Optional faster HTML parsers (see PARSER_BACKENDS); BeautifulSoup loads lxml itself
+lxml_available = importlib.util.find_spec("lxml") is not None
+
+try:
+    from selectolax.lexbor import LexborHTMLParser as SelectolaxHTMLParser
+except ImportError:
+    SelectolaxHTMLParser = None
+
+# HTML extraction backend for marketplace pages: auto, html.parser, lxml or selectolax
+HTML_PARSER_BACKEND = os.getenv("HTML_PARSER_BACKEND", "auto")
+
+
+def _normalize_price(text):
+    if not text:
+        return "Check website"
+    cleaned = re.sub(r"[^\d.,₹$]", "", text)
+    if cleaned:
+        if cleaned.startswith("₹"):
+            return cleaned if "₹" in text else f"₹{cleaned}"
+        if cleaned.startswith("$"):
+            return cleaned
+        return f"₹{cleaned}"
+    return "Check website"
+
+
+def _clean_image_url(image_url):
+    image_url = image_url or ""
+    if image_url.startswith("//"):
+        image_url = "https:" + image_url
+    return image_url
+
+
+def _flipkart_product(name, href, price_text, rating_text, image_url, description):
+    return {
+        "name": name,
+        "price": _normalize_price(price_text),
+        "rating": rating_text or "4.0",
+        "description": description
+        or "Top listing from Flipkart curated for your search.",
+        "image": _clean_image_url(image_url),
+        "flipkart_link": urljoin("https://www.flipkart.com", href) if href else "",
+        "amazon_link": "",
+        "source": "Flipkart",
+        "inStock": True,
+    }
+
+
+def _amazon_product(name, href, price_text, rating_text, image_url, description):
+    return {
+        "name": name,
+        "price": _normalize_price(price_text),
+        "rating": rating_text.split()[0] if rating_text else "4.0",
+        "description": description or "Popular Amazon listing tailored to your request.",
+        "image": _clean_image_url(image_url),
+        "flipkart_link": "",
+        "amazon_link": urljoin("https://www.amazon.in", href) if href else "",
+        "source": "Amazon",
+        "inStock": True,
+    }
+
+
+# Declarative extraction profiles
+def extraction_field(*selectors, attrs=None, join=None, optional=False):
+    """One card field: CSS selectors tried in order inside the card (None reads the marker itself).
+    attrs takes the first non-empty attribute instead of the text; join=(count, separator) joins
+    the text of the first count matches. Missing optional fields do not count as degraded."""
+    return {"selectors": selectors, "attrs": attrs, "join": join, "optional": optional}
+
+
+FLIPKART_CARD_FIELDS = {
+    "name": extraction_field(None),
+    "href": extraction_field(None, attrs=("href",)),
+    "price": extraction_field("div._30jeq3"),
+    "rating": extraction_field("div._3LWZlK"),
+    "image": extraction_field("img", attrs=("src", "data-src")),
+    "description": extraction_field("ul._1xgFaf li", join=(3, "; "), optional=True),
+}
+
+# Per marketplace, the layouts it serves in priority order. A layout is recognised by its
+# marker (a simple tag.class or tag[attr="value"] selector); card is the tag of the element
+# that holds the card's fields, climbed to from the marker, or None when the marker is the card.
+EXTRACTION_PROFILES = {
+    "Flipkart": {
+        "build": lambda f: _flipkart_product(
+            f["name"], f["href"], f["price"], f["rating"], f["image"], f["description"]
+        ),
+        "layouts": (
+            {"layout": "grid", "marker": "a._1fQZEK", "card": "div", "fields": FLIPKART_CARD_FIELDS},
+            # Fashion and accessories
+            {"layout": "list", "marker": "a.s1Q9rs", "card": "div", "fields": FLIPKART_CARD_FIELDS},
+        ),
+    },
+    "Amazon": {
+        "build": lambda f: _amazon_product(
+            f["name"],
+            f["href"],
+            f["price_whole"] + f["price_fraction"] if f["price_whole"] else "",
+            f["rating"],
+            f["image"],
+            f["description"],
+        ),
+        "layouts": (
+            {
+                "layout": "search-result",
+                "marker": 'div[data-component-type="s-search-result"]',
+                "card": None,
+                "fields": {
+                    # Newer result cards put the h2 inside the link instead of the link inside the h2
+                    "name": extraction_field("h2 a span", "h2 span"),
+                    "href": extraction_field("h2 a", 'a.a-link-normal[href*="/dp/"]', attrs=("href",)),
+                    "price_whole": extraction_field("span.a-price span.a-price-whole"),
+                    "price_fraction": extraction_field("span.a-price span.a-price-fraction", optional=True),
+                    "rating": extraction_field("span.a-icon-alt"),
+                    "image": extraction_field("img.s-image", attrs=("src", "data-src")),
+                    "description": extraction_field(
+                        "div.a-section.a-spacing-small.a-spacing-top-small span.a-text-normal",
+                        join=(2, " "),
+                        optional=True,
+                    ),
+                },
+            },
+        ),
+    },
+}
+
+_MARKER_SELECTOR = re.compile(r'^([a-z][a-z0-9]*)((?:\.[\w-]+)*)(?:\[([\w-]+)="([^"]*)"\])?$')
+
+
+def _marker_predicate(selector):
+    """Compile a profile marker into a test run on the nodes the combined marker scan returns"""
+    match = _MARKER_SELECTOR.match(selector)
+    if not match:
+        raise ValueError(f"unsupported extraction marker {selector!r}")
+    tag, classes, attr, value = match.groups()
+    classes = frozenset(classes.split(".")[1:])
+
+    def matches(nodes, node):
+        return (
+            nodes.tag(node) == tag
+            and classes <= nodes.classes(node)
+            and (attr is None or nodes.attr(node, attr) == value)
+        )
+
+    return matches
+
+
+for _spec in EXTRACTION_PROFILES.values():
+    _spec["markers"] = ", ".join(profile["marker"] for profile in _spec["layouts"])
+    for _profile in _spec["layouts"]:
+        _profile["matches"] = _marker_predicate(_profile["marker"])
+
+
+class _Bs4Nodes:
+    """Node access for BeautifulSoup trees, as used by the extraction profiles"""
+
+    select = staticmethod(lambda node, css: node.select(css))
+    first = staticmethod(lambda node, css: node.select_one(css))
+    text = staticmethod(lambda node: node.get_text(strip=True))
+    tag = staticmethod(lambda node: node.name)
+    classes = staticmethod(lambda node: frozenset(node.get("class") or ()))
+    parent = staticmethod(lambda node: node.parent)
+
+    @staticmethod
+    def attr(node, *names):
+        for name in names:
+            value = node.get(name)
+            if value:
+                return value
+        return ""
+
+
+class _SelectolaxNodes:
+    """Node access for selectolax (lexbor) trees, as used by the extraction profiles"""
+
+    select = staticmethod(lambda node, css: node.css(css))
+    first = staticmethod(lambda node, css: node.css_first(css))
+    text = staticmethod(lambda node: node.text(strip=True))
+    tag = staticmethod(lambda node: node.tag)
+    classes = staticmethod(lambda node: frozenset((node.attributes.get("class") or "").split()))
+    parent = staticmethod(lambda node: node.parent)
+
+    @staticmethod
+    def attr(node, *names):
+        for name in names:
+            value = node.attributes.get(name)
+            if value:
+                return value
+        return ""
+
+
+def _card_scope(nodes, marker, card_tag):
+    if card_tag is None:
+        return marker
+    scope = marker
+    for _ in range(3):
+        if scope is not None and nodes.tag(scope) != card_tag:
+            scope = nodes.parent(scope)
+    # Lookups stay inside the card subtree; there is no document-wide find_next fallback
+    return scope or marker
+
+
+def _read_field(nodes, spec, marker, scope):
+    """(value, index of the selector that supplied it, or None when every selector missed)"""
+    for index, selector in enumerate(spec["selectors"]):
+        if spec["join"]:
+            count, separator = spec["join"]
+            value = separator.join(nodes.text(node) for node in nodes.select(scope, selector)[:count])
+        else:
+            node = marker if selector is None else nodes.first(scope, selector)
+            if node is None:
+                continue
+            value = nodes.attr(node, *spec["attrs"]) if spec["attrs"] else nodes.text(node)
+        if value:
+            return value, index
+    return "", None
+
+
+def extract_with_profiles(source, root, nodes, limit):
+    """Products from one parsed page, plus a report of how the extraction went.
+
+    A single scan for the markers of every layout of the source finds the cards; the first
+    layout in priority order with cards wins, and each card's fields are read in its own subtree.
+    """
+    spec = EXTRACTION_PROFILES[source]
+    cards = {}
+    for node in nodes.select(root, spec["markers"]):
+        for profile in spec["layouts"]:
+            if profile["matches"](nodes, node):
+                cards.setdefault(profile["layout"], []).append(node)
+                break
+    report = {"layout": None, "cards": 0, "degraded_cards": 0, "degraded_fields": {}}
+    profile = next((p for p in spec["layouts"] if p["layout"] in cards), None)
+    if profile is None:
+        return [], report
+    report["layout"] = profile["layout"]
+
+    fields = profile["fields"]
+    degraded_fields = report["degraded_fields"]
+    products = []
+    seen_names = set()
+    for marker in cards[profile["layout"]]:
+        scope = _card_scope(nodes, marker, profile["card"])
+        name, name_index = _read_field(nodes, fields["name"], marker, scope)
+        if not name or name in seen_names:
+            continue
+        seen_names.add(name)
+
+        values = {"name": name}
+        degraded = []
+        if name_index:
+            degraded.append(("name", "fallback"))
+        for field, field_spec in fields.items():
+            if field == "name":
+                continue
+            values[field], index = _read_field(nodes, field_spec, marker, scope)
+            if index is None:
+                if not field_spec["optional"]:
+                    degraded.append((field, "missing"))
+            elif index:
+                degraded.append((field, "fallback"))
+        for key in degraded:
+            degraded_fields[key] = degraded_fields.get(key, 0) + 1
+        report["cards"] += 1
+        report["degraded_cards"] += bool(degraded)
+
+        products.append(spec["build"](values))
+        if len(products) >= limit:
+            break
+    return products, report
+
+
+extraction_pages = Counter(
+    "assistant_extraction_pages_total",
+    "Marketplace pages parsed, by the extraction profile (layout) that matched; none when no layout did.",
+    labels=("source", "layout"),
+)
+extraction_degraded_fields = Counter(
+    "assistant_extraction_degraded_fields_total",
+    "Card fields read from a fallback selector or left empty, by source, field and kind (fallback, missing).",
+    labels=("source", "field", "kind"),
+)
+extraction_stats = {
+    source: {"pages": 0, "unmatched_pages": 0, "layouts": {}, "degraded_fields": {}}
+    for source in EXTRACTION_PROFILES
+}
+_extraction_lock = threading.Lock()
+
+
+def record_extraction(source, report):
+    layout = report["layout"]
+    extraction_pages.inc(source=source, layout=layout or "none")
+    for (field, kind), count in report["degraded_fields"].items():
+        extraction_degraded_fields.inc(count, source=source, field=field, kind=kind)
+    with _extraction_lock:
+        stats = extraction_stats[source]
+        stats["pages"] += 1
+        if layout is None:
+            stats["unmatched_pages"] += 1
+            return
+        layout_stats = stats["layouts"].setdefault(layout, {"pages": 0, "cards": 0, "degraded_cards": 0})
+        layout_stats["pages"] += 1
+        layout_stats["cards"] += report["cards"]
+        layout_stats["degraded_cards"] += report["degraded_cards"]
+        for (field, kind), count in report["degraded_fields"].items():
+            kinds = stats["degraded_fields"].setdefault(field, {})
+            kinds[kind] = kinds.get(kind, 0) + count
+
+
+def extraction_snapshot():
+    with _extraction_lock:
+        return {
+            source: {
+                "pages": stats["pages"],
+                "unmatched_pages": stats["unmatched_pages"],
+                "layouts": {
+                    layout: {
+                        **counts,
+                        "degraded_rate": round(counts["degraded_cards"] / counts["cards"], 4) if counts["cards"] else 0.0,
+                    }
+                    for layout, counts in stats["layouts"].items()
+                },
+                "degraded_fields": {field: dict(kinds) for field, kinds in stats["degraded_fields"].items()},
+            }
+            for source, stats in extraction_stats.items()
+        }
+
+
+def _parse_with_profiles(source, root, nodes, limit):
+    products, report = extract_with_profiles(source, root, nodes, limit)
+    record_extraction(source, report)
+    return products
+
+
+# Card containers kept by the strained parsers; everything else on the page is never built
+AMAZON_CARD_STRAINER = SoupStrainer("div", attrs={"data-component-type": "s-search-result"})
+
+
+def _parse_flipkart_bs4(html, limit, features):
+    # Not strained like Amazon: some Flipkart layouts have no data-id card wrappers, and a
+    # strained parse that misses them would mean parsing the page a second time
+    return _parse_with_profiles("Flipkart", BeautifulSoup(html, features), _Bs4Nodes, limit)
+
+
+def _parse_amazon_bs4(html, limit, features):
+    if features == "html.parser":
+        return _parse_with_profiles("Amazon", BeautifulSoup(html, features), _Bs4Nodes, limit)
+    return _parse_with_profiles(
+        "Amazon", BeautifulSoup(html, features, parse_only=AMAZON_CARD_STRAINER), _Bs4Nodes, limit
+    )
+
+
+def _parse_flipkart_selectolax(html, limit):
+    return _parse_with_profiles("Flipkart", SelectolaxHTMLParser(html), _SelectolaxNodes, limit)
+
+
+def _parse_amazon_selectolax(html, limit):
+    return _parse_with_profiles("Amazon", SelectolaxHTMLParser(html), _SelectolaxNodes, limit)
+
+
+# Pluggable HTML extraction backends: name -> (flipkart parser, amazon parser)
+PARSER_BACKENDS = {
+    "html.parser": (
+        lambda html, limit: _parse_flipkart_bs4(html, limit, "html.parser"),
+        lambda html, limit: _parse_amazon_bs4(html, limit, "html.parser"),
+    ),
+}
+if lxml_available:
+    PARSER_BACKENDS["lxml"] = (
+        lambda html, limit: _parse_flipkart_bs4(html, limit, "lxml"),
+        lambda html, limit: _parse_amazon_bs4(html, limit, "lxml"),
+    )
+if SelectolaxHTMLParser is not None:
+    PARSER_BACKENDS["selectolax"] = (_parse_flipkart_selectolax, _parse_amazon_selectolax)
+
+
+def resolve_parser_backend(name=None):
+    """Pick the requested parser backend, falling back to the fastest one installed"""
+    name = name or HTML_PARSER_BACKEND
+    if name in PARSER_BACKENDS:
+        return name
+    if name != "auto":
+        config_log.warning(
+            "HTML parser backend unavailable, picking the fastest installed one", extra={"backend": name}
+        )
+    for candidate in ("selectolax", "lxml", "html.parser"):
+        if candidate in PARSER_BACKENDS:
+            return candidate
+
+
+def parse_flipkart_html(html, limit=5, backend=None):
+    """Extract product dicts from a Flipkart search results page."""
+    return PARSER_BACKENDS[resolve_parser_backend(backend)][0](html, limit)
+
+
+def parse_amazon_html(html, limit=5, backend=None):
+    """Extract product dicts from an Amazon search results page."""
+    return PARSER_BACKENDS[resolve_parser_backend(backend)][1](html, limit)
@@ -0,0 +1,300 @@
+"""On-disk cache of upstream HTTP responses with Cache-Control and conditional revalidation."""
+import hashlib
+import json
+import os
+import re
+import sqlite3
+import threading
+import time
+import zlib
+from email.utils import parsedate_to_datetime
+from urllib.parse import urlencode
+
+from logs import cache_log
+from outbound import http_request
+
+# Optional brotli: bodies are stored brotli-compressed when it is installed, zlib otherwise
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# On-disk HTTP cache for scraped pages and DuckDuckGo answers: honours Cache-Control, revalidates
+# with ETag/Last-Modified and keeps bodies compressed in SQLite under a size cap
+http_cache_config = {
+    "enabled": os.getenv("HTTP_CACHE_ENABLED", "true").lower() in ("1", "true", "yes"),
+    "path": os.getenv(
+        "HTTP_CACHE_PATH",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "http_cache.db"),
+    ),
+    "max_bytes": int(os.getenv("HTTP_CACHE_MAX_BYTES", str(64 * 1024 * 1024))),
+    # Largest single (uncompressed) body worth storing
+    "max_body_bytes": int(os.getenv("HTTP_CACHE_MAX_BODY_BYTES", str(4 * 1024 * 1024))),
+}
+
+HTTP_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS http_responses (
+    url TEXT PRIMARY KEY,
+    etag TEXT,
+    last_modified TEXT,
+    content_type TEXT,
+    expires_at REAL NOT NULL,
+    fetched_at REAL NOT NULL,
+    codec TEXT NOT NULL,
+    digest TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    body BLOB NOT NULL
+);
+CREATE INDEX IF NOT EXISTS http_responses_fetched_at ON http_responses (fetched_at);
+"""
+
+http_cache_stats = {
+    "fresh_hits": 0, "revalidations": 0, "not_modified": 0, "misses": 0,
+    "stored": 0, "uncacheable": 0, "evicted": 0, "errors": 0,
+}
+_http_cache_local = threading.local()
+_http_cache_lock = threading.Lock()
+
+
+class CachedResponse:
+    """Stored 200 response in the shape the scrapers read from requests/httpx responses"""
+
+    def __init__(self, url, content, content_type, digest, revalidated):
+        self.url = url
+        self.status_code = 200
+        self.content = content
+        self.headers = {"Content-Type": content_type or ""}
+        self.digest = digest
+        # False for a fresh hit: nothing was sent, so there is no outcome to report
+        self.revalidated = revalidated
+
+    @property
+    def text(self):
+        charset = re.search(r"charset=([\w-]+)", self.headers["Content-Type"])
+        return self.content.decode(charset.group(1) if charset else "utf-8", "replace")
+
+    def json(self):
+        return json.loads(self.content)
+
+
+def _http_cache_connection():
+    conn = getattr(_http_cache_local, "conn", None)
+    if conn is None:
+        os.makedirs(os.path.dirname(http_cache_config["path"]) or ".", exist_ok=True)
+        conn = sqlite3.connect(http_cache_config["path"], timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(HTTP_CACHE_SCHEMA)
+        _http_cache_local.conn = conn
+    return conn
+
+
+def _count_http_cache(stat, amount=1):
+    with _http_cache_lock:
+        http_cache_stats[stat] += amount
+        return http_cache_stats[stat]
+
+
+def http_cache_url(url, params=None):
+    """Cache key for a GET: the URL with its query parameters encoded in order"""
+    return f"{url}{'&' if '?' in url else '?'}{urlencode(params)}" if params else url
+
+
+def _cache_control(headers):
+    directives = {}
+    for part in (headers.get("Cache-Control") or "").lower().split(","):
+        name, _, value = part.strip().partition("=")
+        if name:
+            directives[name] = value.strip('"')
+    return directives
+
+
+def _freshness_seconds(headers):
+    """How long a response may be reused without revalidation; None when it must not be stored"""
+    directives = _cache_control(headers)
+    if "no-store" in directives or headers.get("Vary", "").strip() == "*":
+        return None
+    if "no-cache" in directives:
+        return 0.0
+    if "max-age" in directives:
+        try:
+            return max(0.0, float(directives["max-age"]))
+        except ValueError:
+            return 0.0
+    expires = headers.get("Expires")
+    if expires:
+        try:
+            date = parsedate_to_datetime(headers.get("Date")) if headers.get("Date") else None
+            expires_at = parsedate_to_datetime(expires)
+            now = date.timestamp() if date else time.time()
+            return max(0.0, expires_at.timestamp() - now)
+        except (TypeError, ValueError):
+            return 0.0
+    return 0.0
+
+
+def _compress_body(body):
+    if brotli is not None:
+        return "br", brotli.compress(body, quality=5)
+    return "zlib", zlib.compress(body, 6)
+
+
+def _decompress_body(codec, data):
+    if codec == "br":
+        return brotli.decompress(data)
+    return zlib.decompress(data)
+
+
+def http_cache_lookup(key):
+    """Stored (row dict, body) for a cache key, or None; the row says whether it is still fresh"""
+    if not http_cache_config["enabled"]:
+        return None
+    try:
+        row = _http_cache_connection().execute(
+            "SELECT etag, last_modified, content_type, expires_at, codec, digest, body "
+            "FROM http_responses WHERE url = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            _count_http_cache("misses")
+            return None
+        etag, last_modified, content_type, expires_at, codec, digest, data = row
+        return {
+            "etag": etag,
+            "last_modified": last_modified,
+            "content_type": content_type,
+            "fresh": expires_at > time.time(),
+            "digest": digest,
+            "body": _decompress_body(codec, data),
+        }
+    except (sqlite3.Error, zlib.error, getattr(brotli, "error", zlib.error)) as exc:
+        _count_http_cache("errors")
+        cache_log.warning("HTTP cache read failed", extra={"error": str(exc)})
+        return None
+
+
+def conditional_headers(entry):
+    """If-None-Match / If-Modified-Since for revalidating a stored response"""
+    headers = {}
+    if entry and entry["etag"]:
+        headers["If-None-Match"] = entry["etag"]
+    if entry and entry["last_modified"]:
+        headers["If-Modified-Since"] = entry["last_modified"]
+    return headers
+
+
+def count_http_cache_fetch(entry, conditional):
+    """Count a request that went out for a stored but stale copy
+
+    With validators it is a revalidation; a copy without any is fetched in full, which is a miss.
+    Requests for copies that were never stored were counted at lookup.
+    """
+    if entry is not None:
+        _count_http_cache("revalidations" if conditional else "misses")
+
+
+def http_cache_store(key, headers, body):
+    """Store a 200 response when its headers allow it; returns the body digest"""
+    digest = hashlib.sha1(body).hexdigest()
+    if not http_cache_config["enabled"]:
+        return digest
+    freshness = _freshness_seconds(headers)
+    etag, last_modified = headers.get("ETag"), headers.get("Last-Modified")
+    # Without freshness or validators a stored copy could never be used
+    if freshness is None or (not freshness and not etag and not last_modified) \
+            or len(body) > http_cache_config["max_body_bytes"]:
+        _count_http_cache("uncacheable")
+        return digest
+    codec, data = _compress_body(body)
+    now = time.time()
+    try:
+        conn = _http_cache_connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO http_responses "
+                "(url, etag, last_modified, content_type, expires_at, fetched_at, codec, digest, size, body) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (key, etag, last_modified, headers.get("Content-Type"), now + freshness, now,
+                 codec, digest, len(data), data),
+            )
+        if _count_http_cache("stored") % 50 == 0:
+            _evict_http_cache(conn)
+    except sqlite3.Error as exc:
+        _count_http_cache("errors")
+        cache_log.warning("HTTP cache write failed", extra={"error": str(exc)})
+    return digest
+
+
+def http_cache_revalidated(key, headers):
+    """A 304 confirmed the stored copy: extend its freshness from the new headers"""
+    if not http_cache_config["enabled"]:
+        return
+    freshness = _freshness_seconds(headers) or 0.0
+    now = time.time()
+    try:
+        conn = _http_cache_connection()
+        with conn:
+            conn.execute(
+                "UPDATE http_responses SET expires_at = ?, fetched_at = ?, "
+                "etag = COALESCE(?, etag), last_modified = COALESCE(?, last_modified) WHERE url = ?",
+                (now + freshness, now, headers.get("ETag"), headers.get("Last-Modified"), key),
+            )
+    except sqlite3.Error as exc:
+        _count_http_cache("errors")
+        cache_log.warning("HTTP cache write failed", extra={"error": str(exc)})
+
+
+def _evict_http_cache(conn):
+    """Drop the least recently fetched responses beyond max_bytes of compressed bodies"""
+    with conn:
+        evicted = conn.execute(
+            "DELETE FROM http_responses WHERE url IN ("
+            "SELECT url FROM (SELECT url, SUM(size) OVER (ORDER BY fetched_at DESC) AS total "
+            "FROM http_responses) WHERE total > ?)",
+            (http_cache_config["max_bytes"],),
+        ).rowcount
+    if evicted:
+        _count_http_cache("evicted", evicted)
+
+
+def http_cache_response(key, entry, revalidated):
+    _count_http_cache("not_modified" if revalidated else "fresh_hits")
+    return CachedResponse(key, entry["body"], entry["content_type"], entry["digest"], revalidated)
+
+
+def cached_http_get(url, service, params=None, headers=None, **kwargs):
+    """http_request GET through the on-disk HTTP cache
+
+    A fresh stored copy is returned without touching the network (or the rate limits). A stale
+    one is revalidated with a conditional request, and a 304 returns the stored body. Cached
+    and freshly stored responses carry a digest of their body.
+    """
+    key = http_cache_url(url, params)
+    entry = http_cache_lookup(key)
+    if entry is not None and entry["fresh"]:
+        return http_cache_response(key, entry, revalidated=False)
+    conditional = conditional_headers(entry)
+    response = http_request("GET", url, service, params=params, headers={**(headers or {}), **conditional}, **kwargs)
+    count_http_cache_fetch(entry, conditional)
+    if response.status_code == 304 and entry is not None:
+        http_cache_revalidated(key, response.headers)
+        return http_cache_response(key, entry, revalidated=True)
+    if response.status_code == 200:
+        response.digest = http_cache_store(key, response.headers, response.content)
+    return response
+
+
+def http_cache_snapshot():
+    snapshot = {"enabled": http_cache_config["enabled"]}
+    if not http_cache_config["enabled"]:
+        return snapshot
+    with _http_cache_lock:
+        snapshot.update(http_cache_stats)
+    try:
+        entries, size = _http_cache_connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM http_responses"
+        ).fetchone()
+        snapshot.update({"entries": entries, "bytes": size, "max_bytes": http_cache_config["max_bytes"]})
+    except sqlite3.Error:
+        pass
+    return snapshot
@@ -0,0 +1,393 @@
+"""Product image proxy serving cached, resized thumbnails through /api/image."""
+import hashlib
+import io
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import Future
+from urllib.parse import urlencode, urljoin, urlsplit
+
+import requests
+
+from caching import ResultCache, SingleFlight
+from logs import cache_log, config_log, http_log
+from metrics import timed_stage
+from outbound import DEFAULT_HEADERS, http_config, http_request
+
+# Optional Pillow: the image proxy shrinks and re-encodes thumbnails with it, and passes
+# images through at their original size without it
+try:
+    from PIL import Image, features as pil_features
+except ImportError:
+    Image = pil_features = None
+
+# Image proxy: product images are fetched once, shrunk to card thumbnails, re-encoded and kept
+# in a content-addressed cache on disk, so the chat page never loads full-size or third-party images
+image_proxy_config = {
+    "enabled": os.getenv("IMAGE_PROXY_ENABLED", "true").lower() in ("1", "true", "yes"),
+    # Prefix of rewritten image URLs; empty keeps them relative to the API, which the chat UI resolves
+    "base_url": os.getenv("IMAGE_PROXY_BASE_URL", "").rstrip("/"),
+    "path": os.getenv(
+        "IMAGE_CACHE_DIR",
+        os.path.join(os.path.dirname(os.path.abspath(__file__)), "data", "images"),
+    ),
+    "max_bytes": int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(256 * 1024 * 1024))),
+    # Largest upstream image fetched, and the most pixels decoded from one
+    "max_source_bytes": int(os.getenv("IMAGE_MAX_SOURCE_BYTES", str(8 * 1024 * 1024))),
+    "max_source_pixels": int(os.getenv("IMAGE_MAX_SOURCE_PIXELS", str(40_000_000))),
+    # Thumbnails fit a width x width box; cards show images 200px tall, so 400 covers 2x screens
+    "width": int(os.getenv("IMAGE_THUMBNAIL_WIDTH", "400")),
+    "widths": tuple(int(w) for w in os.getenv("IMAGE_THUMBNAIL_WIDTHS", "200,400,800").split(",") if w.strip()),
+    "format": os.getenv("IMAGE_THUMBNAIL_FORMAT", "webp").lower(),
+    "quality": int(os.getenv("IMAGE_THUMBNAIL_QUALITY", "75")),
+    # Cache-Control max-age of served thumbnails
+    "max_age": int(os.getenv("IMAGE_CACHE_MAX_AGE_SECONDS", str(30 * 24 * 3600))),
+    "timeout": float(os.getenv("IMAGE_FETCH_TIMEOUT_SECONDS", "5")),
+    # A failed fetch is not retried for this long
+    "failure_ttl": float(os.getenv("IMAGE_FAILURE_TTL_SECONDS", "300")),
+    # Hosts (and their subdomains) the proxy fetches from; other image URLs are left as they are
+    "allowed_hosts": tuple(
+        host.strip().lower()
+        for host in os.getenv(
+            "IMAGE_PROXY_ALLOWED_HOSTS",
+            "flixcart.com,media-amazon.com,images-amazon.com,ssl-images-amazon.com,unsplash.com,"
+            "placeholder.com,duckduckgo.com",
+        ).split(",")
+        if host.strip()
+    ),
+}
+
+# Encoder name and content type per IMAGE_THUMBNAIL_FORMAT
+THUMBNAIL_FORMATS = {
+    "webp": ("WEBP", "image/webp"),
+    "jpeg": ("JPEG", "image/jpeg"),
+    "png": ("PNG", "image/png"),
+}
+if image_proxy_config["format"] not in THUMBNAIL_FORMATS or (
+    Image is not None and image_proxy_config["format"] == "webp" and not pil_features.check("webp")
+):
+    config_log.warning(
+        "Thumbnail format unavailable, using JPEG", extra={"format": image_proxy_config["format"]}
+    )
+    image_proxy_config["format"] = "jpeg"
+
+IMAGE_CACHE_SCHEMA = """
+CREATE TABLE IF NOT EXISTS image_blobs (
+    digest TEXT PRIMARY KEY,
+    content_type TEXT NOT NULL,
+    size INTEGER NOT NULL,
+    used_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS image_blobs_used_at ON image_blobs (used_at);
+CREATE TABLE IF NOT EXISTS image_sources (
+    key TEXT PRIMARY KEY,
+    digest TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS image_sources_digest ON image_sources (digest);
+"""
+
+IMAGE_REQUEST_HEADERS = {
+    "User-Agent": DEFAULT_HEADERS["User-Agent"],
+    "Accept": "image/avif,image/webp,image/*;q=0.8",
+}
+
+image_proxy_stats = {
+    "hits": 0, "misses": 0, "refused": 0, "failures": 0, "resized": 0, "passed_through": 0,
+    "stored": 0, "evicted": 0, "errors": 0, "source_bytes": 0, "thumbnail_bytes": 0,
+}
+_image_proxy_local = threading.local()
+_image_proxy_lock = threading.Lock()
+image_flights = SingleFlight("image")
+# (status, message) of recent failed fetches per (width, URL)
+image_failures = ResultCache(2048, 1024 * 1024)
+
+
+class ImageProxyError(Exception):
+    """An image the proxy cannot serve; status is the HTTP status to answer with"""
+
+    def __init__(self, status, message):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+def _count_image_proxy(stat, amount=1):
+    with _image_proxy_lock:
+        image_proxy_stats[stat] += amount
+        return image_proxy_stats[stat]
+
+
+def _image_cache_connection():
+    conn = getattr(_image_proxy_local, "conn", None)
+    if conn is None:
+        os.makedirs(image_proxy_config["path"], exist_ok=True)
+        conn = sqlite3.connect(os.path.join(image_proxy_config["path"], "index.db"), timeout=5)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.executescript(IMAGE_CACHE_SCHEMA)
+        _image_proxy_local.conn = conn
+    return conn
+
+
+def _image_blob_path(digest):
+    return os.path.join(image_proxy_config["path"], digest[:2], digest)
+
+
+def image_source_allowed(url):
+    """True for http(s) URLs on one of the allowed image hosts"""
+    try:
+        parts = urlsplit(url or "")
+        host = (parts.hostname or "").lower()
+    except ValueError:
+        return False
+    return parts.scheme in ("http", "https") and any(
+        host == allowed or host.endswith("." + allowed) for allowed in image_proxy_config["allowed_hosts"]
+    )
+
+
+def proxied_image_url(url, width=None):
+    """/api/image URL serving url as a thumbnail; url itself when the proxy cannot fetch it"""
+    if not image_proxy_config["enabled"] or not image_source_allowed(url):
+        return url
+    params = {"src": url}
+    if width and width != image_proxy_config["width"]:
+        params["w"] = width
+    return f"{image_proxy_config['base_url']}/api/image?{urlencode(params)}"
+
+
+def with_proxied_images(products):
+    """Copies of products whose images point at the image proxy"""
+    if not image_proxy_config["enabled"]:
+        return products
+    return [{**product, "image": proxied_image_url(product.get("image"))} for product in products]
+
+
+def make_thumbnail(body, width):
+    """(bytes, content type) of an image shrunk to fit width x width and re-encoded.
+
+    Returns (body, None) when Pillow is not installed or the re-encoded image would not be
+    smaller; raises ValueError for data Pillow cannot decode.
+    """
+    if Image is None:
+        return body, None
+    encoder, content_type = THUMBNAIL_FORMATS[image_proxy_config["format"]]
+    try:
+        with Image.open(io.BytesIO(body)) as image:
+            if image.width * image.height > image_proxy_config["max_source_pixels"]:
+                raise ValueError(f"image too large ({image.width}x{image.height})")
+            # JPEGs decode straight to a reduced scale, which skips most of the decoding work
+            image.draft("RGB", (width, width))
+            resized = image.width > width or image.height > width
+            image.thumbnail((width, width), Image.Resampling.LANCZOS, reducing_gap=3.0)
+            has_alpha = image.mode in ("RGBA", "LA", "PA") or "transparency" in image.info
+            if image.mode not in ("RGB", "RGBA") or (has_alpha and encoder == "JPEG"):
+                image = image.convert("RGBA" if has_alpha and encoder != "JPEG" else "RGB")
+            out = io.BytesIO()
+            options = {"quality": image_proxy_config["quality"]}
+            if encoder == "WEBP":
+                options["method"] = 4
+            elif encoder == "JPEG":
+                options.update(optimize=True, progressive=True)
+            image.save(out, encoder, **options)
+    except (OSError, Image.DecompressionBombError, SyntaxError) as exc:
+        raise ValueError(str(exc)) from exc
+    data = out.getvalue()
+    if not resized and len(data) >= len(body):
+        return body, None
+    return data, content_type
+
+
+def _image_cache_lookup(key):
+    """Cached {"digest", "content_type", "body"} for a (width, URL) key, or None"""
+    try:
+        conn = _image_cache_connection()
+        row = conn.execute(
+            "SELECT b.digest, b.content_type, b.used_at FROM image_sources s "
+            "JOIN image_blobs b ON b.digest = s.digest WHERE s.key = ?",
+            (key,),
+        ).fetchone()
+        if row is None:
+            return None
+        digest, content_type, used_at = row
+        with open(_image_blob_path(digest), "rb") as fh:
+            body = fh.read()
+        now = time.time()
+        # Recency only steers eviction, so it is refreshed at most once a minute per image
+        if now - used_at > 60:
+            with conn:
+                conn.execute("UPDATE image_blobs SET used_at = ? WHERE digest = ?", (now, digest))
+        return {"digest": digest, "content_type": content_type, "body": body}
+    except FileNotFoundError:
+        return None
+    except (sqlite3.Error, OSError) as exc:
+        _count_image_proxy("errors")
+        cache_log.warning("image cache read failed", extra={"error": str(exc)})
+        return None
+
+
+def _image_cache_store(key, body, content_type):
+    """Write a thumbnail under its content digest and point key at it"""
+    digest = hashlib.sha256(body).hexdigest()
+    entry = {"digest": digest, "content_type": content_type, "body": body}
+    path = _image_blob_path(digest)
+    try:
+        if not os.path.exists(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # Written aside and renamed, so other workers never read a partial file
+            partial = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(partial, "wb") as fh:
+                fh.write(body)
+            os.replace(partial, path)
+        conn = _image_cache_connection()
+        with conn:
+            conn.execute(
+                "INSERT OR REPLACE INTO image_blobs (digest, content_type, size, used_at) VALUES (?, ?, ?, ?)",
+                (digest, content_type, len(body), time.time()),
+            )
+            conn.execute("INSERT OR REPLACE INTO image_sources (key, digest) VALUES (?, ?)", (key, digest))
+        if _count_image_proxy("stored") % 50 == 0:
+            _evict_images(conn)
+    except (sqlite3.Error, OSError) as exc:
+        _count_image_proxy("errors")
+        cache_log.warning("image cache write failed", extra={"error": str(exc)})
+    return entry
+
+
+def _evict_images(conn):
+    """Drop the least recently used thumbnails beyond max_bytes, files included"""
+    digests = [
+        digest
+        for (digest,) in conn.execute(
+            "SELECT digest FROM (SELECT digest, SUM(size) OVER (ORDER BY used_at DESC) AS total "
+            "FROM image_blobs) WHERE total > ?",
+            (image_proxy_config["max_bytes"],),
+        )
+    ]
+    if not digests:
+        return
+    with conn:
+        conn.executemany("DELETE FROM image_sources WHERE digest = ?", [(d,) for d in digests])
+        conn.executemany("DELETE FROM image_blobs WHERE digest = ?", [(d,) for d in digests])
+    for digest in digests:
+        try:
+            os.remove(_image_blob_path(digest))
+        except FileNotFoundError:
+            pass
+    _count_image_proxy("evicted", len(digests))
+
+
+def _download_image(url):
+    """(body, content type) of an image; redirects are followed only to allowed hosts"""
+    for _ in range(4):
+        response = http_request(
+            "GET", url, "images", headers=IMAGE_REQUEST_HEADERS, stream=True, allow_redirects=False,
+            timeout=(http_config["connect_timeout"], image_proxy_config["timeout"]),
+        )
+        try:
+            if response.is_redirect:
+                url = urljoin(url, response.headers.get("Location", ""))
+                if not image_source_allowed(url):
+                    raise ImageProxyError(403, "image redirected to a host that is not allowed")
+                continue
+            if response.status_code != 200:
+                raise ImageProxyError(502, f"image upstream answered {response.status_code}")
+            content_type = response.headers.get("Content-Type", "").split(";")[0].strip().lower()
+            if not content_type.startswith("image/"):
+                raise ImageProxyError(502, f"upstream sent {content_type or 'no content type'}, not an image")
+            body = bytearray()
+            for chunk in response.iter_content(64 * 1024):
+                body += chunk
+                if len(body) > image_proxy_config["max_source_bytes"]:
+                    raise ImageProxyError(502, "image too large")
+            return bytes(body), content_type
+        finally:
+            response.close()
+    raise ImageProxyError(502, "too many redirects")
+
+
+def _fetch_thumbnail(key, url, width):
+    try:
+        with timed_stage("image_fetch"):
+            body, content_type = _download_image(url)
+    except requests.RequestException as exc:
+        raise ImageProxyError(502, f"image fetch failed: {type(exc).__name__}") from exc
+    _count_image_proxy("source_bytes", len(body))
+    try:
+        with timed_stage("image_resize"):
+            thumbnail, thumbnail_type = make_thumbnail(body, width)
+    except ValueError as exc:
+        raise ImageProxyError(502, f"unreadable image: {exc}") from exc
+    _count_image_proxy("resized" if thumbnail_type else "passed_through")
+    _count_image_proxy("thumbnail_bytes", len(thumbnail))
+    return _image_cache_store(key, thumbnail, thumbnail_type or content_type)
+
+
+def image_thumbnail(url, width=None):
+    """Thumbnail of an allowed image URL as {"digest", "content_type", "body"}.
+
+    Served from the on-disk cache when present; otherwise fetched once (concurrent requests
+    for the same image share the fetch), resized and stored. Raises ImageProxyError.
+    """
+    if not image_proxy_config["enabled"]:
+        raise ImageProxyError(404, "image proxy is disabled")
+    try:
+        width = int(width) if width else image_proxy_config["width"]
+    except ValueError:
+        width = None
+    if width not in image_proxy_config["widths"] and width != image_proxy_config["width"]:
+        raise ImageProxyError(400, f"w must be one of {', '.join(map(str, image_proxy_config['widths']))}")
+    if not image_source_allowed(url):
+        _count_image_proxy("refused")
+        raise ImageProxyError(400, "src must be an http(s) image URL on an allowed host")
+
+    key = f"{width} {url}"
+    entry = _image_cache_lookup(key)
+    if entry is not None:
+        _count_image_proxy("hits")
+        return entry
+    failure = image_failures.get(key)
+    if failure is not None:
+        raise ImageProxyError(*failure)
+    _count_image_proxy("misses")
+
+    future, started = image_flights.join(key, Future)
+    if started:
+        try:
+            future.set_result(_fetch_thumbnail(key, url, width))
+        except ImageProxyError as exc:
+            _count_image_proxy("failures")
+            http_log.info("image not proxied", extra={"src": url, "error": exc.message})
+            image_failures.set(key, [exc.status, exc.message], image_proxy_config["failure_ttl"])
+            future.set_exception(exc)
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            raise
+    return future.result()
+
+
+def image_response_headers(entry):
+    """Long-lived caching headers for a thumbnail; the ETag is its content digest"""
+    return {
+        "Cache-Control": f"public, max-age={image_proxy_config['max_age']}",
+        "ETag": f'"{entry["digest"][:32]}"',
+    }
+
+
+def image_proxy_snapshot():
+    snapshot = {"enabled": image_proxy_config["enabled"], "resizing": Image is not None,
+                "format": image_proxy_config["format"]}
+    if not image_proxy_config["enabled"]:
+        return snapshot
+    with _image_proxy_lock:
+        snapshot.update(image_proxy_stats)
+    snapshot["coalesced"] = image_flights.snapshot()["coalesced"]
+    try:
+        entries, size = _image_cache_connection().execute(
+            "SELECT COUNT(*), COALESCE(SUM(size), 0) FROM image_blobs"
+        ).fetchone()
+        snapshot.update({"entries": entries, "bytes": size, "max_bytes": image_proxy_config["max_bytes"]})
+    except sqlite3.Error:
+        pass
+    return snapshot
@@ -0,0 +1,159 @@
+"""Chat intent gate: product searches, policy questions, small talk and off-topic messages."""
+import re
+import threading
+
+from metrics import Histogram, timed_stage
+from query_understanding import understand_query
+
+OFF_TOPIC_REPLY = "I'm here to help you find products on e-commerce platforms like Flipkart and Amazon. How can I assist you with finding products today?"
+
+# Intent gate: every chat message is classified before any scraping or LLM work. Only
+# product_search reaches the marketplaces; the other intents are answered from templates.
+CHAT_INTENTS = ("product_search", "policy", "small_talk", "off_topic")
+
+# Whole-message greetings, thanks and questions about the assistant itself
+_SMALL_TALK = re.compile(
+    r"^\W*(?:(?:hi+|hello+|hey+|hiya|yo|namaste|good\s+(?:morning|afternoon|evening|night)|"
+    r"thanks?(?:\s+(?:a\s+lot|so\s+much))?|thank\s+you(?:\s+so\s+much)?|thx|ty|ok(?:ay)?|cool|great|"
+    r"bye+|goodbye|see\s+you|how\s+are\s+you|who\s+are\s+you|what\s+can\s+you\s+do|help(?:\s+me)?)"
+    r"(?:\s+(?:there|again|bot|assistant|buddy))?\W*)+$",
+    re.IGNORECASE,
+)
+_OFF_TOPIC = re.compile(
+    r"\b(?:weather|news|sports?\s+scores?|politic(?:s|al)|elections?|general\s+knowledge|history|science|"
+    r"jokes?|poems?|recipes?|homework|horoscope)\b",
+    re.IGNORECASE,
+)
+# Requests about an existing order or purchase, and warranty/return policy questions. They are
+# checked before the shopping cues: "how do I return my headphones" names a product but is not a search
+_ORDER_ACTIONS = re.compile(
+    r"^\W*(?:(?:how|can|could|do|i|i'd|we|please|want|wanna|would|like|need|to|a|an|the|get|help|me|raise)\s+){0,6}"
+    r"(?:return|refund|replace|exchange|cancel|track)\w*\b[^.?!]*\bmy\b"
+    r"|\bmy\s+(?:\w+\s+){0,3}(?:order|package|parcel|shipment|purchase|delivery)\b"
+    r"|\b(?:is\s+there|any|does\s+it\s+(?:have|come\s+with)|claim(?:ing)?)\s+(?:a\s+|the\s+)?warranty\b"
+    r"|\bwarranty\s+(?:on|for|claim|period|policy)\b"
+    r"|\b(?:return|refund|cancellation|exchange|replacement)\s+polic(?:y|ies)\b",
+    re.IGNORECASE,
+)
+# Off-topic requests that stay off-topic whatever they mention ("tell me a joke about laptops")
+_OFF_TOPIC_REQUESTS = re.compile(
+    r"\b(?:tell|write|give|say|make\s+up)\s+(?:me\s+|us\s+)?(?:a\s+|an(?:other)?\s+|some\s+)?(?:\w+\s+)?"
+    r"(?:jokes?|poems?|riddles?|stor(?:y|ies))\b"
+    r"|\bweather\s+(?:today|tomorrow|forecast|in|like)\b|\bhoroscope\b|\b(?:do|solve|with)\s+my\s+homework\b",
+    re.IGNORECASE,
+)
+# Words that make a message a shopping request even when it mentions a policy or off-topic word
+# ("sports shoes", "history books under 500", "laptop with 2 year warranty")
+_SHOPPING_CUES = re.compile(
+    r"\b(?:buy|price|prices|cheap(?:est)?|budget|deals?|offers?|discount|under|below|within|"
+    r"recommend|suggest|compare|shoes?|books?|kits?|watch(?:es)?|phones?|laptops?|"
+    r"headphones?|earphones?|earbuds|speakers?|cameras?|tv|monitors?|keyboards?|mouse|bags?|chargers?)\b"
+    r"|₹|\brs\.?\s*\d|\d+\s*k\b",
+    re.IGNORECASE,
+)
+# Policy/FAQ topics, first match wins
+POLICY_TOPICS = (
+    ("order_status", re.compile(
+        r"\b(?:track(?:ing)?|where\s+is\s+my\s+(?:order|package|parcel)|order\s+status|not\s+(?:yet\s+)?(?:arrived|delivered))\b",
+        re.IGNORECASE)),
+    ("cancellation", re.compile(r"\bcancel(?:led|ling|lation)?\b", re.IGNORECASE)),
+    ("refund", re.compile(r"\brefunds?\b|\bmoney\s+back\b", re.IGNORECASE)),
+    ("returns", re.compile(r"\b(?:return(?:s|ing)?|exchange|replace(?:ment)?)\b", re.IGNORECASE)),
+    ("payment", re.compile(r"\b(?:payment|pay|cod|cash\s+on\s+delivery|emi|upi|invoice|bill)\b", re.IGNORECASE)),
+    ("shipping", re.compile(r"\b(?:shipping|delivery|deliver|ship|courier)\b", re.IGNORECASE)),
+    ("warranty", re.compile(r"\b(?:warranty|guarantee)\b", re.IGNORECASE)),
+)
+
+POLICY_ANSWERS = {
+    "order_status": "You can track any order from **My Orders** on Flipkart or **Your Orders** on Amazon; both show live courier updates and the expected delivery date. If a delivery is late, the order page also has a *Need help* option to reach the seller.",
+    "cancellation": "Orders can usually be cancelled from **My Orders** (Flipkart) or **Your Orders** (Amazon) until they are shipped. After dispatch, you can refuse the delivery or request a return instead.",
+    "refund": "Refunds go back to the original payment method once the returned item is picked up and checked: typically 3–7 business days for cards and UPI, and 1–2 days to Amazon Pay or Flipkart wallet balances. The order page shows the refund status.",
+    "returns": "Most products on Flipkart and Amazon can be returned or replaced within 7–10 days of delivery (some categories, like electronics, only allow replacement). Start a return from the order page; the exact window is shown under the product's *Return policy*.",
+    "shipping": "Delivery times and charges depend on the seller and your PIN code. Check the product page for the delivery estimate; Flipkart Plus and Amazon Prime members get free and faster delivery on eligible items.",
+    "payment": "Both marketplaces accept UPI, cards, net banking, EMI and Cash on Delivery on eligible orders. The available options for an item are listed at checkout.",
+    "warranty": "Warranty details are listed under *Specifications* on the product page; most electronics carry a 1-year manufacturer warranty, claimed through the brand's service centres with your invoice.",
+}
+POLICY_FALLBACK = "For orders, returns, refunds and delivery, the order page on Flipkart or Amazon has the details and a *Need help* option. I can help you find products — just tell me what you're looking for!"
+
+SMALL_TALK_REPLIES = {
+    "greeting": "Hi! 👋 I can help you find products on Flipkart and Amazon. Tell me what you're looking for, e.g. *wireless earbuds under 3000*.",
+    "thanks": "You're welcome! Let me know if you'd like to find anything else. 🛍️",
+    "goodbye": "Goodbye, and happy shopping! 🛍️",
+    "about": "I'm a shopping assistant: describe a product (with a budget if you like) and I'll pull matching options from Flipkart and Amazon, compare them and link you straight to the listings.",
+}
+
+intent_seconds = Histogram(
+    "assistant_chat_intent_duration_seconds",
+    "Time to answer a chat message, by classified intent.",
+    labels=("intent",),
+)
+intent_stats = {intent: {"count": 0, "seconds": 0.0} for intent in CHAT_INTENTS}
+_intent_lock = threading.Lock()
+
+
+def classify_intent(user_message):
+    """Route a chat message to product_search, policy, small_talk or off_topic"""
+    with timed_stage("intent"):
+        if not user_message or _SMALL_TALK.match(user_message):
+            return "small_talk"
+        if _ORDER_ACTIONS.search(user_message):
+            return "policy"
+        if _OFF_TOPIC_REQUESTS.search(user_message):
+            return "off_topic"
+        parsed = understand_query(user_message)
+        shopping = parsed.category is not None or parsed.has_price or _SHOPPING_CUES.search(user_message) is not None
+        if shopping:
+            return "product_search"
+        if _OFF_TOPIC.search(user_message):
+            return "off_topic"
+        if any(pattern.search(user_message) for _, pattern in POLICY_TOPICS):
+            return "policy"
+        return "product_search"
+
+
+def intent_reply(intent, user_message):
+    """Template answer for the intents that skip search and the LLM"""
+    if intent == "off_topic":
+        return OFF_TOPIC_REPLY
+    if intent == "policy":
+        for topic, pattern in POLICY_TOPICS:
+            if pattern.search(user_message):
+                return POLICY_ANSWERS[topic]
+        return POLICY_FALLBACK
+    text = user_message.lower()
+    if re.search(r"\b(?:thanks?|thank\s+you|thx|ty)\b", text):
+        return SMALL_TALK_REPLIES["thanks"]
+    if re.search(r"\b(?:bye+|goodbye|see\s+you)\b", text):
+        return SMALL_TALK_REPLIES["goodbye"]
+    if re.search(r"\b(?:who\s+are\s+you|what\s+can\s+you\s+do|help)\b", text):
+        return SMALL_TALK_REPLIES["about"]
+    return SMALL_TALK_REPLIES["greeting"]
+
+
+def record_intent(intent, seconds):
+    intent_seconds.observe(seconds, intent=intent)
+    with _intent_lock:
+        intent_stats[intent]["count"] += 1
+        intent_stats[intent]["seconds"] += seconds
+
+
+def intent_snapshot():
+    with _intent_lock:
+        return {
+            intent: {
+                "count": stats["count"],
+                "avg_ms": round(stats["seconds"] / stats["count"] * 1000, 1) if stats["count"] else 0.0,
+            }
+            for intent, stats in intent_stats.items()
+        }
+
+
+def build_intent_reply(intent, user_message, session_id=None):
+    """JSON body for /api/chat when the intent gate answers without searching"""
+    return {
+        'response': intent_reply(intent, user_message),
+        'products': [],
+        'timed_out_sources': [],
+        'intent': intent,
+        'session_id': session_id,
+    }
@@ -0,0 +1,330 @@
+"""Legacy in-memory product list with a BM25 inverted index (kept for backward compatibility)."""
+import bisect
+import heapq
+import math
+import re
+from array import array
+
+from query_understanding import understand_query
+
+# Optional vectorized scoring for the legacy catalog index (see ProductIndex)
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Legacy product database (kept for backward compatibility, but not used)
+PRODUCTS = [
+    {
+        "id": 1,
+        "name": "Wireless Bluetooth Headphones",
+        "price": 79.99,
+        "image": "https://images.unsplash.com/photo-1505740420928-5e560c06d30e?w=400",
+        "category": "Electronics",
+        "description": "Premium noise-cancelling wireless headphones with 30-hour battery life",
+        "rating": 4.5,
+        "inStock": True
+    },
+    {
+        "id": 2,
+        "name": "Smart Watch Pro",
+        "price": 249.99,
+        "image": "https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=400",
+        "category": "Electronics",
+        "description": "Advanced fitness tracking smartwatch with heart rate monitor and GPS",
+        "rating": 4.7,
+        "inStock": True
+    },
+    {
+        "id": 3,
+        "name": "Laptop Backpack",
+        "price": 49.99,
+        "image": "https://images.unsplash.com/photo-1553062407-98eeb64c6a62?w=400",
+        "category": "Accessories",
+        "description": "Durable laptop backpack with USB charging port and water-resistant material",
+        "rating": 4.3,
+        "inStock": True
+    },
+    {
+        "id": 4,
+        "name": "Wireless Mouse",
+        "price": 29.99,
+        "image": "https://images.unsplash.com/photo-1527814050087-3793815479db?w=400",
+        "category": "Electronics",
+        "description": "Ergonomic wireless mouse with precision tracking and long battery life",
+        "rating": 4.4,
+        "inStock": True
+    },
+    {
+        "id": 5,
+        "name": "Mechanical Keyboard",
+        "price": 129.99,
+        "image": "https://images.unsplash.com/photo-1587829741301-dc798b83add3?w=400",
+        "category": "Electronics",
+        "description": "RGB backlit mechanical keyboard with Cherry MX switches",
+        "rating": 4.6,
+        "inStock": True
+    },
+    {
+        "id": 6,
+        "name": "USB-C Hub",
+        "price": 39.99,
+        "image": "https://images.unsplash.com/photo-1625842268584-8f7623b58d85?w=400",
+        "category": "Accessories",
+        "description": "7-in-1 USB-C hub with HDMI, USB 3.0, and SD card reader",
+        "rating": 4.2,
+        "inStock": True
+    },
+    {
+        "id": 7,
+        "name": "Phone Stand",
+        "price": 19.99,
+        "image": "https://images.unsplash.com/photo-1601784551446-20c9e07cdbdb?w=400",
+        "category": "Accessories",
+        "description": "Adjustable aluminum phone stand for desk and car use",
+        "rating": 4.1,
+        "inStock": True
+    },
+    {
+        "id": 8,
+        "name": "Wireless Charger",
+        "price": 24.99,
+        "image": "https://images.unsplash.com/photo-1609091839311-d5365f9ff1c5?w=400",
+        "category": "Electronics",
+        "description": "Fast wireless charging pad compatible with all Qi-enabled devices",
+        "rating": 4.5,
+        "inStock": True
+    },
+    {
+        "id": 9,
+        "name": "Fitness Watch Elite",
+        "price": 199.99,
+        "image": "https://images.unsplash.com/photo-1579586337278-3befd40f17ca?w=400",
+        "category": "Electronics",
+        "description": "Premium fitness smartwatch with advanced health monitoring and 10-day battery",
+        "rating": 4.6,
+        "inStock": True
+    },
+    {
+        "id": 10,
+        "name": "Sport Watch Active",
+        "price": 179.99,
+        "image": "https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=400",
+        "category": "Electronics",
+        "description": "Rugged sports watch with GPS, heart rate monitor, and 14-day battery life",
+        "rating": 4.4,
+        "inStock": True
+    },
+    {
+        "id": 11,
+        "name": "Classic Smart Watch",
+        "price": 229.99,
+        "image": "https://images.unsplash.com/photo-1523275335684-37898b6baf30?w=400",
+        "category": "Electronics",
+        "description": "Elegant smartwatch with premium design, AMOLED display, and comprehensive health tracking",
+        "rating": 4.8,
+        "inStock": True
+    }
+]
+
+# Synonym groups for legacy catalog search; every member is indexed and queried as its group key
+LEGACY_SYNONYMS = {
+    'watch': ['watch', 'smartwatch', 'smart watch', 'timepiece', 'wristwatch'],
+    'headphone': ['headphone', 'headphones', 'earphone', 'earphones', 'audio'],
+    'mouse': ['mouse', 'computer mouse', 'wireless mouse'],
+    'keyboard': ['keyboard', 'mechanical keyboard', 'keyboard'],
+    'backpack': ['backpack', 'bag', 'laptop bag', 'rucksack'],
+    'charger': ['charger', 'wireless charger', 'charging'],
+    'hub': ['hub', 'usb hub', 'adapter']
+}
+
+# Single-word synonyms -> group key (multi-word entries are covered by their words)
+_SYNONYM_TERMS = {
+    word: key
+    for key, values in LEGACY_SYNONYMS.items()
+    for word in values
+    if " " not in word
+}
+_TOKEN_PATTERN = re.compile(r"[a-z0-9]+")
+
+
+def _index_term(token):
+    """Canonical index term: synonym group key, else a naive singular form"""
+    if token in _SYNONYM_TERMS:
+        return _SYNONYM_TERMS[token]
+    if len(token) > 4 and token.endswith(("ches", "shes", "xes")):
+        token = token[:-2]
+    elif len(token) > 3 and token.endswith("s") and not token.endswith("ss"):
+        token = token[:-1]
+    return _SYNONYM_TERMS.get(token, token)
+
+
+def _index_terms(text):
+    return [_index_term(token) for token in _TOKEN_PATTERN.findall(text.lower())]
+
+
+class ProductIndex:
+    """Inverted index over a product catalog with precomputed BM25 impacts and a price column.
+
+    Each posting stores its full BM25 contribution, so a query only sums the postings of
+    its terms; documents without any query term are never touched.
+    """
+
+    def __init__(self, products, k1=1.2, b=0.75):
+        self.products = products
+        self.prices = array("d", (float(p.get("price") or 0) for p in products))
+        # Doc ids ordered by price so a price range is two bisects
+        self._by_price = sorted(range(len(products)), key=self.prices.__getitem__)
+        self._sorted_prices = array("d", (self.prices[i] for i in self._by_price))
+
+        term_freqs = []
+        doc_lengths = array("i")
+        doc_freq = {}
+        for product in products:
+            terms = _index_terms(f"{product['name']} {product['category']} {product['description']}")
+            counts = {}
+            for term in terms:
+                counts[term] = counts.get(term, 0) + 1
+            term_freqs.append(counts)
+            doc_lengths.append(len(terms))
+            for term in counts:
+                doc_freq[term] = doc_freq.get(term, 0) + 1
+
+        total_docs = len(products)
+        avg_length = (sum(doc_lengths) / total_docs) if total_docs else 0.0
+        postings = {}
+        for doc_id, counts in enumerate(term_freqs):
+            norm = k1 * (1 - b + b * doc_lengths[doc_id] / avg_length) if avg_length else k1
+            for term, tf in counts.items():
+                df = doc_freq[term]
+                idf = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+                entry = postings.get(term)
+                if entry is None:
+                    entry = postings[term] = (array("i"), array("d"))
+                entry[0].append(doc_id)
+                entry[1].append(idf * tf * (k1 + 1) / (tf + norm))
+        self.vectorized = np is not None
+        if self.vectorized:
+            # Zero-copy numpy views so scoring and filtering run vectorized
+            postings = {
+                term: (np.frombuffer(ids, dtype=np.int32), np.frombuffer(weights, dtype=np.float64))
+                for term, (ids, weights) in postings.items()
+            }
+            self._price_column = np.frombuffer(self.prices, dtype=np.float64)
+        self.postings = postings
+
+    def _doc_ids_in_price_range(self, price_min, price_max):
+        low = bisect.bisect_left(self._sorted_prices, price_min)
+        high = bisect.bisect_right(self._sorted_prices, price_max)
+        return self._by_price[low:high]
+
+    def search(self, query, price_min=None, price_max=None, limit=None):
+        """Products matching any query term, best BM25 score first (top `limit` if given)"""
+        terms = [term for term in set(_index_terms(query)) if term in self.postings]
+        if not terms:
+            return []
+        has_range = price_min is not None and price_max is not None
+        if self.vectorized:
+            doc_ids = self._search_vectorized(terms, price_min, price_max, has_range, limit)
+        else:
+            doc_ids = self._search_python(terms, price_min, price_max, has_range, limit)
+        return [self.products[doc_id] for doc_id in doc_ids]
+
+    def _search_vectorized(self, terms, price_min, price_max, has_range, limit):
+        if len(terms) == 1:
+            doc_ids, scores = self.postings[terms[0]]
+        else:
+            all_ids = np.concatenate([self.postings[term][0] for term in terms])
+            all_weights = np.concatenate([self.postings[term][1] for term in terms])
+            if len(all_ids) * 8 > len(self.products):
+                # Dense accumulate is cheaper once postings cover a good share of the catalog
+                dense = np.bincount(all_ids, all_weights, minlength=len(self.products))
+                doc_ids = np.flatnonzero(dense)
+                scores = dense[doc_ids]
+            else:
+                doc_ids, inverse = np.unique(all_ids, return_inverse=True)
+                scores = np.bincount(inverse, all_weights)
+
+        if has_range:
+            prices = self._price_column[doc_ids]
+            in_range = (prices >= price_min) & (prices <= price_max)
+            doc_ids = doc_ids[in_range]
+            scores = scores[in_range]
+
+        if limit is not None and len(doc_ids) > limit:
+            # Keep everything tied with the k-th score so ties still resolve by catalog order
+            threshold = np.partition(scores, len(scores) - limit)[len(scores) - limit]
+            keep = scores >= threshold
+            doc_ids = doc_ids[keep]
+            scores = scores[keep]
+        # Best score first; ties keep catalog order
+        order = np.lexsort((doc_ids, -scores))[:limit]
+        return doc_ids[order].tolist()
+
+    def _search_python(self, terms, price_min, price_max, has_range, limit):
+        scores = {}
+        for term in terms:
+            for doc_id, weight in zip(*self.postings[term]):
+                scores[doc_id] = scores.get(doc_id, 0.0) + weight
+
+        if has_range:
+            in_range = self._doc_ids_in_price_range(price_min, price_max)
+            if len(in_range) < len(scores):
+                scores = {doc_id: scores[doc_id] for doc_id in in_range if doc_id in scores}
+            else:
+                prices = self.prices
+                scores = {
+                    doc_id: score for doc_id, score in scores.items()
+                    if price_min <= prices[doc_id] <= price_max
+                }
+
+        # Best score first; ties keep catalog order
+        rank = lambda item: (item[1], -item[0])
+        if limit is not None:
+            ranked = heapq.nlargest(limit, scores.items(), key=rank)
+        else:
+            ranked = sorted(scores.items(), key=rank, reverse=True)
+        return [doc_id for doc_id, _ in ranked]
+
+
+def _legacy_price_range(query):
+    """USD (min, max) for a query's budget, open ends filled with 0 and infinity, else (None, None)"""
+    parsed = understand_query(query)
+    if not parsed.has_price:
+        return None, None
+    price_min, price_max = parsed.price_range("USD")
+    return price_min or 0.0, price_max if price_max is not None else math.inf
+
+
+# Built once at import; rebuild with build_product_index() after loading a larger catalog
+PRODUCT_INDEX = ProductIndex(PRODUCTS)
+
+
+def build_product_index(products):
+    """Replace the legacy catalog and its search index"""
+    global PRODUCTS, PRODUCT_INDEX
+    PRODUCTS = products
+    PRODUCT_INDEX = ProductIndex(products)
+    return PRODUCT_INDEX
+
+
+def search_products_legacy(query, limit=None):
+    """Search products by name, category, or description with improved matching"""
+    price_min, price_max = _legacy_price_range(query)
+    if price_min is not None and price_max is not None:
+        # Allow 10% flexibility in price range
+        price_tolerance = (price_max - price_min if price_max != math.inf else price_min) * 0.1
+        price_min -= price_tolerance
+        price_max += price_tolerance
+    return PRODUCT_INDEX.search(query, price_min, price_max, limit)
+
+def format_product_response(products, user_message):
+    """Format product information for the AI response"""
+    if not products:
+        return None
+    
+    product_info = "\n\nAvailable Products:\n"
+    for product in products[:3]:  # Limit to 3 products
+        product_info += f"- {product['name']} (${product['price']}) - {product['description']}\n"
+    
+    return product_info
@@ -0,0 +1,113 @@
+"""Structured JSON logging for the backend, shared by every module through assistant.* loggers."""
+import atexit
+import json
+import logging
+import os
+import queue
+import random
+import sys
+from logging.handlers import QueueHandler, QueueListener
+
+from dotenv import load_dotenv
+
+# Load environment variables
+load_dotenv()
+
+# Structured logging: JSON records handed to a background thread through a bounded queue,
+# so request threads never block on stdout
+log_config = {
+    "level": os.getenv("LOG_LEVEL", "INFO").upper(),
+    # Per-subsystem overrides, e.g. "search=DEBUG,deepseek=WARNING"
+    "levels": os.getenv("LOG_LEVELS", ""),
+    "format": os.getenv("LOG_FORMAT", "json").lower(),
+    # Share of DEBUG records kept; they are the high-volume ones (product lists, upstream status lines)
+    "debug_sample_rate": float(os.getenv("LOG_DEBUG_SAMPLE_RATE", "0.1")),
+    "queue_size": int(os.getenv("LOG_QUEUE_SIZE", "10000")),
+}
+
+# LogRecord attributes that are not user-supplied `extra` fields
+_LOG_RECORD_ATTRS = set(vars(logging.LogRecord("", 0, "", 0, "", (), None))) | {"message", "asctime"}
+log_stats = {"dropped": 0, "sampled_out": 0}
+
+
+class JsonLogFormatter(logging.Formatter):
+    """One JSON object per record: time, level, logger, message and any `extra` fields"""
+
+    def format(self, record):
+        entry = {
+            "ts": round(record.created, 3),
+            "level": record.levelname,
+            "logger": record.name,
+            "msg": record.getMessage(),
+        }
+        for key, value in record.__dict__.items():
+            if key not in _LOG_RECORD_ATTRS:
+                entry[key] = value
+        if record.exc_info:
+            entry["exc"] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str, ensure_ascii=False)
+
+
+class DebugSampler(logging.Filter):
+    """Keep roughly rate of DEBUG records; other levels always pass"""
+
+    def __init__(self, rate):
+        super().__init__()
+        self.rate = rate
+
+    def filter(self, record):
+        if record.levelno > logging.DEBUG or self.rate >= 1 or random.random() < self.rate:
+            return True
+        log_stats["sampled_out"] += 1
+        return False
+
+
+class NonBlockingQueueHandler(QueueHandler):
+    """QueueHandler that drops (and counts) records instead of blocking when the queue is full"""
+
+    def prepare(self, record):
+        # Only the message is rendered here; JSON encoding and I/O happen on the listener thread
+        record.msg = record.getMessage()
+        record.args = None
+        return record
+
+    def enqueue(self, record):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            log_stats["dropped"] += 1
+
+
+def configure_logging():
+    """Route every assistant.* logger through the background queue (idempotent)"""
+    root = logging.getLogger("assistant")
+    if root.handlers:
+        return
+    stream_handler = logging.StreamHandler(sys.stdout)
+    if log_config["format"] == "json":
+        stream_handler.setFormatter(JsonLogFormatter())
+    else:
+        stream_handler.setFormatter(logging.Formatter("%(asctime)s %(levelname)s %(name)s: %(message)s"))
+    log_queue = queue.Queue(maxsize=log_config["queue_size"])
+    listener = QueueListener(log_queue, stream_handler)
+    listener.start()
+    atexit.register(listener.stop)
+
+    queue_handler = NonBlockingQueueHandler(log_queue)
+    queue_handler.addFilter(DebugSampler(log_config["debug_sample_rate"]))
+    root.addHandler(queue_handler)
+    root.setLevel(log_config["level"])
+    root.propagate = False
+    for override in filter(None, (part.strip() for part in log_config["levels"].split(","))):
+        name, _, level = override.partition("=")
+        logging.getLogger(f"assistant.{name.strip()}").setLevel(level.strip().upper())
+
+
+configure_logging()
+config_log = logging.getLogger("assistant.config")
+http_log = logging.getLogger("assistant.http")
+search_log = logging.getLogger("assistant.search")
+catalog_log = logging.getLogger("assistant.catalog")
+cache_log = logging.getLogger("assistant.cache")
+deepseek_log = logging.getLogger("assistant.deepseek")
+chat_log = logging.getLogger("assistant.chat")
@@ -0,0 +1,166 @@
+"""In-process Prometheus metrics: counters, histograms and per-stage request timing."""
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+
+# In-process metrics rendered in the Prometheus text format at /metrics
+METRICS = []
+LATENCY_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 30)
+
+
+def _escape_label(value):
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _metric_labels(names, values, extra=None):
+    pairs = list(zip(names, values)) + ([extra] if extra else [])
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape_label(value)}"' for name, value in pairs) + "}"
+
+
+class Counter:
+    """Monotonic counter per label combination"""
+
+    def __init__(self, name, help_text, labels=()):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self._values = {}
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def inc(self, amount=1, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            for key, value in sorted(self._values.items()):
+                lines.append(f"{self.name}{_metric_labels(self.labels, key)} {value}")
+        return lines
+
+
+class Histogram:
+    """Fixed-bucket histogram per label combination (bucket counts are rendered cumulatively)"""
+
+    def __init__(self, name, help_text, labels=(), buckets=LATENCY_BUCKETS):
+        self.name = name
+        self.help_text = help_text
+        self.labels = labels
+        self.buckets = buckets
+        self._series = {}  # label values -> [count per bucket..., overflow count, sum]
+        self._lock = threading.Lock()
+        METRICS.append(self)
+
+    def observe(self, value, **labels):
+        key = tuple(str(labels.get(label, "")) for label in self.labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            series[index] += 1
+            series[-1] += value
+
+    def render(self):
+        lines = [f"# HELP {self.name} {self.help_text}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            for key, series in sorted(self._series.items()):
+                cumulative = 0
+                for bound, count in zip(self.buckets + ("+Inf",), series):
+                    cumulative += count
+                    labels = _metric_labels(self.labels, key, ("le", bound))
+                    lines.append(f"{self.name}_bucket{labels} {cumulative}")
+                labels = _metric_labels(self.labels, key)
+                lines.append(f"{self.name}_sum{labels} {series[-1]:.6f}")
+                lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+stage_seconds = Histogram(
+    "assistant_stage_duration_seconds",
+    "Time spent per request stage (cache_lookup, scrape, parse, fallback, llm, llm_stream, serialize).",
+    labels=("stage", "source"),
+)
+request_seconds = Histogram(
+    "assistant_request_duration_seconds",
+    "Time to produce a response per endpoint (the chat stream is in assistant_stream_duration_seconds).",
+    labels=("endpoint",),
+)
+stream_seconds = Histogram(
+    "assistant_stream_duration_seconds",
+    "Streamed responses: time from the request to the first event (first_event) and to the end (total).",
+    labels=("endpoint", "phase"),
+)
+upstream_requests = Counter(
+    "assistant_upstream_requests_total",
+    "Outbound calls per upstream by outcome (success, failure, rejected by an open circuit).",
+    labels=("service", "outcome"),
+)
+products_returned = Counter(
+    "assistant_products_returned_total",
+    "Products returned to shoppers, by the source that supplied them.",
+    labels=("source",),
+)
+llm_tokens = Histogram(
+    "assistant_llm_tokens",
+    "Tokens per DeepSeek completion, prompt and completion (estimated when the API omits usage).",
+    labels=("kind",),
+    buckets=(64, 128, 256, 384, 512, 768, 1024, 1536, 2048, 4096),
+)
+
+
+@contextmanager
+def timed_stage(stage, source=""):
+    """Record the duration of the enclosed block under stage_seconds"""
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        stage_seconds.observe(time.perf_counter() - started, stage=stage, source=source)
+
+
+def timed_events(events, endpoint, started):
+    """Yield from an event stream, recording under stream_seconds when its first event went out
+    and when it ended
+
+    started is the time.perf_counter() reading taken when the request arrived.
+    """
+    first = True
+    try:
+        for event in events:
+            if first:
+                stream_seconds.observe(time.perf_counter() - started, endpoint=endpoint, phase="first_event")
+                first = False
+            yield event
+    finally:
+        stream_seconds.observe(time.perf_counter() - started, endpoint=endpoint, phase="total")
+
+
+async def timed_async_events(events, endpoint, started):
+    """Async timed_events"""
+    first = True
+    try:
+        async for event in events:
+            if first:
+                stream_seconds.observe(time.perf_counter() - started, endpoint=endpoint, phase="first_event")
+                first = False
+            yield event
+    finally:
+        stream_seconds.observe(time.perf_counter() - started, endpoint=endpoint, phase="total")
+
+
+def count_products_returned(products):
+    for product in products:
+        products_returned.inc(source=product.get("source") or "unknown")
+
+
+def render_metrics():
+    lines = []
+    for metric in METRICS:
+        lines.extend(metric.render())
+    return "\n".join(lines) + "\n"
@@ -0,0 +1,526 @@
+"""Outbound HTTP: the pooled session, per-upstream circuit breakers and host rate limits.
+
+Every call to Flipkart, Amazon, DuckDuckGo, DeepSeek or a product image host goes through
+http_request, which checks the upstream's circuit, waits for a token from its host scheduler
+and records the outcome and latency.
+"""
+import asyncio
+import heapq
+import os
+import random
+import threading
+import time
+from collections import deque
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from logs import http_log
+from metrics import Histogram, upstream_requests
+
+# Optional brotli: requests/urllib3 and httpx only decode "br" responses when it is installed
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# HTTP headers for scraping e-commerce sites
+DEFAULT_HEADERS = {
+    "User-Agent": (
+        "Mozilla/5.0 (Windows NT 10.0; Win64; x64) "
+        "AppleWebKit/537.36 (KHTML, like Gecko) "
+        "Chrome/120.0.0.0 Safari/537.36"
+    ),
+    "Accept-Language": "en-US,en;q=0.9",
+    "Accept-Encoding": "gzip, deflate, br" if brotli is not None else "gzip, deflate",
+}
+
+
+# Outbound HTTP config (pool sizes are per host, timeouts are read timeouts in seconds)
+http_config = {
+    # Number of per-host connection pools kept alive
+    "pool_connections": int(os.getenv("HTTP_POOL_CONNECTIONS", "16")),
+    # Keep-alive connections kept per host
+    "pool_maxsize": int(os.getenv("HTTP_POOL_MAXSIZE", "32")),
+    "connect_timeout": float(os.getenv("HTTP_CONNECT_TIMEOUT", "3.05")),
+    # Concurrent outbound connections per process when served through asgi.py
+    "async_max_connections": int(os.getenv("ASYNC_HTTP_MAX_CONNECTIONS", "1000")),
+    "timeouts": {
+        "flipkart": float(os.getenv("HTTP_TIMEOUT_FLIPKART", "10")),
+        "amazon": float(os.getenv("HTTP_TIMEOUT_AMAZON", "10")),
+        "duckduckgo": float(os.getenv("HTTP_TIMEOUT_DUCKDUCKGO", "5")),
+        "deepseek": float(os.getenv("HTTP_TIMEOUT_DEEPSEEK", "30")),
+    },
+}
+
+# Shared keep-alive session used by every outbound call so TCP+TLS handshakes are reused
+_http_adapter = HTTPAdapter(
+    pool_connections=http_config["pool_connections"],
+    pool_maxsize=http_config["pool_maxsize"],
+)
+http_session = requests.Session()
+http_session.mount("https://", _http_adapter)
+http_session.mount("http://", _http_adapter)
+
+_http_lock = threading.Lock()
+_http_in_flight = {"current": 0, "peak": 0}
+
+
+# Per-upstream circuit breakers and latency-derived read timeouts
+breaker_config = {
+    # Failures within failure_window seconds that open a source's circuit, provided they are
+    # also at least failure_ratio of the calls made in that window
+    "failure_threshold": int(os.getenv("CIRCUIT_FAILURE_THRESHOLD", "5")),
+    "failure_ratio": float(os.getenv("CIRCUIT_FAILURE_RATIO", "0.5")),
+    "failure_window": float(os.getenv("CIRCUIT_FAILURE_WINDOW_SECONDS", "60")),
+    # How long an open circuit rejects calls before one half-open probe is let through
+    "reset_timeout": float(os.getenv("CIRCUIT_RESET_SECONDS", "30")),
+    # Read timeout = latency percentile x multiplier, kept between min_timeout and the static timeout
+    "timeout_percentile": float(os.getenv("ADAPTIVE_TIMEOUT_PERCENTILE", "0.95")),
+    "timeout_multiplier": float(os.getenv("ADAPTIVE_TIMEOUT_MULTIPLIER", "3")),
+    "min_timeout": float(os.getenv("ADAPTIVE_TIMEOUT_MIN_SECONDS", "2")),
+    "min_samples": int(os.getenv("ADAPTIVE_TIMEOUT_MIN_SAMPLES", "20")),
+    "latency_window": int(os.getenv("ADAPTIVE_TIMEOUT_WINDOW", "200")),
+}
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling an upstream whose circuit is open"""
+
+    def __init__(self, service):
+        super().__init__(f"circuit open for {service}")
+        self.service = service
+
+
+class SourceHealth:
+    """Circuit breaker and latency tracker for one upstream service
+
+    closed: calls flow; failure_threshold failures inside failure_window open the circuit
+        when they make up at least failure_ratio of that window's calls.
+    open: calls are rejected until reset_timeout (or a 429/503 Retry-After) has passed.
+    half_open: a single probe call is let through; its outcome closes or re-opens the circuit.
+    """
+
+    def __init__(self, service, static_timeout, config):
+        self.service = service
+        self.static_timeout = static_timeout
+        self.config = config
+        self.state = "closed"
+        self._outcomes = deque()  # (time.monotonic(), failed) for calls inside failure_window
+        self._window_failures = 0
+        self._open_until = 0.0
+        self._probe_started = None
+        self._latencies = deque(maxlen=config["latency_window"])
+        self._timeout = static_timeout
+        self._lock = threading.Lock()
+        self.stats = {"successes": 0, "failures": 0, "rejected": 0, "opened": 0}
+        self.last_failure = None
+
+    def allow(self):
+        """Whether a call may go out now; in half-open state only one probe at a time is allowed"""
+        now = time.monotonic()
+        with self._lock:
+            if self.state == "open" and now >= self._open_until:
+                self.state = "half_open"
+                self._probe_started = None
+            if self.state == "half_open":
+                # A probe that never reported back (caller crashed) is replaced after reset_timeout
+                if self._probe_started is None or now - self._probe_started > self.config["reset_timeout"]:
+                    self._probe_started = now
+                    return True
+            elif self.state == "closed":
+                return True
+            self.stats["rejected"] += 1
+        upstream_requests.inc(service=self.service, outcome="rejected")
+        return False
+
+    def release(self):
+        """Give back a probe slot taken by allow() for a call that was never sent"""
+        with self._lock:
+            if self.state == "half_open":
+                self._probe_started = None
+
+    def _record_outcome(self, now, failed):
+        # Called with the lock held
+        self._outcomes.append((now, failed))
+        self._window_failures += failed
+        while self._outcomes and now - self._outcomes[0][0] > self.config["failure_window"]:
+            self._window_failures -= self._outcomes.popleft()[1]
+
+    def record_success(self):
+        upstream_requests.inc(service=self.service, outcome="success")
+        with self._lock:
+            self.stats["successes"] += 1
+            if self.state != "closed":
+                http_log.info("circuit closed", extra={"service": self.service})
+                # The failures that opened the circuit must not re-open it straight away
+                self._outcomes.clear()
+                self._window_failures = 0
+            self.state = "closed"
+            self._probe_started = None
+            self._record_outcome(time.monotonic(), False)
+
+    def record_failure(self, reason, retry_after=None):
+        upstream_requests.inc(service=self.service, outcome="failure")
+        now = time.monotonic()
+        with self._lock:
+            self.stats["failures"] += 1
+            self.last_failure = reason
+            self._record_outcome(now, True)
+            if (
+                self.state == "half_open"
+                or retry_after is not None
+                or (
+                    self._window_failures >= self.config["failure_threshold"]
+                    and self._window_failures >= self.config["failure_ratio"] * len(self._outcomes)
+                )
+            ):
+                if self.state != "open":
+                    self.stats["opened"] += 1
+                    http_log.warning("circuit opened", extra={"service": self.service, "reason": reason})
+                self.state = "open"
+                self._open_until = now + max(retry_after or 0, self.config["reset_timeout"])
+                self._probe_started = None
+
+    def record_response(self, response, empty=False):
+        """Classify a response: blocks, throttling and server errors (or an empty result page) are failures"""
+        status = response.status_code
+        if status in (403, 429) or status >= 500:
+            retry_after = _retry_after_seconds(response) if status in (429, 503) else None
+            self.record_failure(f"HTTP {status}", retry_after)
+        elif empty:
+            self.record_failure("empty result page")
+        else:
+            self.record_success()
+
+    def record_latency(self, seconds):
+        with self._lock:
+            self._latencies.append(seconds)
+            if len(self._latencies) >= self.config["min_samples"]:
+                derived = self._percentile(self.config["timeout_percentile"]) * self.config["timeout_multiplier"]
+                self._timeout = min(self.static_timeout, max(self.config["min_timeout"], derived))
+
+    def _percentile(self, fraction):
+        # Called with the lock held
+        ordered = sorted(self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+    def timeout(self):
+        """Current read timeout: the static one until enough latencies have been observed"""
+        return self._timeout
+
+    def snapshot(self):
+        with self._lock:
+            return {
+                **self.stats,
+                "state": self.state,
+                "recent_failures": self._window_failures,
+                "recent_calls": len(self._outcomes),
+                "last_failure": self.last_failure,
+                "latency_p50": round(self._percentile(0.5), 3),
+                "latency_p95": round(self._percentile(0.95), 3),
+                "latency_samples": len(self._latencies),
+                "read_timeout": round(self._timeout, 3),
+            }
+
+
+def _retry_after_seconds(response):
+    try:
+        return float(response.headers.get("Retry-After", ""))
+    except ValueError:
+        return None
+
+
+SOURCE_HEALTH = {
+    service: SourceHealth(service, timeout, breaker_config)
+    for service, timeout in http_config["timeouts"].items()
+}
+
+
+def read_timeout(service):
+    health = SOURCE_HEALTH.get(service)
+    return health.timeout() if health is not None else http_config["timeouts"].get(service, 10)
+
+
+# Polite outbound scheduling: a token bucket per scraped host, with priority lanes so
+# interactive searches go out before background refreshes and batch jobs
+outbound_config = {
+    "enabled": os.getenv("OUTBOUND_RATE_LIMIT_ENABLED", "true").lower() in ("1", "true", "yes"),
+    # Sustained requests per second and burst size per upstream
+    "rates": {
+        "flipkart": float(os.getenv("OUTBOUND_RATE_FLIPKART", "3")),
+        "amazon": float(os.getenv("OUTBOUND_RATE_AMAZON", "2")),
+        "duckduckgo": float(os.getenv("OUTBOUND_RATE_DUCKDUCKGO", "5")),
+    },
+    "burst": {
+        "flipkart": int(os.getenv("OUTBOUND_BURST_FLIPKART", "6")),
+        "amazon": int(os.getenv("OUTBOUND_BURST_AMAZON", "4")),
+        "duckduckgo": int(os.getenv("OUTBOUND_BURST_DUCKDUCKGO", "10")),
+    },
+    # Longest a request waits for its turn before giving up, per lane
+    "max_wait": {
+        "interactive": float(os.getenv("OUTBOUND_MAX_WAIT_INTERACTIVE_SECONDS", "4")),
+        "refresh": float(os.getenv("OUTBOUND_MAX_WAIT_REFRESH_SECONDS", "30")),
+        "batch": float(os.getenv("OUTBOUND_MAX_WAIT_BATCH_SECONDS", "60")),
+    },
+    # A 429/503 pauses the host for backoff_base * 2^(throttles in a row), half of it jittered,
+    # up to backoff_max; a longer Retry-After wins
+    "backoff_base": float(os.getenv("OUTBOUND_BACKOFF_BASE_SECONDS", "2")),
+    "backoff_max": float(os.getenv("OUTBOUND_BACKOFF_MAX_SECONDS", "60")),
+    # Worker processes sharing the budget (serve.py sets WEB_CONCURRENCY); each paces itself
+    # with an equal share so the host sees the configured rate in total
+    "workers": max(1, int(os.getenv("WEB_CONCURRENCY") or "1")),
+}
+
+# Lower goes first; waiters in the same lane are served in arrival order
+OUTBOUND_LANES = {"interactive": 0, "refresh": 1, "batch": 2}
+
+outbound_queue_seconds = Histogram(
+    "assistant_outbound_queue_wait_seconds",
+    "Time outbound requests waited for a rate-limit token, per upstream and lane.",
+    labels=("service", "lane"),
+)
+
+
+class OutboundQueueTimeout(Exception):
+    """Raised when a request waited its lane's max_wait without getting a token"""
+
+    def __init__(self, service, lane):
+        super().__init__(f"{service} {lane} queue wait exceeded")
+        self.service = service
+        self.lane = lane
+
+
+class _OutboundTicket:
+    __slots__ = ("lane", "signal", "granted", "queued_at")
+
+    def __init__(self, lane, signal):
+        self.lane = lane
+        self.signal = signal
+        self.granted = False
+        self.queued_at = time.monotonic()
+
+
+class HostScheduler:
+    """Token bucket for one upstream host with priority lanes and jittered throttle backoff
+
+    Tokens are handed out strictly by lane priority, then arrival. Whichever waiter wakes first
+    grants every token due to the front of the queue and signals the winners, so threads
+    (acquire) and event-loop tasks (acquire_async) share one bucket.
+    """
+
+    def __init__(self, service, rate, burst, config):
+        if rate <= 0:
+            raise ValueError(f"outbound rate for {service} must be positive, got {rate}")
+        self.service = service
+        self.rate = rate
+        self.burst = max(1, burst)
+        self.config = config
+        self._tokens = float(self.burst)
+        self._refilled_at = time.monotonic()
+        self._paused_until = 0.0
+        self._throttles = 0
+        self._waiters = []  # heap of (lane priority, seq, ticket)
+        self._seq = 0
+        self._lock = threading.Lock()
+        self.stats = {"granted": 0, "queue_timeouts": 0, "throttled": 0}
+
+    def _join(self, lane, signal):
+        ticket = _OutboundTicket(lane, signal)
+        with self._lock:
+            self._seq += 1
+            heapq.heappush(self._waiters, (OUTBOUND_LANES[lane], self._seq, ticket))
+        return ticket
+
+    def _dispatch(self):
+        """Grant due tokens to the front of the queue; returns seconds until the next one is due"""
+        now = time.monotonic()
+        granted = []
+        with self._lock:
+            self._tokens = min(self.burst, self._tokens + (now - self._refilled_at) * self.rate)
+            self._refilled_at = now
+            while self._waiters and now >= self._paused_until and self._tokens >= 1:
+                ticket = heapq.heappop(self._waiters)[2]
+                ticket.granted = True
+                self._tokens -= 1
+                self.stats["granted"] += 1
+                granted.append(ticket)
+            if now < self._paused_until:
+                delay = self._paused_until - now
+            else:
+                delay = (1 - self._tokens) / self.rate if self._tokens < 1 else 0.0
+        for ticket in granted:
+            ticket.signal()
+        return max(delay, 0.001)
+
+    def _abandon(self, ticket, timed_out=True):
+        """Leave the queue; False when the token was granted in the meantime"""
+        with self._lock:
+            if ticket.granted:
+                return False
+            self._waiters = [entry for entry in self._waiters if entry[2] is not ticket]
+            heapq.heapify(self._waiters)
+            self.stats["queue_timeouts"] += timed_out
+        outbound_queue_seconds.observe(time.monotonic() - ticket.queued_at, service=self.service, lane=ticket.lane)
+        return True
+
+    def _granted(self, ticket):
+        waited = time.monotonic() - ticket.queued_at
+        outbound_queue_seconds.observe(waited, service=self.service, lane=ticket.lane)
+        return waited
+
+    def acquire(self, lane="interactive"):
+        """Block until a request may be sent; returns the seconds spent queued"""
+        wake = threading.Event()
+        ticket = self._join(lane, wake.set)
+        give_up_at = ticket.queued_at + self.config["max_wait"][lane]
+        while True:
+            delay = self._dispatch()
+            if ticket.granted:
+                return self._granted(ticket)
+            remaining = give_up_at - time.monotonic()
+            if remaining <= 0 and self._abandon(ticket):
+                raise OutboundQueueTimeout(self.service, lane)
+            wake.wait(min(delay, max(remaining, 0.001)))
+
+    async def acquire_async(self, lane="interactive"):
+        """Event-loop counterpart of acquire"""
+        loop = asyncio.get_running_loop()
+        wake = asyncio.Event()
+        ticket = self._join(lane, lambda: loop.call_soon_threadsafe(wake.set))
+        give_up_at = ticket.queued_at + self.config["max_wait"][lane]
+        try:
+            while True:
+                delay = self._dispatch()
+                if ticket.granted:
+                    return self._granted(ticket)
+                remaining = give_up_at - time.monotonic()
+                if remaining <= 0 and self._abandon(ticket):
+                    raise OutboundQueueTimeout(self.service, lane)
+                try:
+                    await asyncio.wait_for(wake.wait(), min(delay, max(remaining, 0.001)))
+                except asyncio.TimeoutError:
+                    pass
+        except asyncio.CancelledError:
+            # A granted token is spent either way; a queued ticket must not block the lane
+            self._abandon(ticket, timed_out=False)
+            raise
+
+    def record_response(self, status, retry_after=None):
+        """Pause the host after a 429/503; any other response resets the backoff"""
+        with self._lock:
+            if status not in (429, 503):
+                self._throttles = 0
+                return
+            self._throttles += 1
+            self.stats["throttled"] += 1
+            backoff = min(self.config["backoff_max"], self.config["backoff_base"] * 2 ** (self._throttles - 1))
+            pause = max(backoff / 2 + random.uniform(0, backoff / 2), retry_after or 0)
+            self._paused_until = max(self._paused_until, time.monotonic() + pause)
+            self._tokens = 0.0
+        http_log.warning("upstream throttled, pausing", extra={
+            "service": self.service, "status": status, "pause": round(pause, 2),
+        })
+
+    def snapshot(self):
+        with self._lock:
+            queued = {}
+            for _, _, ticket in self._waiters:
+                queued[ticket.lane] = queued.get(ticket.lane, 0) + 1
+            return {
+                **self.stats,
+                "rate": self.rate,
+                "burst": self.burst,
+                "tokens": round(min(self.burst, self._tokens), 2),
+                "queued": queued,
+                "paused_for": round(max(0.0, self._paused_until - time.monotonic()), 2),
+            }
+
+
+HOST_SCHEDULERS = {
+    service: HostScheduler(
+        service,
+        rate / outbound_config["workers"],
+        outbound_config["burst"].get(service, 1) // outbound_config["workers"],
+        outbound_config,
+    )
+    for service, rate in outbound_config["rates"].items()
+    # A rate of 0 leaves the host unpaced
+    if rate > 0
+} if outbound_config["enabled"] else {}
+
+
+def http_request(method, url, service, report_outcome=True, lane="interactive", **kwargs):
+    """Send an outbound request through the pooled session with the service's timeouts
+
+    Rate-limited services first wait for a token in the given lane (OutboundQueueTimeout after
+    the lane's max_wait). Raises CircuitOpenError without sending anything while the service's
+    circuit is open; that check comes first, so a rejected call neither queues nor spends a token.
+    Transport errors always count against the circuit; with report_outcome=False the caller
+    judges the response itself (e.g. a captcha page served with status 200).
+    """
+    health = SOURCE_HEALTH.get(service)
+    if health is not None and not health.allow():
+        raise CircuitOpenError(service)
+    scheduler = HOST_SCHEDULERS.get(service)
+    if scheduler is not None:
+        try:
+            scheduler.acquire(lane)
+        except OutboundQueueTimeout:
+            if health is not None:
+                health.release()
+            raise
+    kwargs.setdefault("timeout", (http_config["connect_timeout"], read_timeout(service)))
+    with _http_lock:
+        _http_in_flight["current"] += 1
+        _http_in_flight["peak"] = max(_http_in_flight["peak"], _http_in_flight["current"])
+    started = time.perf_counter()
+    try:
+        response = http_session.request(method, url, **kwargs)
+    except Exception as exc:
+        if health is not None:
+            health.record_failure(type(exc).__name__)
+        raise
+    finally:
+        with _http_lock:
+            _http_in_flight["current"] -= 1
+    if scheduler is not None:
+        scheduler.record_response(response.status_code, _retry_after_seconds(response))
+    if health is not None:
+        # Streamed responses return at the headers, which says nothing about full latency
+        if not kwargs.get("stream"):
+            health.record_latency(time.perf_counter() - started)
+        if report_outcome:
+            health.record_response(response)
+    return response
+
+
+def http_pool_stats():
+    """Per-host connection pool usage; in_use at pool_maxsize means requests are overflowing"""
+    manager = _http_adapter.poolmanager
+    hosts = {}
+    for key in manager.pools.keys():
+        pool = manager.pools.get(key)
+        if pool is None:
+            continue
+        maxsize = pool.pool.maxsize if pool.pool else 0
+        idle_slots = pool.pool.qsize() if pool.pool else 0
+        in_use = maxsize - idle_slots
+        hosts[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+            "maxsize": maxsize,
+            "in_use": in_use,
+            "saturation": round(in_use / maxsize, 4) if maxsize else 0.0,
+            "connections_opened": pool.num_connections,
+            # Connections opened beyond maxsize were discarded after use instead of kept alive
+            "overflow_connections": max(0, pool.num_connections - maxsize),
+            "requests": pool.num_requests,
+        }
+    with _http_lock:
+        in_flight = dict(_http_in_flight)
+    return {
+        "pool_connections": http_config["pool_connections"],
+        "pool_maxsize": http_config["pool_maxsize"],
+        "in_flight": in_flight["current"],
+        "peak_in_flight": in_flight["peak"],
+        "hosts": hosts,
+    }
@@ -0,0 +1,317 @@
+"""Parse a shopper's message into category, brand, price range and marketplace constraints."""
+import functools
+import os
+import re
+import threading
+
+# Query understanding: one parser turns a shopper's message into structured constraints
+# (category, brand, price range and currency, marketplace) that every search source uses
+query_config = {
+    # Parsed messages memoized per process
+    "cache_size": int(os.getenv("QUERY_PARSE_CACHE_SIZE", "4096")),
+    # Rupees per US dollar, for "$" budgets and the legacy catalog's USD prices
+    "usd_inr_rate": float(os.getenv("USD_INR_RATE", "83")),
+}
+
+CATEGORY_KEYWORDS = {
+    "watch": ("watch", "watches", "smartwatch", "smartwatches", "smart watch", "timepiece", "wristwatch",
+              "fitness band", "fitness tracker"),
+    "headphone": ("headphone", "headphones", "earphone", "earphones", "earbuds", "headset", "neckband", "tws"),
+    "laptop": ("laptop", "laptops", "notebook", "macbook", "chromebook", "ultrabook"),
+    "phone": ("phone", "phones", "smartphone", "smartphones", "mobile", "mobiles", "iphone"),
+    "mouse": ("mouse", "mice", "computer mouse"),
+    "keyboard": ("keyboard", "keyboards", "mechanical keyboard"),
+    "backpack": ("backpack", "backpacks", "bag", "bags", "laptop bag", "rucksack"),
+    "charger": ("charger", "chargers", "wireless charger", "power bank"),
+    "hub": ("hub", "usb hub", "adapter", "dongle"),
+    "speaker": ("speaker", "speakers", "soundbar", "bluetooth speaker"),
+    "monitor": ("monitor", "monitors"),
+    "tv": ("tv", "tvs", "television", "smart tv"),
+    "camera": ("camera", "cameras", "dslr", "webcam"),
+    "shoes": ("shoe", "shoes", "sneakers", "running shoes"),
+}
+KNOWN_BRANDS = {
+    "acer", "adidas", "amazfit", "anker", "apple", "asus", "boat", "bose", "canon", "dell", "fastrack",
+    "fire-boltt", "hp", "jbl", "lenovo", "lg", "logitech", "mi", "motorola", "nike", "noise", "nikon",
+    "oneplus", "oppo", "philips", "portronics", "puma", "realme", "redmi", "samsung", "sennheiser",
+    "skullcandy", "sony", "titan", "vivo", "xiaomi", "zebronics",
+}
+MARKETPLACE_KEYWORDS = {"flipkart": "Flipkart", "amazon": "Amazon"}
+
+# Single words that name a category ("earbuds" -> "headphone")
+CATEGORY_OF_WORD = {
+    phrase: category
+    for category, phrases in CATEGORY_KEYWORDS.items()
+    for phrase in phrases
+    if " " not in phrase
+}
+
+# An amount of money: optional currency, number, optional k/lakh and trailing currency. Sizes,
+# capacities, durations and ratings ("27 inch", "16gb", "2 years", "4.5 stars") are not money.
+_PRICE_AMOUNT = re.compile(
+    r"(?<![\w.])(₹|rs\.?|inr|\$|usd)?\s*(\d[\d,]*(?:\.\d+)?)(?![.,]?\d)\s*(k|thousand|lakhs?|lacs?)?\b"
+    r"(?:\s*(rupees|rs\b|inr\b|dollars|usd\b|bucks))?"
+    r"(?!\s*(?:inch|inches|\"|gb|tb|mb|mah|hz|mp\b|w\b|watts?|years?|yrs?|months?|days?|hours?|hrs?|mm|cm|kg|"
+    r"stars?|\+|★|%|x\b|p\b))"
+)
+_PRICE_RANGE_GAP = re.compile(r"\s*(?:-|–|to|and)\s*")
+_UNIT_MULTIPLIERS = {"k": 1000, "thousand": 1000, "lakh": 100000, "lakhs": 100000, "lac": 100000, "lacs": 100000}
+_PRICE_BEFORE = re.compile(
+    r"\b(under|below|less\s+than|cheaper\s+than|within|up\s*to|upto|max(?:imum)?|budget(?:\s+of)?|"
+    r"over|above|more\s+than|at\s+least|min(?:imum)?|starting\s+(?:at|from)|"
+    r"between|from|around|about|approx(?:imately)?|near|for)\s*$"
+)
+_MAX_WORDS = {"under", "below", "within", "up to", "upto", "max", "maximum", "budget", "budget of",
+              "less than", "cheaper than"}
+_MIN_WORDS = {"over", "above", "more than", "at least", "min", "minimum", "starting at", "starting from"}
+_RESOLUTION_WORDS = {"tv", "tvs", "monitor", "monitors", "display", "video", "camera", "uhd", "hdr", "oled",
+                     "qled", "led", "gaming", "resolution", "projector"}
+_MARKETPLACE_MENTION = re.compile(r"(?:\b(?:on|from|at|in|via)\s+)?\b(?:flipkart|amazon)\b(?:\.in|\.com)?")
+_QUERY_TOKEN = re.compile(r"[a-z0-9][a-z0-9&+'-]*")
+_PRICE_VALUE = re.compile(r"\d[\d,]*(?:\.\d+)?")
+
+query_parse_stats = {"filtered_out": 0, "filter_skipped": 0, "sources_skipped": 0}
+_query_parse_lock = threading.Lock()
+
+
+class KeywordMatcher:
+    """Word-level trie that finds many (multi-word) keywords in one left-to-right pass
+
+    Matches are leftmost-longest and never overlap, so "laptop bag" is a backpack, not a laptop.
+    """
+
+    def __init__(self, keywords):
+        self.root = {}
+        for phrase, value in keywords:
+            node = self.root
+            for word in phrase.split():
+                node = node.setdefault(word, {})
+            node[None] = value
+
+    def find(self, words):
+        """[(start, end, value)] for the keywords in a list of words"""
+        matches = []
+        start = 0
+        while start < len(words):
+            node = self.root
+            best = None
+            end = start
+            while end < len(words) and words[end] in node:
+                node = node[words[end]]
+                end += 1
+                if None in node:
+                    best = (start, end, node[None])
+            if best is None:
+                start += 1
+            else:
+                matches.append(best)
+                start = best[1]
+        return matches
+
+
+QUERY_KEYWORDS = KeywordMatcher(
+    [(phrase, ("category", category)) for category, phrases in CATEGORY_KEYWORDS.items() for phrase in phrases]
+    + [(brand, ("brand", brand)) for brand in KNOWN_BRANDS]
+    + [(word, ("marketplace", name)) for word, name in MARKETPLACE_KEYWORDS.items()]
+)
+
+
+class ParsedQuery:
+    """What a message asks for; cached and shared between callers, so treat it as read-only
+
+    min_price/max_price are in currency (either may be None); terms are the message's words
+    minus prices, brand and marketplace; search_text is the message without the marketplace
+    mention, for sending to the marketplaces themselves.
+    """
+
+    __slots__ = ("text", "category", "brand", "marketplace", "min_price", "max_price", "currency", "terms",
+                 "search_text")
+
+    def __init__(self, text, category, brand, marketplace, min_price, max_price, currency, terms, search_text):
+        self.text = text
+        self.category = category
+        self.brand = brand
+        self.marketplace = marketplace
+        self.min_price = min_price
+        self.max_price = max_price
+        self.currency = currency
+        self.terms = terms
+        self.search_text = search_text
+
+    @property
+    def has_price(self):
+        return self.min_price is not None or self.max_price is not None
+
+    def price_range(self, currency="INR"):
+        """(min, max) converted to currency; either may be None"""
+        if currency == self.currency:
+            return self.min_price, self.max_price
+        rate = query_config["usd_inr_rate"]
+        factor = rate if currency == "INR" else 1 / rate
+        return tuple(None if value is None else value * factor for value in (self.min_price, self.max_price))
+
+    def as_dict(self):
+        return {name: getattr(self, name) for name in self.__slots__}
+
+
+def _amount_value(match, unit=None):
+    return float(match.group(2).replace(",", "")) * _UNIT_MULTIPLIERS.get(unit or match.group(3), 1)
+
+
+def _amount_currency(match):
+    marker = (match.group(1) or match.group(4) or "").rstrip(".")
+    if marker in ("$", "usd", "dollars", "bucks"):
+        return "USD"
+    if marker or match.group(3):
+        return "INR"
+    return None
+
+
+def _parse_price(text):
+    """(min, max, currency, text without the prices) for a lowercased message"""
+    amounts = [
+        match for match in _PRICE_AMOUNT.finditer(text)
+        # "4k tv" is a resolution, not a budget
+        if not (match.group(3) == "k" and not match.group(1)
+                and text[match.end():].split()[:1] and text[match.end():].split()[0] in _RESOLUTION_WORDS)
+    ]
+    low = high = approx = None
+    currency = None
+    spans = []
+    index = 0
+    while index < len(amounts):
+        match = amounts[index]
+        before = _PRICE_BEFORE.search(text, 0, match.start())
+        keyword = " ".join(before.group(1).split()) if before else None
+        start = before.start() if before else match.start()
+        following = amounts[index + 1] if index + 1 < len(amounts) else None
+        if following is not None and _PRICE_RANGE_GAP.fullmatch(text[match.end():following.start()]):
+            first, second = _amount_value(match), _amount_value(following)
+            # "2-5k" is 2k-5k
+            if following.group(3) and not match.group(3) and first < 1000:
+                first = _amount_value(match, following.group(3))
+            explicit = _amount_currency(match) or _amount_currency(following)
+            if explicit or keyword in ("between", "from") or min(first, second) >= 100:
+                low, high = sorted((first, second))
+                currency = currency or explicit
+                spans.append((start, following.end()))
+                index += 2
+                continue
+        value = _amount_value(match)
+        explicit = _amount_currency(match)
+        if keyword in _MAX_WORDS:
+            high = value
+        elif keyword in _MIN_WORDS:
+            low = value
+        # A bare number after "around" or "for" is only a budget when it is a plausible price:
+        # "gift for 2 people" and "around 50 guests" name no budget
+        elif explicit or (keyword in ("around", "about", "approx", "approximately", "near", "for")
+                          and value >= 100):
+            approx = value
+        else:
+            index += 1
+            continue
+        currency = currency or explicit
+        spans.append((start, match.end()))
+        index += 1
+    if low is None and high is None and approx is not None:
+        # A bare budget ("watch 20k", "$200") means that much up to a quarter more
+        low, high = approx, approx * 1.25
+    for start, end in reversed(spans):
+        text = text[:start] + " " + text[end:]
+    return low, high, currency or "INR", text
+
+
+@functools.lru_cache(maxsize=query_config["cache_size"])
+def _understand(text):
+    min_price, max_price, currency, rest = _parse_price(text)
+    words = _QUERY_TOKEN.findall(rest)
+    category = brand = marketplace = None
+    terms = []
+    position = 0
+    for start, end, (kind, value) in QUERY_KEYWORDS.find(words):
+        terms.extend(words[position:start])
+        position = end
+        if kind == "category":
+            category = category or value
+            terms.extend(words[start:end])
+        elif kind == "brand":
+            brand = brand or value
+        else:
+            marketplace = marketplace or value
+    terms.extend(words[position:])
+    search_text = " ".join(_MARKETPLACE_MENTION.sub(" ", text).split()) if marketplace else text
+    return ParsedQuery(text, category, brand, marketplace, min_price, max_price, currency, tuple(terms),
+                       search_text or text)
+
+
+def understand_query(query):
+    """Structured constraints for a message; parses are memoized on the normalized text"""
+    return _understand(" ".join((query or "").lower().split()))
+
+
+def product_price(product):
+    """First number in a product's display price ("₹1,299" -> 1299.0), or None"""
+    match = _PRICE_VALUE.search(str(product.get("price") or ""))
+    return float(match.group().replace(",", "")) if match else None
+
+
+def product_rating(product):
+    try:
+        return float(str(product.get("rating") or "").split()[0])
+    except (ValueError, IndexError):
+        return None
+
+
+def product_matches_query(product, parsed, min_price=None, max_price=None):
+    """Whether a product fits the parsed brand, marketplace and (rupee) price bounds"""
+    if parsed.marketplace and product.get("source") in MARKETPLACE_KEYWORDS.values() \
+            and product.get("source") != parsed.marketplace:
+        return False
+    if parsed.brand and parsed.brand not in _QUERY_TOKEN.findall(product.get("name", "").lower()):
+        return False
+    price = product_price(product)
+    # Listings without a price ("Check website") are kept; the marketplace decides
+    if price is not None:
+        if min_price is not None and price < min_price:
+            return False
+        if max_price is not None and price > max_price:
+            return False
+    return True
+
+
+def count_query_parse(stat, amount=1):
+    with _query_parse_lock:
+        query_parse_stats[stat] += amount
+
+
+def filter_products_for_query(products, query):
+    """Drop products that contradict the query's brand, marketplace or budget
+
+    Applied to every source before results are serialized or handed to the LLM. When nothing
+    would be left the products are returned unfiltered, so a strict query never ends empty.
+    """
+    parsed = understand_query(query)
+    if not products or not (parsed.brand or parsed.marketplace or parsed.has_price):
+        return products
+    min_price, max_price = parsed.price_range("INR")
+    kept = [product for product in products if product_matches_query(product, parsed, min_price, max_price)]
+    if not kept:
+        count_query_parse("filter_skipped")
+        return products
+    count_query_parse("filtered_out", len(products) - len(kept))
+    return kept
+
+
+def query_parse_snapshot():
+    info = _understand.cache_info()
+    with _query_parse_lock:
+        stats = dict(query_parse_stats)
+    lookups = info.hits + info.misses
+    return {
+        "cache_hits": info.hits,
+        "cache_misses": info.misses,
+        "cache_entries": info.currsize,
+        "hit_rate": round(info.hits / lookups, 4) if lookups else 0.0,
+        **stats,
+    }
@@ -0,0 +1,45 @@
+"""Multi-process production launcher for the chat backend.
+
+Runs asgi.py in one uvicorn worker process per CPU core behind a single port. Workers
+share product results and DeepSeek replies through a SQLite store (SHARED_CACHE_PATH),
+coordinate so only one of them scrapes a given query at a time, and warm their
+in-memory caches from that store when they start.
+
+Usage (from the backend directory):
+    python serve.py [--workers 4] [--host 0.0.0.0] [--port 5000]
+"""
+import argparse
+import os
+
+import uvicorn
+
+BACKEND_DIR = os.path.dirname(os.path.abspath(__file__))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--workers", type=int,
+                        default=int(os.getenv("WEB_CONCURRENCY") or os.cpu_count() or 1),
+                        help="worker processes (default: WEB_CONCURRENCY, else one per core)")
+    parser.add_argument("--host", default=os.getenv("HOST", "0.0.0.0"))
+    parser.add_argument("--port", type=int, default=int(os.getenv("PORT", "5000")))
+    parser.add_argument("--log-level", default="warning", help="uvicorn's own log level")
+    args = parser.parse_args()
+
+    # Inherited by the workers: the shared store location and how many processes split the
+    # outbound rate limits
+    os.environ["WEB_CONCURRENCY"] = str(args.workers)
+    os.environ.setdefault("SHARED_CACHE_PATH", os.path.join(BACKEND_DIR, "data", "shared_cache.db"))
+
+    uvicorn.run(
+        "asgi:app",
+        host=args.host,
+        port=args.port,
+        workers=args.workers,
+        log_level=args.log_level,
+        app_dir=BACKEND_DIR,
+    )
+
+
+if __name__ == "__main__":
+    main()
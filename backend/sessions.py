@@ -0,0 +1,264 @@
+"""Conversation sessions that answer follow-up refinements from the previous product pool."""
+import os
+import re
+import secrets
+import threading
+
+from caching import ResultCache
+from query_understanding import CATEGORY_OF_WORD, product_price, product_rating, understand_query
+
+# Conversation sessions: each chat session keeps its last product pool and the constraints
+# parsed so far, so follow-ups like "cheaper ones" or "only Sony" are answered by filtering
+# and re-ranking that pool instead of scraping again
+session_config = {
+    "enabled": os.getenv("SESSIONS_ENABLED", "true").lower() in ("1", "true", "yes"),
+    # Idle time after which a session is forgotten (every turn restarts the clock)
+    "ttl": int(os.getenv("SESSION_TTL_SECONDS", "1800")),
+    "max_entries": int(os.getenv("SESSION_MAX_ENTRIES", "10000")),
+    "max_bytes": int(os.getenv("SESSION_MAX_BYTES", str(32 * 1024 * 1024))),
+    # Products kept per session for later refinements
+    "max_products": int(os.getenv("SESSION_MAX_PRODUCTS", "24")),
+}
+
+# In memory, LRU-bounded; with SHARED_CACHE_PATH set, sessions also spill to the shared SQLite
+# store, so they survive eviction and restarts and follow the shopper across worker processes
+chat_sessions = ResultCache(session_config["max_entries"], session_config["max_bytes"], namespace="sessions")
+session_stats = {"created": 0, "resumed": 0, "expired": 0, "refined": 0, "refine_misses": 0, "searches": 0}
+_session_lock = threading.Lock()
+
+_SESSION_ID = re.compile(r"^[A-Za-z0-9_-]{8,64}$")
+
+_MIN_RATING = re.compile(
+    r"\b(?:rated\s+)?(?:above|over|at\s+least)?\s*([1-5](?:\.\d)?)\s*(?:\+|stars?|★)\s*(?:and\s+(?:above|up)|or\s+more|rating)?"
+)
+_CHEAPER = re.compile(r"\b(?:cheaper|less\s+expensive|lower\s+price[ds]?|more\s+affordable|budget)\b")
+_PRICIER = re.compile(r"\b(?:pricier|costlier|more\s+expensive|premium|high(?:er)?[\s-]end)\b")
+_SORT_PRICE = re.compile(r"\b(?:cheapest|lowest\s+price|sort(?:ed)?\s+by\s+price|price\s+low\s+to\s+high)\b")
+_SORT_RATING = re.compile(r"\b(?:best|top|highest)[\s-]rated\b|\bbest\s+reviewed\b|\bsort(?:ed)?\s+by\s+rating\b")
+
+# Words a follow-up may contain besides its constraints; anything else makes it a new search
+REFINEMENT_WORDS = {
+    "a", "about", "affordable", "all", "also", "an", "and", "any", "are", "brand", "budget", "but", "by",
+    "can", "cheaper", "cheapest", "costlier", "costs", "do", "end", "even", "expensive", "filter", "first",
+    "for", "from", "give", "have", "high", "higher", "highest", "how", "i", "in", "instead", "is", "just",
+    "less", "list", "low", "lower", "made", "me", "more", "much", "now", "of", "on", "one", "ones", "only",
+    "option", "options", "or", "please", "premium", "price", "priced", "prices", "pricier", "rated", "rating",
+    "ratings", "reviewed", "show", "something", "sort", "sorted", "star", "stars", "that", "the", "them",
+    "there", "these", "those", "to", "top", "want", "what", "which", "with", "you", "best", "see", "some",
+    "need", "like", "would", "could", "products", "items", "maybe", "thanks", "ok", "okay", "above", "over",
+    "at", "least", "up", "between",
+}
+# Follow-up words that narrow the current product rather than name a new one ("red ones");
+# they filter the pool by name and are added to the search when the pool has no match
+ATTRIBUTE_WORDS = {
+    "black", "white", "grey", "gray", "silver", "gold", "red", "blue", "green", "pink", "purple", "yellow",
+    "orange", "brown", "beige", "navy", "leather", "metal", "steel", "wooden", "cotton", "wireless", "wired",
+    "bluetooth", "waterproof", "compact", "lightweight", "portable", "foldable", "mini", "small", "large",
+    "slim", "rgb", "gaming",
+}
+
+
+def parse_refinement(user_message, products=(), category=None):
+    """Constraints a message puts on a product list, plus the words it leaves unexplained
+
+    Price bounds (INR), brand and marketplace come from understand_query; minimum rating,
+    relative price ("cheaper"/"pricier") and sort order are follow-up specific. Brands are
+    also recognised from the first word of the given products' names, and words naming the
+    session's category ("cheaper headphones") do not count as a new product.
+    """
+    parsed = understand_query(user_message)
+    text = parsed.text
+    constraints = {}
+
+    match = _MIN_RATING.search(text)
+    if match:
+        constraints["min_rating"] = float(match.group(1))
+    min_price, max_price = parsed.price_range("INR")
+    if min_price is not None:
+        constraints["min_price"] = min_price
+    if max_price is not None:
+        constraints["max_price"] = max_price
+    if parsed.marketplace:
+        constraints["source"] = parsed.marketplace
+    if parsed.brand:
+        constraints["brand"] = parsed.brand
+    if _SORT_PRICE.search(text):
+        constraints["sort"] = "price"
+    elif _SORT_RATING.search(text):
+        constraints["sort"] = "rating"
+    if _CHEAPER.search(text):
+        constraints["relative"] = "cheaper"
+    elif _PRICIER.search(text):
+        constraints["relative"] = "pricier"
+
+    pool_brands = {p["name"].split()[0].lower() for p in products if p.get("name")}
+    leftover = []
+    for word in parsed.terms:
+        if word in pool_brands and "brand" not in constraints:
+            constraints["brand"] = word
+        elif word in ATTRIBUTE_WORDS:
+            constraints.setdefault("keywords", []).append(word)
+        elif word in REFINEMENT_WORDS or word[0].isdigit():
+            continue
+        elif category is None or CATEGORY_OF_WORD.get(word) != category:
+            leftover.append(word)
+    return constraints, leftover
+
+
+def merge_constraints(previous, constraints, shown_prices):
+    """Apply a follow-up's constraints on top of the session's; relative price words resolve
+    against the median price of the products shown last turn
+
+    A bound that came from "cheaper"/"pricier" (relative_bound) only holds until the next
+    price or brand constraint, which replaces it instead of narrowing it further.
+    """
+    previous = dict(previous)
+    constraints = dict(constraints)
+    if previous.get("relative_bound") and (
+        constraints.keys() & {"min_price", "max_price", "relative", "brand"}
+    ):
+        previous.pop(previous.pop("relative_bound"), None)
+    relative = constraints.pop("relative", None)
+    if relative and shown_prices:
+        middle = sorted(shown_prices)[len(shown_prices) // 2]
+        bound = "max_price" if relative == "cheaper" else "min_price"
+        if bound not in constraints:
+            constraints[bound] = middle - 1 if relative == "cheaper" else middle + 1
+            constraints["relative_bound"] = bound
+        if relative == "cheaper":
+            constraints.setdefault("sort", "price")
+    merged = {**previous, **constraints}
+    if merged.get("relative_bound") and merged["relative_bound"] not in merged:
+        del merged["relative_bound"]
+    # A new bound that contradicts an older one wins
+    if merged.get("min_price") is not None and merged.get("max_price") is not None \
+            and merged["min_price"] > merged["max_price"]:
+        merged.pop("max_price" if "min_price" in constraints else "min_price")
+    return merged
+
+
+def refine_products(products, constraints):
+    """Filter and re-rank an already fetched product list; relevance order is kept unless sorting"""
+    refined = []
+    for product in products:
+        price = product_price(product)
+        if constraints.get("min_price") is not None and (price is None or price < constraints["min_price"]):
+            continue
+        if constraints.get("max_price") is not None and (price is None or price > constraints["max_price"]):
+            continue
+        if constraints.get("min_rating") is not None and (product_rating(product) or 0) < constraints["min_rating"]:
+            continue
+        if constraints.get("source") and product.get("source") != constraints["source"]:
+            continue
+        if constraints.get("brand") and constraints["brand"] not in product.get("name", "").lower().split():
+            continue
+        if constraints.get("keywords"):
+            words = set(re.findall(r"\w+", f"{product.get('name', '')} {product.get('description', '')}".lower()))
+            if not words.issuperset(constraints["keywords"]):
+                continue
+        refined.append(product)
+    if constraints.get("sort") == "price":
+        refined.sort(key=lambda product: product_price(product) or 0)
+    elif constraints.get("sort") == "rating":
+        refined.sort(key=lambda product: product_rating(product) or 0, reverse=True)
+    return [dict(product) for product in refined]
+
+
+def constraint_query(base_query, constraints):
+    """Search text for a session's base query with the conversation's current constraints
+    spelled out, e.g. ("wireless headphones", {brand: sony, max_price: 3000}) ->
+    "sony wireless headphones under 3000"; rating and sort order are applied locally"""
+    words = [word for word in understand_query(base_query).terms if word not in REFINEMENT_WORDS]
+    words = [word for word in constraints.get("keywords", ()) if word not in words] + words
+    if constraints.get("brand"):
+        words.insert(0, constraints["brand"])
+    low, high = constraints.get("min_price"), constraints.get("max_price")
+    if low is not None and high is not None:
+        words.append(f"between {low:.0f} and {high:.0f}")
+    elif high is not None:
+        words.append(f"under {high:.0f}")
+    elif low is not None:
+        words.append(f"above {low:.0f}")
+    if constraints.get("source"):
+        words.append(f"on {constraints['source'].lower()}")
+    return " ".join(words) or base_query
+
+
+def _count_session(stat):
+    with _session_lock:
+        session_stats[stat] += 1
+
+
+def begin_chat_turn(session_id, user_message):
+    """Resolve a product-search message against its conversation session
+
+    Returns the turn: session_id, the query to search with, the base query the session keeps
+    (the message that started the current product search), the merged constraints and products,
+    which holds the session's earlier results refined for this message (empty means the caller
+    has to search; refined says which). Pass it to finish_chat_turn once the reply is ready.
+    """
+    turn = {"session_id": None, "session": None, "query": user_message, "base_query": user_message,
+            "constraints": {}, "products": [], "refined": False}
+    if not session_config["enabled"]:
+        return turn
+    session = chat_sessions.get(session_id) if session_id and _SESSION_ID.match(session_id) else None
+    if session is None:
+        if session_id and _SESSION_ID.match(session_id):
+            _count_session("expired")
+        else:
+            session_id = secrets.token_urlsafe(12)
+        _count_session("created")
+    else:
+        _count_session("resumed")
+    turn["session_id"] = session_id
+    turn["session"] = session
+
+    constraints, leftover = parse_refinement(
+        user_message, session["products"] if session else (), session.get("category") if session else None,
+    )
+    if session is None or not session["products"] or leftover or not constraints:
+        # A new product (or a first message) starts a fresh search; its constraints are kept
+        # for follow-ups but the marketplaces' own ranking is left alone. Its attribute words
+        # ("wireless headphones") are part of the search itself, not a filter on later turns
+        constraints.pop("keywords", None)
+        turn["constraints"] = merge_constraints({}, constraints, [])
+        return turn
+
+    turn["constraints"] = merge_constraints(session["constraints"], constraints, session["shown_prices"])
+    turn["products"] = refine_products(session["products"], turn["constraints"])
+    turn["refined"] = bool(turn["products"])
+    if turn["refined"]:
+        _count_session("refined")
+    else:
+        # Nothing already fetched fits: search again for the session's product with the current
+        # constraints spelled out; the base query itself stays as it is for later turns
+        _count_session("refine_misses")
+        turn["base_query"] = session["query"]
+        turn["query"] = constraint_query(session["query"], turn["constraints"])
+    return turn
+
+
+def finish_chat_turn(turn, products):
+    """Save the session after a turn; products are what the shopper was shown"""
+    if turn["session_id"] is None:
+        return None
+    session = turn["session"]
+    refined = turn["refined"]
+    if not refined:
+        _count_session("searches")
+    shown = products[:5]
+    chat_sessions.set(turn["session_id"], {
+        "query": session["query"] if refined else turn["base_query"],
+        "category": session.get("category") if refined else understand_query(turn["base_query"]).category,
+        "constraints": turn["constraints"],
+        "products": session["products"] if refined else [dict(p) for p in products[:session_config["max_products"]]],
+        "shown_prices": [price for price in map(product_price, shown) if price is not None],
+        "turns": (session["turns"] if session else 0) + 1,
+    }, session_config["ttl"])
+    return turn["session_id"]
+
+
+def session_snapshot():
+    with _session_lock:
+        stats = dict(session_stats)
+    return {"enabled": session_config["enabled"], **stats, **chat_sessions.snapshot()}
@@ -0,0 +1,17 @@
+"""Test setup: import the backend from the source tree with its on-disk state in a temp dir."""
+import os
+import sys
+import tempfile
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, BACKEND_DIR)
+
+# Set before the backend is imported, so no test touches backend/data
+_data_dir = tempfile.mkdtemp(prefix="assistant-tests-")
+os.environ.update({
+    "CATALOG_DB_PATH": os.path.join(_data_dir, "catalog.db"),
+    "HTTP_CACHE_PATH": os.path.join(_data_dir, "http_cache.db"),
+    "IMAGE_CACHE_DIR": os.path.join(_data_dir, "images"),
+    "SHARED_CACHE_PATH": "",
+    "REFRESH_ENABLED": "false",
+})
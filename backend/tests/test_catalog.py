@@ -0,0 +1,56 @@
+import threading
+import time
+
+import pytest
+
+import catalog
+from catalog import ingest_products, lookup_catalog_products, prune_catalog
+
+DAY = 24 * 3600
+
+
+@pytest.fixture(autouse=True)
+def fresh_catalog(tmp_path, monkeypatch):
+    monkeypatch.setitem(catalog.catalog_config, "path", str(tmp_path / "catalog.db"))
+    monkeypatch.setattr(catalog, "_catalog_local", threading.local())
+
+
+def product(name):
+    return {"name": name, "price": "₹999", "source": "Flipkart"}
+
+
+def count(table):
+    return catalog.catalog_connection().execute(f"SELECT COUNT(*) FROM {table}").fetchone()[0]
+
+
+def test_rows_past_the_retention_period_are_pruned(monkeypatch):
+    monkeypatch.setitem(catalog.catalog_config, "retention", 7 * DAY)
+    now = time.time()
+    ingest_products("Flipkart", "old kettle", [product("Old Kettle")], fetched_at=now - 8 * DAY)
+    ingest_products("Flipkart", "new kettle", [product("New Kettle")], fetched_at=now)
+
+    assert prune_catalog() == 1
+    assert count("products") == 1 and count("query_results") == 1
+    assert lookup_catalog_products("Flipkart", "old kettle", max_age=30 * DAY) is None
+    assert lookup_catalog_products("Flipkart", "new kettle")[0]["name"] == "New Kettle"
+
+
+def test_oldest_products_beyond_the_cap_are_pruned_with_their_queries(monkeypatch):
+    monkeypatch.setitem(catalog.catalog_config, "max_products", 2)
+    now = time.time()
+    for age, name in enumerate(("Kettle C", "Kettle B", "Kettle A")):
+        ingest_products("Flipkart", name.lower(), [product(name)], fetched_at=now - age)
+
+    assert prune_catalog() == 1
+    assert count("products") == 2 and count("query_results") == 2
+    assert lookup_catalog_products("Flipkart", "kettle a") is None
+    assert catalog.catalog_snapshot()["pruned"] >= 1
+
+
+def test_ingest_prunes_every_hundred_writes(monkeypatch):
+    monkeypatch.setitem(catalog.catalog_config, "retention", DAY)
+    monkeypatch.setitem(catalog.catalog_stats, "writes", 98)
+    ingest_products("Flipkart", "old kettle", [product("Old Kettle")], fetched_at=time.time() - 2 * DAY)
+    assert count("products") == 1
+    ingest_products("Flipkart", "new kettle", [product("New Kettle")])
+    assert count("products") == 1
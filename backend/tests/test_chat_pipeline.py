@@ -0,0 +1,40 @@
+import json
+
+from chat_pipeline import ChatTurn, fallback_result, marketplace_products
+
+
+def product(name, source, price="₹1,999"):
+    return {"name": name, "price": price, "source": source, "image": ""}
+
+
+def event_data(event):
+    name, data = event.strip().split("\n")
+    return name.removeprefix("event: "), json.loads(data.removeprefix("data: "))
+
+
+def test_marketplace_products_are_shown_flipkart_first_with_both_links():
+    results = {"Amazon": [product("Kettle B", "Amazon")], "Flipkart": [product("Kettle A", "Flipkart")]}
+    products = marketplace_products(results, "electric kettle")
+    assert [p["name"] for p in products] == ["Kettle A", "Kettle B"]
+    assert products[0]["amazon_link"] and products[1]["flipkart_link"]
+
+
+def test_source_events_stop_at_max_products_and_timeouts_are_reported():
+    turn = ChatTurn("electric kettle", {"query": "electric kettle", "products": []}, max_products=3)
+    first = turn.source_event("Flipkart", [product(f"Kettle {i}", "Flipkart") for i in range(2)])
+    second = turn.source_event("Amazon", [product(f"Kettle {i}", "Amazon") for i in range(2, 5)])
+    assert turn.source_event("Amazon", [product("Kettle 9", "Amazon")]) is None
+    assert turn.source_event("Flipkart", None) is None
+
+    assert event_data(first)[1]["source"] == "Flipkart" and len(event_data(first)[1]["products"]) == 2
+    assert len(event_data(second)[1]["products"]) == 1
+    assert len(turn.products) == 6
+    assert event_data(turn.done_event()) == ("done", {
+        "timed_out_sources": ["Flipkart"], "intent": "product_search", "session_id": None,
+    })
+
+
+def test_fallback_result_falls_back_to_offline_suggestions():
+    products = fallback_result("wireless headphones", [])
+    assert products and all(p["source"] == "Curated" for p in products)
+    assert fallback_result("wireless headphones", [product("Found", "DuckDuckGo")])[0]["name"] == "Found"
@@ -0,0 +1,39 @@
+import json
+
+import pytest
+
+import caching
+import deepseek
+from caching import ResultCache, SharedStore, shared_cache_config
+from deepseek import parse_deepseek_stream_line
+
+
+def chunk(content=None, finish_reason=None):
+    return "data: " + json.dumps({"choices": [{"delta": {"content": content}, "finish_reason": finish_reason}]})
+
+
+@pytest.mark.parametrize("line, expected", [
+    (chunk("Hello"), ("Hello", None)),
+    ("", ("", None)),
+    (": keep-alive", ("", None)),
+    ("data: [DONE]", ("", "complete")),
+    # The space after "data:" is optional in SSE
+    ("data:[DONE]", ("", "complete")),
+    (chunk(" there.", "stop"), (" there.", "complete")),
+    (chunk(finish_reason="length"), ("", "complete")),
+    ('data: {"error": {"message": "overloaded"}}', ("", "failed")),
+    ("data: not json", ("", None)),
+])
+def test_stream_line(line, expected):
+    assert parse_deepseek_stream_line(line) == expected
+
+
+def test_replies_persist_through_the_shared_store(tmp_path, monkeypatch):
+    monkeypatch.setattr(caching, "shared_store", SharedStore(str(tmp_path / "shared.db"), shared_cache_config))
+    monkeypatch.setattr(deepseek, "llm_cache", ResultCache(16, 10_000, namespace="llm"))
+    deepseek.cache_llm_reply("fingerprint", "Try the Sony WH-1000XM5.")
+
+    # A restarted worker starts with an empty memory cache
+    monkeypatch.setattr(deepseek, "llm_cache", ResultCache(16, 10_000, namespace="llm"))
+    assert deepseek.get_cached_llm_reply("fingerprint") == "Try the Sony WH-1000XM5."
+    assert deepseek.llm_cache_snapshot()["shared_hits"] == 1
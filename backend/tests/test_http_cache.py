@@ -0,0 +1,65 @@
+import pytest
+
+import http_cache
+from http_cache import cached_http_get, http_cache_stats
+from outbound import CircuitOpenError
+
+
+class FakeResponse:
+    def __init__(self, status, content=b"", headers=None):
+        self.status_code = status
+        self.content = content
+        self.headers = headers or {}
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Answers http_cache's requests from a list of responses (or exceptions); records the headers sent"""
+    answers = []
+    sent = []
+
+    def fake_request(method, url, service, headers=None, **kwargs):
+        sent.append(headers)
+        answer = answers.pop(0)
+        if isinstance(answer, Exception):
+            raise answer
+        return answer
+
+    monkeypatch.setattr(http_cache, "http_request", fake_request)
+    return answers, sent
+
+
+def counts():
+    return {name: http_cache_stats[name] for name in ("revalidations", "not_modified", "misses")}
+
+
+def test_revalidations_and_304s_are_counted_when_the_request_is_sent(upstream):
+    answers, sent = upstream
+    url = "https://www.flipkart.com/search?q=revalidated"
+    answers.append(FakeResponse(200, b"<html>v1</html>", {"ETag": '"v1"', "Cache-Control": "no-cache"}))
+    cached_http_get(url, "flipkart")
+    before = counts()
+
+    answers.append(CircuitOpenError("flipkart"))
+    with pytest.raises(CircuitOpenError):
+        cached_http_get(url, "flipkart")
+    assert counts() == before
+
+    answers.append(FakeResponse(304, headers={"ETag": '"v1"'}))
+    response = cached_http_get(url, "flipkart")
+    assert response.content == b"<html>v1</html>"
+    assert sent[-1]["If-None-Match"] == '"v1"'
+    assert counts() == {**before, "revalidations": before["revalidations"] + 1,
+                        "not_modified": before["not_modified"] + 1}
+
+
+def test_a_changed_page_is_a_revalidation_but_not_a_304(upstream):
+    answers, _ = upstream
+    url = "https://www.flipkart.com/search?q=changed"
+    answers.append(FakeResponse(200, b"v1", {"ETag": '"v1"', "Cache-Control": "no-cache"}))
+    cached_http_get(url, "flipkart")
+    before = counts()
+
+    answers.append(FakeResponse(200, b"v2", {"ETag": '"v2"', "Cache-Control": "no-cache"}))
+    assert cached_http_get(url, "flipkart").content == b"v2"
+    assert counts() == {**before, "revalidations": before["revalidations"] + 1}
@@ -0,0 +1,105 @@
+import io
+
+import pytest
+from PIL import Image
+
+import app
+import image_proxy
+from image_proxy import ImageProxyError, image_source_allowed, image_thumbnail, make_thumbnail
+
+
+class FakeResponse:
+    def __init__(self, status=200, body=b"", headers=None):
+        self.status_code = status
+        self.headers = headers or {}
+        self.is_redirect = status in (301, 302, 303, 307, 308)
+        self._body = body
+
+    def iter_content(self, chunk_size):
+        for start in range(0, len(self._body), chunk_size):
+            yield self._body[start:start + chunk_size]
+
+    def close(self):
+        pass
+
+
+@pytest.fixture
+def upstream(monkeypatch):
+    """Routes the proxy's image fetches to canned responses; records the URLs fetched"""
+    responses = {}
+    fetched = []
+
+    def fake_request(method, url, service, **kwargs):
+        fetched.append(url)
+        return responses[url]
+
+    monkeypatch.setattr(image_proxy, "http_request", fake_request)
+    return responses, fetched
+
+
+def png(width, height):
+    out = io.BytesIO()
+    Image.new("RGB", (width, height), (200, 30, 30)).save(out, "PNG")
+    return out.getvalue()
+
+
+def test_only_http_urls_on_allowed_hosts_are_proxied():
+    assert image_source_allowed("https://rukminim1.flixcart.com/image/1.jpg")
+    assert image_source_allowed("http://m.media-amazon.com/images/I/1.jpg")
+    assert not image_source_allowed("https://flixcart.com.example.net/1.jpg")
+    assert not image_source_allowed("ftp://rukminim1.flixcart.com/1.jpg")
+    assert not image_source_allowed("")
+
+
+def test_redirect_to_a_host_outside_the_allowlist_is_refused(upstream):
+    responses, fetched = upstream
+    src = "https://rukminim1.flixcart.com/redirected.jpg"
+    responses[src] = FakeResponse(302, headers={"Location": "https://example.net/tracker.jpg"})
+    with pytest.raises(ImageProxyError) as excinfo:
+        image_thumbnail(src)
+    assert excinfo.value.status == 403
+    assert fetched == [src]
+
+
+def test_oversized_source_is_rejected_and_not_refetched(upstream, monkeypatch):
+    responses, fetched = upstream
+    monkeypatch.setitem(image_proxy.image_proxy_config, "max_source_bytes", 1000)
+    src = "https://rukminim1.flixcart.com/huge.jpg"
+    responses[src] = FakeResponse(200, b"x" * 200_000, {"Content-Type": "image/jpeg"})
+    for _ in range(2):
+        with pytest.raises(ImageProxyError) as excinfo:
+            image_thumbnail(src)
+        assert excinfo.value.status == 502
+    # The failure is remembered for failure_ttl
+    assert fetched == [src]
+
+
+def test_thumbnail_fits_the_width_in_the_configured_format():
+    encoder, content_type = image_proxy.THUMBNAIL_FORMATS[image_proxy.image_proxy_config["format"]]
+    body, thumbnail_type = make_thumbnail(png(1200, 800), 400)
+    assert thumbnail_type == content_type
+    with Image.open(io.BytesIO(body)) as thumbnail:
+        assert thumbnail.format == encoder
+        assert thumbnail.size == (400, 267)
+
+
+def test_unreadable_image_raises_value_error():
+    with pytest.raises(ValueError):
+        make_thumbnail(b"not an image", 400)
+
+
+def test_repeat_request_is_served_from_cache_with_etag(upstream):
+    responses, fetched = upstream
+    src = "https://rukminim1.flixcart.com/cached.png"
+    responses[src] = FakeResponse(200, png(900, 900), {"Content-Type": "image/png"})
+    client = app.app.test_client()
+
+    first = client.get("/api/image", query_string={"src": src})
+    assert first.status_code == 200
+    etag = first.headers["ETag"]
+    second = client.get("/api/image", query_string={"src": src})
+    assert second.status_code == 200 and second.data == first.data
+    assert second.headers["ETag"] == etag
+    revalidated = client.get("/api/image", query_string={"src": src}, headers={"If-None-Match": etag})
+    assert revalidated.status_code == 304
+    assert fetched == [src]
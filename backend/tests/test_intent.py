@@ -0,0 +1,56 @@
+import pytest
+
+from intents import classify_intent, intent_reply, POLICY_ANSWERS
+
+
+@pytest.mark.parametrize("message", [
+    "how do I return my headphones",
+    "i want a refund for my phone",
+    "track my laptop order",
+    "cancel my watch order",
+    "is there warranty on sony headphones",
+    "where is my order",
+    "return policy for laptops",
+    "cash on delivery available?",
+])
+def test_order_and_policy_questions_skip_search(message):
+    assert classify_intent(message) == "policy"
+
+
+@pytest.mark.parametrize("message", [
+    "tell me a joke about laptops",
+    "what's the weather today",
+])
+def test_off_topic_requests(message):
+    assert classify_intent(message) == "off_topic"
+
+
+@pytest.mark.parametrize("message", [
+    "wireless earbuds under 3000",
+    "laptop with 2 year warranty",
+    "history books under 500",
+    "sports shoes",
+    "best phone for my dad under 20000",
+    "weather resistant smart watch",
+    "joke books for kids",
+    "headphones to replace my old ones",
+    "watch that can track my sleep",
+])
+def test_shopping_requests_are_searched(message):
+    assert classify_intent(message) == "product_search"
+
+
+@pytest.mark.parametrize("message", ["hi", "thanks a lot", "", "what can you do?"])
+def test_small_talk(message):
+    assert classify_intent(message) == "small_talk"
+
+
+@pytest.mark.parametrize("message, topic", [
+    ("how do I return my headphones", "returns"),
+    ("i want a refund for my phone", "refund"),
+    ("track my laptop order", "order_status"),
+    ("cancel my watch order", "cancellation"),
+    ("is there warranty on sony headphones", "warranty"),
+])
+def test_policy_reply_matches_topic(message, topic):
+    assert intent_reply("policy", message) == POLICY_ANSWERS[topic]
@@ -0,0 +1,51 @@
+import pytest
+
+from query_understanding import understand_query
+
+
+@pytest.mark.parametrize("message, expected", [
+    ("Sony headphones under 2000", {"category": "headphone", "brand": "sony", "min_price": None, "max_price": 2000}),
+    ("samsung phone above 15,000", {"category": "phone", "brand": "samsung", "min_price": 15000, "max_price": None}),
+    ("laptop between 40k and 60k", {"category": "laptop", "min_price": 40000, "max_price": 60000}),
+    ("2-5k earbuds", {"category": "headphone", "min_price": 2000, "max_price": 5000}),
+    # A bare budget means that much up to a quarter more
+    ("watch 20k", {"category": "watch", "min_price": 20000, "max_price": 25000}),
+    ("$200 phone", {"currency": "USD", "min_price": 200, "max_price": 250}),
+    ("headphones for 1500", {"min_price": 1500, "max_price": 1875}),
+    ("speaker for 2k", {"min_price": 2000, "max_price": 2500}),
+    # Small bare numbers after "for" or "around" are counts, not budgets
+    ("gift for 2 people", {"min_price": None, "max_price": None}),
+    ("party plates around 50 guests", {"min_price": None, "max_price": None}),
+    # "4k" before a resolution word is not a price
+    ("4k tv under 50000", {"category": "tv", "min_price": None, "max_price": 50000, "terms": ("4k", "tv")}),
+])
+def test_constraints(message, expected):
+    parsed = understand_query(message).as_dict()
+    assert {name: parsed[name] for name in expected} == expected
+
+
+def test_marketplace_is_dropped_from_the_search_text():
+    parsed = understand_query("flipkart apple iphone 15")
+    assert parsed.marketplace == "Flipkart"
+    assert parsed.brand == "apple"
+    assert parsed.search_text == "apple iphone 15"
+    assert understand_query("headphones on amazon").search_text == "headphones"
+
+
+def test_no_constraints():
+    parsed = understand_query("wireless earbuds")
+    assert parsed.brand is parsed.marketplace is None
+    assert not parsed.has_price
+    assert parsed.search_text == "wireless earbuds"
+
+
+def test_parses_are_shared_per_normalized_text():
+    assert understand_query("  Wireless   EARBUDS ") is understand_query("wireless earbuds")
+
+
+def test_price_range_converts_currency():
+    low, high = understand_query("$200 phone").price_range("INR")
+    rate = low / 200
+    assert rate > 1
+    assert high == pytest.approx(250 * rate)
+    assert understand_query("phone under 20000").price_range("USD")[1] == pytest.approx(20000 / rate)
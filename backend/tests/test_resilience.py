@@ -0,0 +1,137 @@
+import threading
+import time
+
+import pytest
+
+from outbound import HostScheduler, OutboundQueueTimeout, SourceHealth
+
+BREAKER = {
+    "failure_threshold": 3, "failure_ratio": 0.5, "failure_window": 60, "reset_timeout": 30,
+    "timeout_percentile": 0.95, "timeout_multiplier": 3, "min_timeout": 2, "min_samples": 5,
+    "latency_window": 50,
+}
+OUTBOUND = {
+    "max_wait": {"interactive": 2, "refresh": 2, "batch": 2},
+    "backoff_base": 2, "backoff_max": 60,
+}
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_circuit_opens_after_threshold_failures(clock):
+    health = SourceHealth("test", 10, BREAKER)
+    for _ in range(2):
+        health.record_failure("HTTP 503")
+    assert health.state == "closed" and health.allow()
+    health.record_failure("HTTP 503")
+    assert health.state == "open"
+    assert not health.allow()
+    assert health.snapshot()["rejected"] == 1
+
+
+def test_failures_below_the_ratio_keep_the_circuit_closed(clock):
+    health = SourceHealth("test", 10, BREAKER)
+    for _ in range(4):
+        health.record_success()
+    for _ in range(3):
+        health.record_failure("timeout")
+    assert health.state == "closed"
+
+
+def test_half_open_lets_one_probe_through(clock):
+    health = SourceHealth("test", 10, BREAKER)
+    for _ in range(3):
+        health.record_failure("HTTP 503")
+    clock[0] += 30
+    assert health.allow()
+    assert health.state == "half_open"
+    assert not health.allow()
+    # A probe that was never sent frees the slot for the next caller
+    health.release()
+    assert health.allow()
+
+
+def test_probe_outcome_closes_or_reopens(clock):
+    health = SourceHealth("test", 10, BREAKER)
+    for _ in range(3):
+        health.record_failure("HTTP 503")
+    clock[0] += 30
+    health.allow()
+    health.record_failure("HTTP 503")
+    assert health.state == "open"
+    clock[0] += 30
+    health.allow()
+    health.record_success()
+    assert health.state == "closed"
+    # The failures that opened the circuit don't count against it any more
+    health.record_failure("HTTP 503")
+    assert health.state == "closed"
+
+
+def test_retry_after_opens_at_once_for_at_least_that_long(clock):
+    health = SourceHealth("test", 10, BREAKER)
+    health.record_failure("HTTP 429", retry_after=120)
+    assert health.state == "open"
+    clock[0] += 60
+    assert not health.allow()
+    clock[0] += 60
+    assert health.allow()
+
+
+def test_read_timeout_follows_observed_latency(clock):
+    health = SourceHealth("test", 10, BREAKER)
+    for _ in range(4):
+        health.record_latency(1.0)
+    assert health.timeout() == 10
+    health.record_latency(1.0)
+    assert health.timeout() == 3.0
+
+
+def test_scheduler_rejects_a_zero_rate():
+    with pytest.raises(ValueError):
+        HostScheduler("test", 0, 1, OUTBOUND)
+
+
+def test_interactive_lane_goes_before_queued_batch():
+    scheduler = HostScheduler("test", 10, 1, OUTBOUND)
+    scheduler.acquire("interactive")
+    order = []
+
+    def take(lane):
+        scheduler.acquire(lane)
+        order.append(lane)
+
+    batch = threading.Thread(target=take, args=("batch",))
+    batch.start()
+    while not scheduler.snapshot()["queued"]:
+        time.sleep(0.001)
+    interactive = threading.Thread(target=take, args=("interactive",))
+    interactive.start()
+    batch.join(2)
+    interactive.join(2)
+    assert order == ["interactive", "batch"]
+    assert scheduler.snapshot()["granted"] == 3
+
+
+def test_queue_wait_is_capped_per_lane():
+    scheduler = HostScheduler("test", 0.1, 1, {**OUTBOUND, "max_wait": {**OUTBOUND["max_wait"], "refresh": 0.05}})
+    scheduler.acquire("refresh")
+    with pytest.raises(OutboundQueueTimeout):
+        scheduler.acquire("refresh")
+    snapshot = scheduler.snapshot()
+    assert snapshot["queue_timeouts"] == 1
+    assert snapshot["queued"] == {}
+
+
+def test_throttle_pauses_the_host():
+    scheduler = HostScheduler("test", 100, 5, OUTBOUND)
+    scheduler.record_response(429, retry_after=5)
+    snapshot = scheduler.snapshot()
+    assert snapshot["throttled"] == 1
+    assert snapshot["paused_for"] >= 4.9
+    assert snapshot["tokens"] == 0
@@ -0,0 +1,63 @@
+import time
+
+import pytest
+
+from caching import ResultCache
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(time, "monotonic", lambda: now[0])
+    return now
+
+
+def test_entries_expire_after_their_ttl(clock):
+    cache = ResultCache(10, 10_000)
+    cache.set("k", [1], ttl=5)
+    clock[0] += 4.9
+    assert cache.get("k") == [1]
+    clock[0] += 0.2
+    assert cache.get("k") is None
+    assert cache.snapshot()["expirations"] == 1
+    assert cache.snapshot()["entries"] == 0
+
+
+def test_grace_period_serves_stale_values(clock):
+    cache = ResultCache(10, 10_000)
+    cache.set("k", [1], ttl=5, grace=10)
+    clock[0] += 6
+    assert cache.lookup("k") == ([1], True)
+    assert cache.get("k") is None
+    clock[0] += 10
+    assert cache.lookup("k") == (None, False)
+
+
+def test_least_recently_used_entry_is_evicted_first(clock):
+    cache = ResultCache(2, 10_000)
+    cache.set("a", 1, ttl=60)
+    cache.set("b", 2, ttl=60)
+    cache.get("a")
+    cache.set("c", 3, ttl=60)
+    assert cache.get("b") is None
+    assert cache.get("a") == 1 and cache.get("c") == 3
+    assert cache.snapshot()["evictions"] == 1
+
+
+def test_byte_cap_evicts_and_oversized_values_are_skipped(clock):
+    # Sizes are JSON lengths: 12 bytes per ten-character string
+    cache = ResultCache(100, 20)
+    cache.set("a", "x" * 10, ttl=60)
+    cache.set("b", "y" * 10, ttl=60)
+    assert cache.get("a") is None and cache.get("b") == "y" * 10
+    cache.set("huge", "z" * 50, ttl=60)
+    assert cache.get("huge") is None
+    assert cache.snapshot()["bytes"] == 12
+
+
+def test_hit_rate(clock):
+    cache = ResultCache(10, 10_000)
+    cache.set("k", 1, ttl=60)
+    cache.get("k")
+    cache.get("missing")
+    assert cache.snapshot()["hit_rate"] == 0.5
@@ -0,0 +1,76 @@
+import time
+
+import app
+from chat_pipeline import sse_event
+
+
+class Unavailable:
+    status_code = 503
+
+
+def test_batch_lane_reaches_the_duckduckgo_fallback(monkeypatch):
+    lanes = []
+    monkeypatch.setattr(app, "fan_out_marketplace_search", lambda *args: ({}, []))
+    monkeypatch.setattr(app, "search_local_catalog", lambda query: [])
+    monkeypatch.setattr(app, "cached_http_get", lambda url, service, lane: lanes.append(lane) or Unavailable())
+
+    products, _ = app.search_products_with_status("brass door knocker", lane="batch")
+
+    assert lanes == ["batch"]
+    assert products
+
+
+def test_batch_item_skips_duckduckgo_once_its_deadline_is_spent(monkeypatch):
+    calls = []
+
+    def slow_fan_out(*args):
+        time.sleep(0.05)
+        return {}, ["Flipkart", "Amazon"]
+
+    monkeypatch.setattr(app, "fan_out_marketplace_search", slow_fan_out)
+    monkeypatch.setattr(app, "search_local_catalog", lambda query: [])
+    monkeypatch.setattr(app, "cached_http_get", lambda *args, **kwargs: calls.append(kwargs) or Unavailable())
+
+    item = app.search_batch_item(0, "brass door knocker", 4, timeout=0.01)
+
+    assert not calls
+    assert item["products"] and item["error"] is None
+    assert item["timed_out_sources"] == ["Flipkart", "Amazon"]
+
+
+def test_duckduckgo_read_timeout_is_capped_by_the_time_left(monkeypatch):
+    calls = []
+    monkeypatch.setattr(app, "fan_out_marketplace_search", lambda *args: ({}, []))
+    monkeypatch.setattr(app, "search_local_catalog", lambda query: [])
+    monkeypatch.setattr(app, "cached_http_get", lambda *args, **kwargs: calls.append(kwargs) or Unavailable())
+
+    app.search_products_with_status("cast iron skillet", deadline=1.5, lane="batch")
+
+    (kwargs,) = calls
+    assert kwargs["lane"] == "batch"
+    assert kwargs["timeout"][1] <= 1.5
+
+
+def test_chat_stream_is_timed_to_its_first_event_and_its_end(monkeypatch):
+    def events(user_message, session_id=None):
+        yield sse_event("products", {"products": []})
+        yield sse_event("done", {})
+
+    monkeypatch.setattr(app, "stream_chat_events", events)
+    before = app.render_metrics()
+
+    response = app.app.test_client().post("/api/chat/stream", json={"message": "hi"})
+    assert response.status_code == 200 and response.data
+
+    after = app.render_metrics()
+    for phase in ("first_event", "total"):
+        line = f'assistant_stream_duration_seconds_count{{endpoint="chat_stream",phase="{phase}"}}'
+        assert _count(after, line) == _count(before, line) + 1
+    assert 'assistant_request_duration_seconds_count{endpoint="chat_stream"}' not in after
+
+
+def _count(metrics_text, prefix):
+    for line in metrics_text.splitlines():
+        if line.startswith(prefix + " "):
+            return float(line.split()[-1])
+    return 0
@@ -0,0 +1,118 @@
+import pytest
+
+import sessions
+from query_understanding import product_price
+from sessions import begin_chat_turn, chat_sessions, finish_chat_turn, merge_constraints, parse_refinement
+
+
+def product(name, price, source="Flipkart", rating="4.2"):
+    return {"name": name, "price": f"₹{price:,}", "rating": rating, "description": "", "source": source}
+
+
+# What "wireless headphones" fetched; the first five are what the shopper was shown
+POOL = [
+    product("Sony WH-CH720N Wireless Headphones (Black)", 7990),
+    product("boAt Rockerz 450 Wireless Headphones (Red)", 1499),
+    product("JBL Tune 760NC Wireless Headphones (Blue)", 5999, "Amazon"),
+    product("Sony WH-CH520 Wireless Headphones (Blue)", 3990),
+    product("Noise Two Wireless Headphones (Black)", 1299, "Amazon"),
+    product("Sony WH-1000XM5 Wireless Headphones (Silver)", 29990),
+    product("Sony ZX310 Wired Headphones (Red)", 899),
+    product("boAt Rockerz 550 Wireless Headphones (Black)", 1799),
+    product("Zebronics Thunder Wireless Headphones (Red)", 699, "Amazon"),
+]
+
+
+@pytest.fixture(autouse=True)
+def sessions_enabled(monkeypatch):
+    monkeypatch.setitem(sessions.session_config, "enabled", True)
+
+
+def start_session(query="wireless headphones", products=POOL):
+    turn = begin_chat_turn(None, query)
+    assert not turn["refined"]
+    return finish_chat_turn(turn, products)
+
+
+def follow_up(session_id, message):
+    turn = begin_chat_turn(session_id, message)
+    finish_chat_turn(turn, turn["products"] or POOL)
+    return turn
+
+
+def prices(products):
+    return [product_price(p) for p in products]
+
+
+def test_cheaper_then_brand_then_budget_refines_without_searching():
+    session_id = start_session()
+
+    cheaper = follow_up(session_id, "show me cheaper ones")
+    assert cheaper["refined"]
+    # Median of the five shown prices is 3990
+    assert max(prices(cheaper["products"])) < 3990
+    assert prices(cheaper["products"]) == sorted(prices(cheaper["products"]))
+
+    # The brand replaces the relative bound instead of narrowing it further
+    sony = follow_up(session_id, "only Sony")
+    assert sony["refined"]
+    assert {p["name"].split()[0] for p in sony["products"]} == {"Sony"}
+    assert 29990 in prices(sony["products"])
+
+    budget = follow_up(session_id, "under 3000")
+    assert budget["refined"]
+    assert [p["name"] for p in budget["products"]] == ["Sony ZX310 Wired Headphones (Red)"]
+    assert chat_sessions.get(session_id)["query"] == "wireless headphones"
+
+
+def test_colour_follow_up_filters_by_name():
+    session_id = start_session()
+    red = follow_up(session_id, "red ones")
+    assert red["refined"]
+    assert red["products"] and all("(Red)" in p["name"] for p in red["products"])
+
+
+def test_refine_miss_searches_base_query_with_current_constraints():
+    session_id = start_session()
+    follow_up(session_id, "show me cheaper ones")
+    follow_up(session_id, "only Sony")
+
+    miss = begin_chat_turn(session_id, "under 500")
+    assert not miss["refined"] and not miss["products"]
+    assert miss["query"] == "sony wireless headphones under 500"
+    finish_chat_turn(miss, [product("Sony MDR-EX15 Headphones", 499)])
+
+    # The base query is not extended with follow-up words, so nothing stale piles up
+    assert chat_sessions.get(session_id)["query"] == "wireless headphones"
+    again = begin_chat_turn(session_id, "purple ones")
+    assert again["query"] == "sony purple wireless headphones under 500"
+
+
+def test_colour_miss_adds_the_attribute_to_the_search():
+    session_id = start_session()
+    miss = begin_chat_turn(session_id, "pink ones")
+    assert not miss["refined"]
+    assert miss["query"] == "pink wireless headphones"
+
+
+def test_new_product_starts_a_fresh_search():
+    session_id = start_session()
+    turn = begin_chat_turn(session_id, "gaming laptop")
+    assert not turn["refined"] and turn["query"] == "gaming laptop"
+
+
+def test_parse_refinement_splits_constraints_and_leftover():
+    constraints, leftover = parse_refinement("only sony under 3k from amazon, best rated", POOL, "headphone")
+    assert constraints == {"brand": "sony", "max_price": 3000.0, "source": "Amazon", "sort": "rating"}
+    assert leftover == []
+    assert parse_refinement("red ones", POOL)[0] == {"keywords": ["red"]}
+    assert parse_refinement("4 stars and above")[0] == {"min_rating": 4.0}
+    assert parse_refinement("gaming laptop", POOL, "headphone")[1] == ["laptop"]
+
+
+def test_explicit_bound_replaces_relative_one():
+    cheaper = merge_constraints({}, {"relative": "cheaper"}, [1000, 2000, 3000])
+    assert cheaper == {"max_price": 1999, "sort": "price", "relative_bound": "max_price"}
+    assert merge_constraints(cheaper, {"min_price": 2500}, []) == {"min_price": 2500, "sort": "price"}
+    # Explicit bounds still accumulate with each other
+    assert merge_constraints({"max_price": 3000}, {"brand": "sony"}, []) == {"max_price": 3000, "brand": "sony"}
@@ -0,0 +1,52 @@
+import time
+
+import pytest
+
+import app
+from caching import SharedStore, shared_cache_config
+
+
+@pytest.fixture
+def stores(tmp_path, monkeypatch):
+    """This worker's store plus a second handle on the same file posing as another worker"""
+    path = str(tmp_path / "shared.db")
+    ours = SharedStore(path, shared_cache_config)
+    theirs = SharedStore(path, shared_cache_config)
+    theirs.owner = "other-worker"
+    monkeypatch.setattr(app, "shared_store", ours)
+    return ours, theirs
+
+
+def test_lease_held_reads_another_workers_claim(stores):
+    ours, theirs = stores
+    assert not ours.lease_held("scrape:x")
+    assert theirs.acquire_lease("scrape:x", 5)
+    assert ours.lease_held("scrape:x")
+    theirs.release_lease("scrape:x")
+    assert not ours.lease_held("scrape:x")
+
+
+def test_waiting_on_another_workers_scrape_stops_at_the_callers_deadline(stores):
+    ours, theirs = stores
+    theirs.acquire_lease(app.shared_scrape_lease("Flipkart", "usb cable"), 30)
+    calls = []
+
+    started = time.monotonic()
+    products = app._scrape_and_cache(
+        "Flipkart", lambda *args: calls.append(args) or [], "usb cable", 4, wait=0.2
+    )
+
+    assert products == []
+    assert not calls
+    assert time.monotonic() - started < 1
+    # One failed claim, then read-only polls until giving up
+    assert ours.snapshot()["lease_waits"] == 1
+
+
+def test_free_claim_is_taken_and_released(stores):
+    ours, _ = stores
+    products = app._scrape_and_cache(
+        "Flipkart", lambda query, limit, lane: [{"name": "Cable", "price": "₹199"}], "usb cable c", 4
+    )
+    assert products[0]["name"] == "Cable"
+    assert not ours.lease_held(app.shared_scrape_lease("Flipkart", "usb cable c"))
@@ -0,0 +1,30 @@
+from concurrent.futures import Future
+
+from caching import SingleFlight
+
+
+def test_coalesced_callers_share_one_call():
+    flight = SingleFlight("test_share")
+    first, started = flight.join("k", Future)
+    second, joined = flight.join("k", Future)
+    assert started and not joined
+    assert first is second
+    assert flight.snapshot() == {"started": 1, "coalesced": 1, "in_flight": 1}
+
+
+def test_leave_allows_cancel_only_for_the_last_waiter():
+    flight = SingleFlight("test_leave")
+    future, _ = flight.join("k", Future)
+    flight.join("k", Future)
+    # Another caller still waits on the shared call
+    assert not flight.leave("k", future)
+    assert flight.leave("k", future)
+
+
+def test_finished_calls_are_forgotten():
+    flight = SingleFlight("test_forget")
+    future, _ = flight.join("k", Future)
+    future.set_result(1)
+    assert not flight.leave("k", future)
+    again, started = flight.join("k", Future)
+    assert started and again is not future
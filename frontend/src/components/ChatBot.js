@@ -2,6 +2,13 @@ import React, { useState, useRef, useEffect } from 'react';
 import './ChatBot.css';
 import axios from 'axios';
 
+// Use environment variable for API URL, fallback to localhost for development
+const API_URL = process.env.REACT_APP_API_URL || 'http://127.0.0.1:5000';
+
+// Product images come back as /api/image thumbnail paths, relative to the API
+const resolveImage = (src) => (src && src.startsWith('/') ? `${API_URL}${src}` : src);
+const proxiedImage = (src) => `${API_URL}/api/image?src=${encodeURIComponent(src)}`;
+
 const ChatBot = () => {
     const [messages, setMessages] = useState([
         {
@@ -14,6 +21,8 @@ const ChatBot = () => {
     const [isLoading, setIsLoading] = useState(false);
     const [error, setError] = useState('');
     const messagesEndRef = useRef(null);
+    // Server-side conversation session, so follow-ups like "cheaper ones" refine earlier results
+    const sessionIdRef = useRef(null);
 
     const scrollToBottom = () => {
         messagesEndRef.current?.scrollIntoView({ behavior: "smooth" });
@@ -31,12 +40,86 @@ const ChatBot = () => {
         }
     };
 
+    const parseSseEvent = (raw) => {
+        let event = 'message';
+        const dataLines = [];
+        raw.split('\n').forEach(line => {
+            if (line.startsWith('event:')) {
+                event = line.slice(6).trim();
+            } else if (line.startsWith('data:')) {
+                dataLines.push(line.slice(5).trim());
+            }
+        });
+        return { event, data: dataLines.length ? JSON.parse(dataLines.join('\n')) : {} };
+    };
+
+    const updateMessage = (id, update) => {
+        setMessages(prev => prev.map(message => (
+            message.id === id ? { ...message, ...update(message) } : message
+        )));
+    };
+
+    // Products arrive per marketplace as soon as each one answers, then the reply streams in
+    const streamChat = async (API_URL, messageText) => {
+        const response = await fetch(`${API_URL}/api/chat/stream`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/json'
+            },
+            body: JSON.stringify({ message: messageText, session_id: sessionIdRef.current })
+        });
+        if (!response.ok || !response.body) {
+            throw new Error(`Request failed with status code ${response.status}`);
+        }
+
+        const botId = `bot-${Date.now()}`;
+        setMessages(prev => [...prev, {
+            id: botId,
+            text: '',
+            sender: 'bot',
+            timestamp: new Date(),
+            products: [],
+            streamed: true
+        }]);
+
+        const reader = response.body.getReader();
+        const decoder = new TextDecoder();
+        let buffer = '';
+        while (true) {
+            const { done, value } = await reader.read();
+            if (done) break;
+            buffer += decoder.decode(value, { stream: true });
+
+            let boundary;
+            while ((boundary = buffer.indexOf('\n\n')) !== -1) {
+                const { event, data } = parseSseEvent(buffer.slice(0, boundary));
+                buffer = buffer.slice(boundary + 2);
+                setIsLoading(false);
+
+                if (event === 'products') {
+                    updateMessage(botId, message => ({ products: [...message.products, ...data.products] }));
+                } else if (event === 'token') {
+                    updateMessage(botId, message => ({ text: message.text + data.text }));
+                } else if (event === 'done') {
+                    if (data.session_id) {
+                        sessionIdRef.current = data.session_id;
+                    }
+                    updateMessage(botId, message => ({ text: formatResponse(message.text) }));
+                } else if (event === 'error') {
+                    updateMessage(botId, () => ({ text: data.response }));
+                    setError(data.response);
+                }
+            }
+        }
+    };
+
     const sendMessage = async (e) => {
         e.preventDefault();
         if (!inputMessage.trim()) return;
 
+        const messageText = inputMessage;
         const userMessage = {
-            text: inputMessage,
+            text: messageText,
             sender: 'user',
             timestamp: new Date()
         };
@@ -44,17 +127,25 @@ const ChatBot = () => {
         setMessages(prev => [...prev, userMessage]);
         setInputMessage('');
         setIsLoading(true);
+        setError('');
 
         try {
-            // Use environment variable for API URL, fallback to localhost for development
-            const API_URL = process.env.REACT_APP_API_URL || 'http://127.0.0.1:5000';
+            if (window.ReadableStream && window.TextDecoder) {
+                await streamChat(API_URL, messageText);
+                return;
+            }
+
             const result = await axios.post(`${API_URL}/api/chat`, {
-                message: inputMessage
+                message: messageText,
+                session_id: sessionIdRef.current
             }, {
                 headers: {
                     'Content-Type': 'application/json'
                 }
             });
+            if (result.data.session_id) {
+                sessionIdRef.current = result.data.session_id;
+            }
             const botMessage = {
                 text: formatResponse(result.data.response),
                 sender: 'bot',
@@ -62,7 +153,6 @@ const ChatBot = () => {
                 products: result.data.products || []
             };
             setMessages(prev => [...prev, botMessage]);
-            setError('');
         } catch (err) {
             console.error('Error:', err);
             let errorText = "Sorry, I couldn't process your request. Please try again.";
@@ -120,12 +210,17 @@ const ChatBot = () => {
     };
 
     const ProductCard = ({ product }) => {
-        const fallbackImage = 'https://via.placeholder.com/400x400/667eea/ffffff?text=' + encodeURIComponent(product.name.substring(0, 20));
+        // Drawn locally, so the last resort never waits on a third-party placeholder service
+        const fallbackImage = 'data:image/svg+xml;charset=utf-8,' + encodeURIComponent(
+            '<svg xmlns="http://www.w3.org/2000/svg" width="400" height="400"><rect width="100%" height="100%" fill="#667eea"/>' +
+            '<text x="50%" y="50%" fill="#fff" font-family="sans-serif" font-size="24" text-anchor="middle">' +
+            product.name.substring(0, 20).replace(/[<>&"]/g, '') + '</text></svg>'
+        );
         
         // Try multiple image sources
         const imageSources = [
-            product.image,
-            `https://source.unsplash.com/400x400/?${encodeURIComponent(product.name.split(' ')[0] || 'product')}`,
+            resolveImage(product.image),
+            proxiedImage(`https://source.unsplash.com/400x400/?${encodeURIComponent(product.name.split(' ')[0] || 'product')}`),
             fallbackImage
         ].filter(Boolean);
         
@@ -222,13 +317,13 @@ const ChatBot = () => {
             </div>
             <div className="chat-messages">
                 {messages.map((message, index) => (
-                    <div key={index} className={`message ${message.sender}`}>
+                    <div key={message.id || index} className={`message ${message.sender}`}>
                         <div className="message-content">
                             {message.sender === 'bot' ? (
                                 <>
                                     <TypeWriter 
                                         text={message.text} 
-                                        shouldAnimate={index === messages.length - 1 && message.sender === 'bot' && !inputMessage.length} 
+                                        shouldAnimate={!message.streamed && index === messages.length - 1 && message.sender === 'bot' && !inputMessage.length} 
                                     />
                                     {message.products && message.products.length > 0 && (
                                         <div className="products-container">